@@ -0,0 +1,130 @@
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from asgiref.sync import async_to_sync, sync_to_async
+from src.database_sqlite import DB_POOL_SIZE
+from src.main import app
+
+# ASGI entry point, e.g. `uvicorn src.asgi:asgi_app --host 0.0.0.0 --port 5000`.
+# The server receives request bodies (payment-proof uploads) on its event
+# loop before a worker thread is taken, and existing blueprints run
+# unchanged. Each request then runs on a pool of ASGI_WORKER_THREADS
+# threads, sized to the connection pool by default: asgiref's WsgiToAsgi
+# runs every request on one shared thread, one at a time, and has no
+# setting for that.
+ASGI_WORKER_THREADS = int(os.environ.get('ASGI_WORKER_THREADS', DB_POOL_SIZE))
+
+# Request bodies up to this size are buffered in memory, larger ones on disk
+ASGI_BODY_MEMORY_LIMIT = 64 * 1024
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+def get_request_executor():
+    """Get this process's executor for WSGI requests"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        # Executor threads do not survive a fork
+        if _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=ASGI_WORKER_THREADS,
+                                           thread_name_prefix='asgi-request')
+            _executor_pid = os.getpid()
+        return _executor
+
+class ThreadPoolWsgiToAsgi:
+    """Wraps a WSGI application so concurrent requests run on separate threads"""
+
+    def __init__(self, wsgi_application):
+        self.wsgi_application = wsgi_application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            raise ValueError(f"WSGI application cannot handle {scope['type']!r} connections")
+        
+        body = SpooledTemporaryFile(max_size=ASGI_BODY_MEMORY_LIMIT)
+        try:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            
+            run = sync_to_async(self.run_wsgi_app, thread_sensitive=False,
+                                executor=get_request_executor())
+            await run(self.build_environ(scope, body), async_to_sync(send))
+        finally:
+            body.close()
+
+    @staticmethod
+    def build_environ(scope, body):
+        """Build the PEP 3333 environ for an HTTP scope"""
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+            'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+            'QUERY_STRING': scope['query_string'].decode('ascii'),
+            'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1] or 80),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+            environ['REMOTE_PORT'] = str(scope['client'][1])
+        
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin1').upper().replace('-', '_')
+            if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                name = f'HTTP_{name}'
+            value = value.decode('latin1')
+            # Repeated headers are joined, as a WSGI server would
+            environ[name] = f'{environ[name]},{value}' if name in environ else value
+        return environ
+
+    def run_wsgi_app(self, environ, send):
+        """Run the WSGI application on this thread, sending its response through send"""
+        response_start = None
+        started = False
+
+        def start_response(status, headers, exc_info=None):
+            nonlocal response_start
+            if exc_info and started:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response_start = {
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin1'), value.encode('latin1'))
+                            for name, value in headers],
+            }
+
+        output = self.wsgi_application(environ, start_response)
+        try:
+            for chunk in output:
+                if not started:
+                    send(response_start)
+                    started = True
+                if chunk:
+                    send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not started:
+                send(response_start)
+            send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            if hasattr(output, 'close'):
+                output.close()
+
+asgi_app = ThreadPoolWsgiToAsgi(app)
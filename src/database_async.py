@@ -0,0 +1,39 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from src.database_sqlite import DB_POOL_SIZE
+
+# Async handlers must not block the event loop on sqlite3/psycopg2 calls.
+# They await run_db() instead, which runs the blocking model call on a
+# dedicated executor sized to the connection pool, so the loop stays free
+# for other requests (e.g. slow uploads) while queries run.
+DB_ASYNC_WORKERS = int(os.environ.get('DB_ASYNC_WORKERS', DB_POOL_SIZE))
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+def get_db_executor():
+    """Get this process's executor for blocking database calls"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        # Executor threads do not survive a fork
+        if _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=DB_ASYNC_WORKERS,
+                                           thread_name_prefix='db-async')
+            _executor_pid = os.getpid()
+        return _executor
+
+async def run_db(func, *args, **kwargs):
+    """Run a blocking data-access call on the database executor
+
+    The caller's context is copied, so request state (the request's shared
+    connection, current shop) is visible to the call. Calls made for one
+    request must be awaited one after another, as they share a connection.
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_db_executor(), call)
@@ -0,0 +1,192 @@
+import re
+import sqlite3
+from contextlib import contextmanager
+from src.database_sqlite import ConnectionPool, DB_POOL_SIZE, DB_POOL_TIMEOUT
+
+try:
+    import psycopg2
+    import psycopg2.extensions
+except ImportError:  # Optional dependency, only needed when DATABASE_URL is set
+    psycopg2 = None
+
+# Models are written against sqlite3: '?' placeholders, cursor.lastrowid,
+# sqlite3.Error subclasses and dates returned as ISO strings. The classes
+# below give a psycopg2 connection that same surface so the models run on
+# PostgreSQL unchanged.
+
+# DATE, TIMESTAMP and TIMESTAMPTZ are returned as text, like SQLite does
+_PG_DATE_TYPES = (1082, 1114, 1184)
+
+# Type names used in the SQLite DDL and their PostgreSQL equivalents
+_DDL_REPLACEMENTS = [
+    (re.compile(r'\bINTEGER PRIMARY KEY AUTOINCREMENT\b', re.I), 'SERIAL PRIMARY KEY'),
+    (re.compile(r'\bDATETIME\b', re.I), 'TIMESTAMP'),
+    (re.compile(r'\bREAL\b', re.I), 'DOUBLE PRECISION'),
+    # Migration 1 creates expenses before suppliers. SQLite accepts the
+    # forward reference, PostgreSQL does not, so the constraint is left out
+    # here and added by migration 11.
+    (re.compile(r',\s*FOREIGN KEY \(supplier_id\) REFERENCES suppliers \(id\)', re.I), ''),
+]
+
+# SQLite's LIKE is case-insensitive for ASCII; PostgreSQL's is not
+_LIKE = re.compile(r'\bLIKE\b', re.I)
+
+def translate_sql(sql, has_params):
+    """Translate sqlite3-style SQL to psycopg2"""
+    if sql.lstrip()[:6].upper() in ('CREATE', 'ALTER '):
+        for pattern, replacement in _DDL_REPLACEMENTS:
+            sql = pattern.sub(replacement, sql)
+    else:
+        sql = _LIKE.sub('ILIKE', sql)
+    if has_params:
+        # psycopg2 uses %s placeholders, so literal percent signs need escaping
+        sql = sql.replace('%', '%%').replace('?', '%s')
+    return sql
+
+@contextmanager
+def _translate_errors():
+    """Re-raise psycopg2 errors as the sqlite3 exceptions the models catch"""
+    try:
+        yield
+    except psycopg2.IntegrityError as e:
+        raise sqlite3.IntegrityError(str(e)) from e
+    except (psycopg2.OperationalError, psycopg2.ProgrammingError) as e:
+        raise sqlite3.OperationalError(str(e)) from e
+    except psycopg2.Error as e:
+        raise sqlite3.DatabaseError(str(e)) from e
+
+class PostgresCursor:
+    """psycopg2 cursor with the sqlite3 cursor interface used by the models"""
+
+    def __init__(self, connection, cursor):
+        self.connection = connection
+        self._cursor = cursor
+        self.row_factory = None
+
+    def execute(self, sql, params=()):
+        params = tuple(params)
+        with _translate_errors():
+            self._cursor.execute(translate_sql(sql, bool(params)), params or None)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        with _translate_errors():
+            self._cursor.executemany(translate_sql(sql, True), [tuple(p) for p in seq_of_params])
+        return self
+
+    def fetchone(self):
+        with _translate_errors():
+            row = self._cursor.fetchone()
+        if row is not None and self.row_factory is not None:
+            row = self.row_factory(self, row)
+        return row
+
+    def fetchall(self):
+        with _translate_errors():
+            rows = self._cursor.fetchall()
+        if self.row_factory is not None:
+            rows = [self.row_factory(self, row) for row in rows]
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def lastrowid(self):
+        # All tables use SERIAL ids, so the session's last sequence value is
+        # the id of the row this cursor just inserted
+        with _translate_errors():
+            cursor = self.connection.raw.cursor()
+            cursor.execute('SELECT LASTVAL()')
+            return cursor.fetchone()[0]
+
+    def close(self):
+        self._cursor.close()
+
+class PostgresConnection:
+    """psycopg2 connection with the sqlite3 connection interface"""
+    _pool_slots = None
+    isolation_level = ''
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def cursor(self):
+        return PostgresCursor(self, self.raw.cursor())
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def commit(self):
+        with _translate_errors():
+            self.raw.commit()
+
+    def rollback(self):
+        with _translate_errors():
+            self.raw.rollback()
+
+    def close(self):
+        self.raw.close()
+
+    @property
+    def in_transaction(self):
+        status = self.raw.info.transaction_status
+        return status != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+class PostgresPool(ConnectionPool):
+    """Bounded, thread-safe pool of PostgreSQL connections"""
+
+    def __init__(self, dsn, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT):
+        if psycopg2 is None:
+            raise ImportError("psycopg2 is required when DATABASE_URL points to PostgreSQL")
+        self.dsn = dsn
+        super().__init__(dsn, size=size, timeout=timeout)
+
+    def _connect(self):
+        with _translate_errors():
+            raw = psycopg2.connect(self.dsn)
+        text_dates = psycopg2.extensions.new_type(
+            _PG_DATE_TYPES, 'SQLITE_TEXT_DATES', lambda value, cursor: value
+        )
+        psycopg2.extensions.register_type(text_dates, raw)
+        return PostgresConnection(raw)
+
+    def _is_healthy(self, conn):
+        if conn.raw.closed or not super()._is_healthy(conn):
+            return False
+        try:
+            # The probe opened a transaction; end it so session settings can change
+            conn.rollback()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def begin_request(self, conn, read_only):
+        if read_only:
+            # One snapshot for every query of the request
+            conn.raw.set_session(isolation_level='REPEATABLE READ', readonly=True)
+
+    def end_request(self, conn, read_only):
+        if read_only:
+            conn.raw.set_session(isolation_level='DEFAULT', readonly='DEFAULT')
@@ -1,274 +1,1357 @@
 import sqlite3
 import os
+import queue
+import threading
+import time
+import contextvars
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request, session
 
 # Database path from environment variable with fallback
 # For Vercel/Render, use /tmp directory for database
 DATABASE_PATH = os.environ.get('DATABASE_PATH', os.path.join('/tmp', 'app.db'))
 
+# Setting DATABASE_URL to a postgres:// URL switches every model to the
+# PostgreSQL backend (see src/database_postgres.py)
+DATABASE_URL = os.environ.get('DATABASE_URL', '')
+DATABASE_BACKEND = 'postgres' if DATABASE_URL.startswith(('postgres://', 'postgresql://')) else 'sqlite'
+
+# Optional per-shop sharding mode (SQLite only): tenant tables of each shop
+# live in their own database file, while DATABASE_PATH keeps the global
+# catalog (users, shops, payment_verifications)
+DB_SHARDING = (os.environ.get('DB_SHARDING', 'False').lower() == 'true'
+               and DATABASE_BACKEND == 'sqlite')
+DB_SHARD_DIRS = [
+    path.strip() for path in os.environ.get(
+        'DB_SHARD_DIRS', os.path.join(os.path.dirname(DATABASE_PATH), 'shards')
+    ).split(',') if path.strip()
+]
+
+# Connection pool settings (per worker process)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+
+# Prepared statements kept per pooled connection (sqlite3 defaults to 128).
+# Sized so every registered query variant (src/database_statements.py)
+# stays prepared alongside the ad-hoc SQL of the models.
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 512))
+
+# GET requests read through a separate pool of read-only connections.
+# DATABASE_REPLICA_PATH optionally points that pool at a copy of the main
+# database, refreshed every DB_REPLICA_REFRESH_SECONDS with the backup API
+# (0 = kept up to date externally, e.g. by WAL shipping). Reads through it
+# may be up to that long, plus the time a copy takes, behind the writes.
+# DATABASE_REPLICA_URL does the same for a PostgreSQL read replica.
+DB_READ_ROUTING = os.environ.get('DB_READ_ROUTING', 'True').lower() == 'true'
+DATABASE_REPLICA_PATH = os.environ.get('DATABASE_REPLICA_PATH', '')
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL', '')
+DB_REPLICA_REFRESH_SECONDS = float(os.environ.get('DB_REPLICA_REFRESH_SECONDS', 60))
+
+# Optional single-writer mode: write transactions are funneled through one
+# writer thread per process, which commits queued transactions together
+DB_WRITE_COORDINATOR = os.environ.get('DB_WRITE_COORDINATOR', 'False').lower() == 'true'
+DB_GROUP_COMMIT_MAX_BATCH = int(os.environ.get('DB_GROUP_COMMIT_MAX_BATCH', 64))
+DB_GROUP_COMMIT_WAIT_MS = float(os.environ.get('DB_GROUP_COMMIT_WAIT_MS', 0))
+
+# Invoice search goes through an FTS5 trigram index on SQLite builds that
+# have one (3.34+); otherwise, and on PostgreSQL, it uses LIKE
+DB_FTS_SEARCH = os.environ.get('DB_FTS_SEARCH', 'True').lower() == 'true'
+
+# Cold storage for archived invoices (src/models/archive.py). On SQLite it
+# is a separate file attached to every connection as the "archive" schema
+# (DATABASE_ARCHIVE_PATH for the main database, <name>_archive.db next to
+# a shard); on PostgreSQL it is an "archive" schema in the same database.
+ARCHIVE_SCHEMA = 'archive'
+DATABASE_ARCHIVE_PATH = os.environ.get('DATABASE_ARCHIVE_PATH', '')
+
+# Pragma profile applied once when a pooled connection is opened.
+# WAL lets readers proceed while a writer commits; busy_timeout makes
+# concurrent writers from other workers wait instead of failing with
+# "database is locked". cache_size and mmap_size apply to the main
+# database only: the attached archive keeps SQLite's small default cache,
+# so reading old invoices does not evict the hot tables' pages.
+CONNECTION_PRAGMAS = [
+    ('busy_timeout', int(os.environ.get('DB_BUSY_TIMEOUT', 5000))),
+    ('journal_mode', os.environ.get('DB_JOURNAL_MODE', 'WAL')),
+    ('synchronous', os.environ.get('DB_SYNCHRONOUS', 'NORMAL')),
+    ('cache_size', int(os.environ.get('DB_CACHE_SIZE', -20000))),  # negative = KiB
+    ('mmap_size', int(os.environ.get('DB_MMAP_SIZE', 128 * 1024 * 1024))),
+    ('temp_store', os.environ.get('DB_TEMP_STORE', 'MEMORY')),
+    # Checkpoint policy: checkpoint automatically every N WAL pages and
+    # truncate the WAL file back to this many bytes afterwards
+    ('wal_autocheckpoint', int(os.environ.get('DB_WAL_AUTOCHECKPOINT', 1000))),
+    ('journal_size_limit', int(os.environ.get('DB_JOURNAL_SIZE_LIMIT', 64 * 1024 * 1024))),
+]
+
+class _PoolConnection(sqlite3.Connection):
+    """sqlite3 connection that remembers which pool generation it came from"""
+    _pool_slots = None
+    _file_id = None
+
+class PooledConnection:
+    """Pooled sqlite3 connection that is returned to the pool instead of closed"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Same transaction semantics as sqlite3.Connection, then release
+        try:
+            if self._conn is not None:
+                self._conn.__exit__(exc_type, exc_value, traceback)
+        finally:
+            self.close()
+        return False
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """Return the connection to the pool"""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn)
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of sqlite3 connections for one worker process"""
+
+    def __init__(self, database_path, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT, archive_path=None):
+        self.database_path = database_path
+        self.archive_path = archive_path
+        self.size = size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database_path, check_same_thread=False,
+                               factory=_PoolConnection,
+                               cached_statements=DB_STATEMENT_CACHE_SIZE)
+        for name, value in CONNECTION_PRAGMAS:
+            conn.execute(f'PRAGMA {name} = {value}')
+        if self.archive_path:
+            conn.execute(f'ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}', (self.archive_path,))
+            conn.execute(f'PRAGMA {ARCHIVE_SCHEMA}.journal_mode = WAL')
+        return conn
+
+    def _is_healthy(self, conn):
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self):
+        """Check out a connection, waiting up to the pool timeout"""
+        with self._lock:
+            # Connections must not be shared with a forked parent (gunicorn preload)
+            if self._pid != os.getpid():
+                self._reset()
+            slots, idle = self._slots, self._idle
+
+        if not slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError(
+                f"Connection pool exhausted ({self.size} connections in use)"
+            )
+
+        try:
+            while True:
+                try:
+                    conn = idle.get_nowait()
+                except queue.Empty:
+                    conn = self._connect()
+                    break
+                if self._is_healthy(conn):
+                    break
+                conn.close()
+        except Exception:
+            slots.release()
+            raise
+
+        conn._pool_slots = slots
+        return conn
+
+    def release(self, conn):
+        """Return a connection, discarding any uncommitted work"""
+        slots = conn._pool_slots
+        if slots is not self._slots or self._pid != os.getpid():
+            # Checked out before a fork; it no longer belongs to this pool
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+        except sqlite3.Error:
+            conn.close()
+        finally:
+            slots.release()
+
+    def close_all(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def begin_request(self, conn, read_only):
+        """Prepare a connection to serve as a request's unit of work"""
+        if read_only:
+            conn.execute('PRAGMA query_only = ON')
+            conn.execute('BEGIN')
+        else:
+            # Reads run in autocommit; the first write takes the write lock
+            # up front so it cannot fail upgrading a stale read snapshot
+            conn.isolation_level = 'IMMEDIATE'
+
+    def end_request(self, conn, read_only):
+        """Undo begin_request() once the request's transaction has ended"""
+        if read_only:
+            conn.execute('PRAGMA query_only = OFF')
+        else:
+            conn.isolation_level = ''
+
+# Pragmas that change the database file; not allowed on read-only connections
+_WRITE_PRAGMAS = ('journal_mode', 'wal_autocheckpoint', 'journal_size_limit')
+
+class ReadOnlyPool(ConnectionPool):
+    """Pool of connections opened with mode=ro for read-only requests"""
+
+    def _file_id(self):
+        stat = os.stat(self.database_path)
+        return stat.st_dev, stat.st_ino
+
+    def _connect(self):
+        # Taken before opening: a file swapped in meanwhile only costs a reconnect
+        file_id = self._file_id()
+        conn = sqlite3.connect(f'file:{self.database_path}?mode=ro', uri=True,
+                               check_same_thread=False, factory=_PoolConnection,
+                               cached_statements=DB_STATEMENT_CACHE_SIZE)
+        conn._file_id = file_id
+        for name, value in CONNECTION_PRAGMAS:
+            if name not in _WRITE_PRAGMAS:
+                conn.execute(f'PRAGMA {name} = {value}')
+        if self.archive_path:
+            conn.execute(f'ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}', (f'file:{self.archive_path}?mode=ro',))
+        conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    def _is_healthy(self, conn):
+        # refresh_replica() renames a new copy over the replica; a connection
+        # opened before that would keep reading the old file
+        return conn._file_id == self._file_id() and super()._is_healthy(conn)
+
+    def begin_request(self, conn, read_only):
+        conn.execute('BEGIN')
+
+    def end_request(self, conn, read_only):
+        pass
+
+class RequestConnection:
+    """Connection shared by every model call within one HTTP request
+
+    Models keep their usual commit()/close()/with-block calls: commits are
+    deferred to the end of the request, while rollbacks and errors abort
+    the request's transaction. GET requests run in a single read-only
+    transaction so multi-query endpoints see one consistent snapshot.
+    """
+
+    def __init__(self, pool, conn, read_only):
+        self._pool = pool
+        self._conn = conn
+        self.read_only = read_only
+        pool.begin_request(conn, read_only)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.rollback()
+        return False
+
+    def commit(self):
+        """Deferred until the request finishes"""
+
+    def rollback(self):
+        if not self.read_only:
+            self._conn.rollback()
+
+    def close(self):
+        """Released when the request is torn down"""
+
+    def finish(self, success):
+        """Commit or roll back the request's write transaction"""
+        if self.read_only or not self._conn.in_transaction:
+            return
+        if success:
+            self._conn.commit()
+        else:
+            self._conn.rollback()
+
+    def release(self):
+        """Reset the connection and return it to the pool"""
+        conn, self._conn = self._conn, None
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._pool.end_request(conn, self.read_only)
+        except sqlite3.Error:
+            pass
+        self._pool.release(conn)
+
+class _WriteJob:
+    def __init__(self, work):
+        self.work = work
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+class WriteCoordinator:
+    """Single writer thread that group-commits queued write transactions
+
+    Each submitted job runs inside its own SAVEPOINT of a shared
+    BEGIN IMMEDIATE transaction, so a failing job is rolled back on its own
+    while the rest of the batch commits together. Callers block until the
+    batch containing their job has committed.
+    """
+
+    def __init__(self, pool, max_batch=DB_GROUP_COMMIT_MAX_BATCH,
+                 max_wait_ms=DB_GROUP_COMMIT_WAIT_MS):
+        self._pool = pool
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return self._queue
+            # First use, or first use after a fork: start a fresh writer
+            self._pid = os.getpid()
+            self._queue = queue.Queue()
+            thread = threading.Thread(target=self._run, args=(self._queue,),
+                                      name='sqlite-writer', daemon=True)
+            thread.start()
+            return self._queue
+
+    def submit(self, work):
+        """Run work(conn) in the writer thread and return its result"""
+        job = _WriteJob(work)
+        self._ensure_started().put(job)
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _run(self, jobs):
+        conn = self._pool._connect()
+        while True:
+            batch = [jobs.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    remaining = deadline - time.monotonic()
+                    if remaining > 0:
+                        batch.append(jobs.get(timeout=remaining))
+                    else:
+                        batch.append(jobs.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit_batch(conn, batch)
+
+    def _commit_batch(self, conn, batch):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for index, job in enumerate(batch):
+                conn.execute(f'SAVEPOINT job_{index}')
+                try:
+                    job.result = job.work(conn)
+                except Exception as e:
+                    job.error = e
+                    conn.execute(f'ROLLBACK TO job_{index}')
+                conn.execute(f'RELEASE job_{index}')
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for job in batch:
+                if job.error is None:
+                    job.result, job.error = None, e
+        finally:
+            for job in batch:
+                job.done.set()
+
+_pools = {}
+_pool_lock = threading.Lock()
+_read_pools = {}
+_replica_lock = threading.Lock()
+_replica_refresh_pid = None
+_write_coordinators = {}
+_initialized_shards = set()
+_shop_context = contextvars.ContextVar('current_shop_id', default=None)
+
+def _default_database():
+    return DATABASE_URL if DATABASE_BACKEND == 'postgres' else DATABASE_PATH
+
+def get_pool(database=None):
+    """Get this process's connection pool for a database (the catalog by default)"""
+    database = database or _default_database()
+    pool = _pools.get(database)
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get(database)
+            if pool is None:
+                if DATABASE_BACKEND == 'postgres':
+                    from src.database_postgres import PostgresPool
+                    pool = PostgresPool(database)
+                else:
+                    pool = ConnectionPool(database, archive_path=get_archive_path(database))
+                _pools[database] = pool
+    return pool
+
+def get_read_pool(database=None):
+    """Get this process's read-only connection pool for a database
+
+    Reads go to the configured replica of the catalog database when there
+    is one, and to the database itself (opened read-only) otherwise.
+    """
+    database = database or _default_database()
+    if DATABASE_BACKEND == 'postgres':
+        # Request connections on the main pool are already set read-only
+        return get_pool(DATABASE_REPLICA_URL or database)
+
+    if DATABASE_REPLICA_PATH and database == DATABASE_PATH:
+        _start_replica_refresh()
+        path = DATABASE_REPLICA_PATH
+    else:
+        path = database
+
+    pool = _read_pools.get(path)
+    if pool is None:
+        with _pool_lock:
+            pool = _read_pools.get(path)
+            if pool is None:
+                # A replica still reads the main database's archive file
+                pool = _read_pools[path] = ReadOnlyPool(path, archive_path=get_archive_path(database))
+    return pool
+
+def get_archive_path(database):
+    """Get the archive file attached to a SQLite database"""
+    if DATABASE_ARCHIVE_PATH and database == DATABASE_PATH:
+        return DATABASE_ARCHIVE_PATH
+    root, ext = os.path.splitext(database)
+    return f'{root}_archive{ext or ".db"}'
+
+def refresh_replica():
+    """Copy the main database into DATABASE_REPLICA_PATH with the backup API
+
+    The copy is written to a temporary file and renamed over the replica,
+    so it neither waits for nor disturbs the readers of the previous copy.
+    Requests already reading finish on the old file; the read pool reopens
+    their connections on the new one when they are next checked out.
+    """
+    # Every worker process refreshes on its own schedule
+    temp_path = f'{DATABASE_REPLICA_PATH}.{os.getpid()}.tmp'
+    pool = get_pool(DATABASE_PATH)
+    source = PooledConnection(pool, pool.acquire())
+    target = sqlite3.connect(temp_path)
+    try:
+        source.backup(target)
+        # A rollback-journal copy needs no -wal/-shm files, which would
+        # otherwise outlive the file they belong to
+        target.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        target.close()
+        source.close()
+    # Left by replicas refreshed in place as WAL files; SQLite would apply
+    # them to the new copy
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(DATABASE_REPLICA_PATH + suffix):
+            os.remove(DATABASE_REPLICA_PATH + suffix)
+    os.replace(temp_path, DATABASE_REPLICA_PATH)
+
+def _start_replica_refresh():
+    global _replica_refresh_pid
+    with _replica_lock:
+        if _replica_refresh_pid == os.getpid():
+            return
+        _replica_refresh_pid = os.getpid()
+        if not os.path.exists(DATABASE_REPLICA_PATH):
+            refresh_replica()
+        if DB_REPLICA_REFRESH_SECONDS > 0:
+            thread = threading.Thread(target=_refresh_replica_loop,
+                                      name='sqlite-replica', daemon=True)
+            thread.start()
+
+def _refresh_replica_loop():
+    while True:
+        time.sleep(DB_REPLICA_REFRESH_SECONDS)
+        try:
+            refresh_replica()
+        except sqlite3.Error as e:
+            print(f"Replica refresh failed: {e}")
+
+def get_shard_path(shop_id):
+    """Get the SQLite file holding a shop's tenant data in sharding mode
+
+    Shops are spread over DB_SHARD_DIRS by id, so changing that list
+    relocates existing shards.
+    """
+    shop_id = int(shop_id)
+    directory = DB_SHARD_DIRS[shop_id % len(DB_SHARD_DIRS)]
+    return os.path.join(directory, f'shop_{shop_id}.db')
+
+def set_current_shop(shop_id):
+    """Route tenant queries of the current request to this shop's shard"""
+    if has_request_context():
+        g._shop_id = shop_id
+    else:
+        _shop_context.set(shop_id)
+
+@contextmanager
+def use_shop(shop_id):
+    """Route tenant queries to a shop's shard outside of a request"""
+    token = _shop_context.set(shop_id)
+    try:
+        yield
+    finally:
+        _shop_context.reset(token)
+
+def get_current_shop():
+    """Get the shop whose shard tenant queries are routed to"""
+    if not has_request_context():
+        return _shop_context.get()
+    
+    if g.get('_shop_id') is None:
+        # Shop users only ever work on their own shop
+        user_id = session.get('user_id')
+        if user_id:
+            conn = get_catalog_connection()
+            try:
+                row = conn.execute('SELECT id FROM shops WHERE user_id = ?', (user_id,)).fetchone()
+            finally:
+                conn.close()
+            g._shop_id = row[0] if row else None
+    return g.get('_shop_id')
+
+def _resolve_database(shop_id=None):
+    if not DB_SHARDING:
+        return _default_database()
+    
+    if shop_id is None:
+        shop_id = get_current_shop()
+    if shop_id is None:
+        raise RuntimeError("No shop selected for a tenant database connection")
+    
+    path = get_shard_path(shop_id)
+    if path not in _initialized_shards:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        init_db(path)
+        _initialized_shards.add(path)
+    return path
+
+def get_write_coordinator(database=None):
+    """Get the write coordinator, or None when single-writer mode is off"""
+    # PostgreSQL handles concurrent writers itself
+    if not DB_WRITE_COORDINATOR or DATABASE_BACKEND != 'sqlite':
+        return None
+    database = database or _default_database()
+    coordinator = _write_coordinators.get(database)
+    if coordinator is None:
+        with _pool_lock:
+            coordinator = _write_coordinators.get(database)
+            if coordinator is None:
+                coordinator = WriteCoordinator(get_pool(database))
+                _write_coordinators[database] = coordinator
+    return coordinator
+
+def run_write_transaction(work, shop_id=None, standalone=False):
+    """Run work(conn) as one write transaction and return its result
+
+    work must not commit; it is committed here, or as part of a group
+    commit when the write coordinator is enabled. If the current request
+    already holds an open write transaction the work joins it instead, as
+    handing it to the writer thread would wait on our own lock.
+
+    standalone=True always commits the work on its own, outside the
+    request's transaction (e.g. one chunk of a bulk import). It runs on
+    the request's connection when there is one: a second connection from
+    the pool could wait forever once every connection is held by a request
+    doing the same. The request must not have uncommitted writes at that
+    point; on SQLite this raises RuntimeError.
+    """
+    database = _resolve_database(shop_id)
+    coordinator = get_write_coordinator(database)
+    request_conn = g.get('_db_connections', {}).get(database) if has_request_context() else None
+    writable_request = request_conn is not None and not request_conn.read_only
+    # An open SQLite transaction means uncommitted writes, which a
+    # standalone commit would take along, and whose lock the writer thread
+    # would wait on. PostgreSQL opens one on the first read, so there it is
+    # simply ended with the work.
+    if (standalone and writable_request and request_conn.in_transaction
+            and DATABASE_BACKEND == 'sqlite'):
+        raise RuntimeError("Standalone write transaction inside the request's open write transaction")
+    if coordinator is not None and (standalone or not (request_conn and request_conn.in_transaction)):
+        return coordinator.submit(work)
+
+    if standalone and writable_request:
+        conn = request_conn._conn
+    elif standalone:
+        pool = get_pool(database)
+        conn = PooledConnection(pool, pool.acquire())
+    else:
+        conn = _connect(database)
+    with conn:
+        result = work(conn)
+        conn.commit()
+        return result
+
+def checkpoint_wal(mode='PASSIVE', database=None):
+    """Checkpoint the WAL file into the database
+
+    PASSIVE never blocks writers; TRUNCATE waits for readers and resets
+    the WAL file to zero bytes. Returns (busy, wal_pages, checkpointed_pages).
+    """
+    if mode.upper() not in ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'):
+        raise ValueError(f"Invalid checkpoint mode: {mode}")
+
+    pool = get_pool(database)
+    conn = PooledConnection(pool, pool.acquire())
+    try:
+        return conn.execute(f'PRAGMA wal_checkpoint({mode.upper()})').fetchone()
+    finally:
+        conn.close()
+
 def get_db():
     """Get database connection"""
-    return sqlite3.connect(DATABASE_PATH)
+    return get_db_connection()
 
-def get_db_connection():
-    """Get database connection"""
-    return sqlite3.connect(DATABASE_PATH)
+def get_db_connection(shop_id=None):
+    """Get pooled connection for tenant data (the request's connection inside a request)
 
-def init_db():
-    """Initialize database with tables"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    In sharding mode this is the shard of shop_id, or of the current shop.
+    """
+    return _connect(_resolve_database(shop_id))
+
+def get_catalog_connection():
+    """Get pooled connection for the global catalog (users, shops, payment verifications)"""
+    return _connect(_default_database())
+
+def _connect(database):
+    if has_request_context() and current_app.config.get('DB_REQUEST_SCOPE'):
+        return _get_request_connection(database)
+    pool = get_pool(database)
+    return PooledConnection(pool, pool.acquire())
+
+def _get_request_connection(database):
+    connections = g.setdefault('_db_connections', {})
+    conn = connections.get(database)
+    if conn is None:
+        read_only = request.method in ('GET', 'HEAD', 'OPTIONS')
+        if read_only and DB_READ_ROUTING:
+            # Long report reads stay off the pool used by the write path
+            pool = get_read_pool(database)
+        else:
+            pool = get_pool(database)
+        conn = connections[database] = RequestConnection(pool, pool.acquire(), read_only)
+    return conn
+
+def _finish_request_connection(response):
+    for conn in g.get('_db_connections', {}).values():
+        conn.finish(success=response.status_code < 400)
+    return response
+
+def _release_request_connection(exception=None):
+    for conn in g.pop('_db_connections', {}).values():
+        conn.release()
+
+def init_request_scope(app):
+    """Use one connection and transaction per HTTP request
+
+    The connection is checked out lazily on first use, committed after the
+    view returns a non-error response and rolled back otherwise.
+    """
+    app.config['DB_REQUEST_SCOPE'] = True
+    app.after_request(_finish_request_connection)
+    app.teardown_request(_release_request_connection)
+
+def create_tables(cursor):
+    """Create the base tables (schema version 1)"""
+    # Users table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'shop_user',
+            is_active BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
     
-    try:
-        # Users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                role TEXT NOT NULL DEFAULT 'shop_user',
-                is_active BOOLEAN DEFAULT TRUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Shops table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS shops (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                shop_name TEXT NOT NULL,
-                owner_name TEXT NOT NULL,
-                phone TEXT NOT NULL,
-                address TEXT NOT NULL,
-                city TEXT NOT NULL,
-                state TEXT NOT NULL,
-                pincode TEXT NOT NULL,
-                gst_number TEXT,
-                license_number TEXT,
-                is_active BOOLEAN DEFAULT FALSE,
-                subscription_status TEXT DEFAULT 'inactive',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # Customers table
+    # Shops table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS shops (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            shop_name TEXT NOT NULL,
+            owner_name TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            address TEXT NOT NULL,
+            city TEXT NOT NULL,
+            state TEXT NOT NULL,
+            pincode TEXT NOT NULL,
+            gst_number TEXT,
+            license_number TEXT,
+            is_active BOOLEAN DEFAULT FALSE,
+            subscription_status TEXT DEFAULT 'inactive',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    
+    # Customers table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS customers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            shop_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            phone TEXT,
+            email TEXT,
+            address TEXT,
+            city TEXT,
+            state TEXT,
+            pincode TEXT,
+            gst_number TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (shop_id) REFERENCES shops (id)
+        )
+    ''')
+    
+    # Products table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            shop_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            brand TEXT,
+            description TEXT,
+            unit TEXT NOT NULL,
+            price REAL NOT NULL,
+            stock_quantity INTEGER DEFAULT 0,
+            min_stock_level INTEGER DEFAULT 0,
+            barcode TEXT,
+            is_active BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (shop_id) REFERENCES shops (id)
+        )
+    ''')
+    
+    # Invoices table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS invoices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            shop_id INTEGER NOT NULL,
+            customer_id INTEGER,
+            invoice_number TEXT UNIQUE NOT NULL,
+            invoice_date DATE NOT NULL,
+            due_date DATE,
+            subtotal REAL NOT NULL,
+            tax_amount REAL DEFAULT 0,
+            discount_amount REAL DEFAULT 0,
+            total_amount REAL NOT NULL,
+            paid_amount REAL DEFAULT 0,
+            balance_amount REAL NOT NULL,
+            status TEXT DEFAULT 'pending',
+            notes TEXT,
+            original_invoice_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (shop_id) REFERENCES shops (id),
+            FOREIGN KEY (customer_id) REFERENCES customers (id),
+            FOREIGN KEY (original_invoice_id) REFERENCES invoices (id)
+        )
+    ''')
+    
+    # Invoice items table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS invoice_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            invoice_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            product_name TEXT NOT NULL,
+            unit TEXT NOT NULL,
+            quantity REAL NOT NULL,
+            unit_price REAL NOT NULL,
+            total_price REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (invoice_id) REFERENCES invoices (id),
+            FOREIGN KEY (product_id) REFERENCES products (id)
+        )
+    ''')
+    
+    # Invoice payments table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS invoice_payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            invoice_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            payment_method TEXT NOT NULL,
+            payment_date DATETIME NOT NULL,
+            reference_number TEXT,
+            notes TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (invoice_id) REFERENCES invoices (id)
+        )
+    ''')
+
+    # Create expenses table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS expenses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            shop_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            amount REAL NOT NULL,
+            category TEXT NOT NULL,
+            supplier_id INTEGER,
+            date DATE NOT NULL,
+            description TEXT,
+            payment_method TEXT DEFAULT 'cash',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (shop_id) REFERENCES shops (id),
+            FOREIGN KEY (supplier_id) REFERENCES suppliers (id)
+        )
+    ''')
+
+    # Create suppliers table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS suppliers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            shop_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            contact_person TEXT,
+            phone TEXT,
+            email TEXT,
+            address TEXT,
+            gst_number TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (shop_id) REFERENCES shops (id)
+        )
+    ''')
+
+    # Create purchase_orders table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS purchase_orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            shop_id INTEGER NOT NULL,
+            supplier_id INTEGER NOT NULL,
+            po_number TEXT NOT NULL,
+            order_date DATE NOT NULL,
+            expected_delivery DATE,
+            total_amount REAL NOT NULL,
+            status TEXT DEFAULT 'pending',
+            notes TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (shop_id) REFERENCES shops (id),
+            FOREIGN KEY (supplier_id) REFERENCES suppliers (id)
+        )
+    ''')
+
+    # Create purchase_order_items table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS purchase_order_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            purchase_order_id INTEGER NOT NULL,
+            product_name TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            unit_price REAL NOT NULL,
+            total_price REAL NOT NULL,
+            FOREIGN KEY (purchase_order_id) REFERENCES purchase_orders (id)
+        )
+    ''')
+    
+    # Payment verifications table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS payment_verifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            shop_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            payment_method TEXT NOT NULL,
+            reference_number TEXT,
+            payment_proof TEXT,
+            status TEXT DEFAULT 'pending',
+            admin_notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (shop_id) REFERENCES shops (id)
+        )
+    ''')
+
+# Secondary indexes for the per-tenant filters and sort orders used by the models
+INDEXES = [
+    ('idx_shops_user_id', 'shops (user_id)'),
+    ('idx_customers_shop_name', 'customers (shop_id, name)'),
+    ('idx_products_shop_active_name', 'products (shop_id, is_active, name)'),
+    ('idx_products_shop_barcode', 'products (shop_id, barcode)'),
+    ('idx_invoices_shop_created', 'invoices (shop_id, created_at)'),
+    ('idx_invoices_customer_date', 'invoices (customer_id, invoice_date)'),
+    ('idx_invoices_original', 'invoices (original_invoice_id)'),
+    ('idx_invoices_shop_status_due', 'invoices (shop_id, status, due_date)'),
+    ('idx_invoice_items_invoice', 'invoice_items (invoice_id)'),
+    ('idx_invoice_payments_invoice_date', 'invoice_payments (invoice_id, payment_date)'),
+    ('idx_expenses_shop_date', 'expenses (shop_id, date)'),
+    ('idx_suppliers_shop_name', 'suppliers (shop_id, name)'),
+    ('idx_purchase_orders_shop_date', 'purchase_orders (shop_id, order_date)'),
+    ('idx_purchase_order_items_po', 'purchase_order_items (purchase_order_id)'),
+    ('idx_payment_verifications_shop_created', 'payment_verifications (shop_id, created_at)'),
+    ('idx_payment_verifications_status_created', 'payment_verifications (status, created_at)'),
+]
+
+def create_indexes(cursor):
+    """Create secondary indexes that do not exist yet"""
+    for name, definition in INDEXES:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {definition}')
+    # Refresh planner statistics so the new indexes are picked up
+    cursor.execute('ANALYZE' if DATABASE_BACKEND == 'postgres' else 'PRAGMA optimize')
+
+def get_column_names(cursor, table):
+    """Get the column names of a table"""
+    if DATABASE_BACKEND == 'postgres':
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS customers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                shop_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                phone TEXT,
-                email TEXT,
-                address TEXT,
-                city TEXT,
-                state TEXT,
-                pincode TEXT,
-                gst_number TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (shop_id) REFERENCES shops (id)
-            )
-        ''')
-        
-        # Products table
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = ?
+        ''', (table,))
+        return [row[0] for row in cursor.fetchall()]
+    
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [column[1] for column in cursor.fetchall()]
+
+def _add_original_invoice_id(cursor):
+    """Add invoices.original_invoice_id to databases created before returns existed"""
+    if 'original_invoice_id' not in get_column_names(cursor, 'invoices'):
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS products (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                shop_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                category TEXT NOT NULL,
-                brand TEXT,
-                description TEXT,
-                unit TEXT NOT NULL,
-                price REAL NOT NULL,
-                stock_quantity INTEGER DEFAULT 0,
-                min_stock_level INTEGER DEFAULT 0,
-                barcode TEXT,
-                is_active BOOLEAN DEFAULT TRUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (shop_id) REFERENCES shops (id)
-            )
+            ALTER TABLE invoices 
+            ADD COLUMN original_invoice_id INTEGER 
+            REFERENCES invoices (id)
         ''')
-        
-        # Invoices table
+
+def _add_invoice_payments_updated_at(cursor):
+    """Add invoice_payments.updated_at, which the payment models write"""
+    if 'updated_at' not in get_column_names(cursor, 'invoice_payments'):
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS invoices (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                shop_id INTEGER NOT NULL,
-                customer_id INTEGER,
-                invoice_number TEXT UNIQUE NOT NULL,
-                invoice_date DATE NOT NULL,
-                due_date DATE,
-                subtotal REAL NOT NULL,
-                tax_amount REAL DEFAULT 0,
-                discount_amount REAL DEFAULT 0,
-                total_amount REAL NOT NULL,
-                paid_amount REAL DEFAULT 0,
-                balance_amount REAL NOT NULL,
-                status TEXT DEFAULT 'pending',
-                notes TEXT,
-                original_invoice_id INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (shop_id) REFERENCES shops (id),
-                FOREIGN KEY (customer_id) REFERENCES customers (id),
-                FOREIGN KEY (original_invoice_id) REFERENCES invoices (id)
-            )
+            ALTER TABLE invoice_payments 
+            ADD COLUMN updated_at DATETIME
         ''')
-        
-        # Invoice items table
+
+def _create_document_sequences(cursor):
+    """Add per-shop document number sequences, continuing existing invoice numbering"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS document_sequences (
+            shop_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            period TEXT NOT NULL DEFAULT '',
+            last_value INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (shop_id, name, period)
+        )
+    ''')
+    # Invoice numbers used to be derived from the shop's invoice count
+    cursor.execute('''
+        INSERT INTO document_sequences (shop_id, name, period, last_value)
+        SELECT shop_id, 'invoice', '', COUNT(*) FROM invoices GROUP BY shop_id
+    ''')
+
+def _create_shop_counters(cursor):
+    """Add per-shop row counters for unfiltered list totals"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS shop_counters (
+            shop_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            value INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (shop_id, name)
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO shop_counters (shop_id, name, value)
+        SELECT shop_id, 'customers', COUNT(*) FROM customers GROUP BY shop_id
+    ''')
+    cursor.execute('''
+        INSERT INTO shop_counters (shop_id, name, value)
+        SELECT shop_id, 'products', COUNT(*) FROM products WHERE is_active = TRUE GROUP BY shop_id
+    ''')
+    cursor.execute('''
+        INSERT INTO shop_counters (shop_id, name, value)
+        SELECT shop_id, 'invoices', COUNT(*) FROM invoices GROUP BY shop_id
+    ''')
+
+def _add_return_ledger(cursor):
+    """Add the returned-quantity ledger and fill it from existing return invoices"""
+    if 'returned_quantity' not in get_column_names(cursor, 'invoice_items'):
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS invoice_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                invoice_id INTEGER NOT NULL,
-                product_id INTEGER NOT NULL,
-                product_name TEXT NOT NULL,
-                unit TEXT NOT NULL,
-                quantity REAL NOT NULL,
-                unit_price REAL NOT NULL,
-                total_price REAL NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (invoice_id) REFERENCES invoices (id),
-                FOREIGN KEY (product_id) REFERENCES products (id)
-            )
+            ALTER TABLE invoice_items 
+            ADD COLUMN returned_quantity REAL NOT NULL DEFAULT 0
         ''')
-        
-        # Invoice payments table
+    if 'returned_amount' not in get_column_names(cursor, 'invoices'):
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS invoice_payments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                invoice_id INTEGER NOT NULL,
-                amount REAL NOT NULL,
-                payment_method TEXT NOT NULL,
-                payment_date DATETIME NOT NULL,
-                reference_number TEXT,
-                notes TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (invoice_id) REFERENCES invoices (id)
-            )
+            ALTER TABLE invoices 
+            ADD COLUMN returned_amount REAL NOT NULL DEFAULT 0
         ''')
+    
+    # The backfill is spelled out here, not delegated to the Invoice model,
+    # so later model changes cannot change what this migration does
+    cursor.execute('''
+        UPDATE invoices
+        SET returned_amount = COALESCE((
+            SELECT -SUM(r.total_amount) FROM invoices r WHERE r.original_invoice_id = invoices.id
+        ), 0)
+        WHERE id IN (SELECT original_invoice_id FROM invoices WHERE original_invoice_id IS NOT NULL)
+    ''')
+    
+    # A product's returned quantity fills the original's lines of that
+    # product in id order; anything beyond their quantities stays on the
+    # last line
+    returned = '''(
+        SELECT COALESCE(-SUM(ri.quantity), 0) FROM invoice_items ri
+        JOIN invoices r ON ri.invoice_id = r.id
+        WHERE r.original_invoice_id = invoice_items.invoice_id AND ri.product_id = invoice_items.product_id
+    )'''
+    earlier_lines = '''(
+        SELECT COALESCE(SUM(l.quantity), 0) FROM invoice_items l
+        WHERE l.invoice_id = invoice_items.invoice_id AND l.product_id = invoice_items.product_id
+          AND l.id < invoice_items.id
+    )'''
+    later_line = '''EXISTS (
+        SELECT 1 FROM invoice_items l
+        WHERE l.invoice_id = invoice_items.invoice_id AND l.product_id = invoice_items.product_id
+          AND l.id > invoice_items.id
+    )'''
+    remaining = f'({returned} - {earlier_lines})'
+    cursor.execute(f'''
+        UPDATE invoice_items
+        SET returned_quantity = CASE
+            WHEN {remaining} <= 0 THEN 0
+            WHEN {remaining} < quantity OR NOT {later_line} THEN {remaining}
+            ELSE quantity
+        END
+        WHERE invoice_id IN (SELECT original_invoice_id FROM invoices WHERE original_invoice_id IS NOT NULL)
+    ''')
 
-        # Create expenses table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS expenses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                shop_id INTEGER NOT NULL,
-                title TEXT NOT NULL,
-                amount REAL NOT NULL,
-                category TEXT NOT NULL,
-                supplier_id INTEGER,
-                date DATE NOT NULL,
-                description TEXT,
-                payment_method TEXT DEFAULT 'cash',
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (shop_id) REFERENCES shops (id),
-                FOREIGN KEY (supplier_id) REFERENCES suppliers (id)
-            )
-        ''')
+def _create_receivables_aging(cursor):
+    """Add the aging index and the table for nightly receivables aging snapshots"""
+    create_indexes(cursor)
+    # customer_id 0 holds walk-in (no customer) invoices
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS receivables_aging_snapshots (
+            shop_id INTEGER NOT NULL,
+            snapshot_date DATE NOT NULL,
+            customer_id INTEGER NOT NULL DEFAULT 0,
+            invoice_count INTEGER NOT NULL DEFAULT 0,
+            days_0_30 REAL NOT NULL DEFAULT 0,
+            days_31_60 REAL NOT NULL DEFAULT 0,
+            days_61_90 REAL NOT NULL DEFAULT 0,
+            days_90_plus REAL NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (shop_id, snapshot_date, customer_id)
+        )
+    ''')
 
-        # Create suppliers table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS suppliers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                shop_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                contact_person TEXT,
-                phone TEXT,
-                email TEXT,
-                address TEXT,
-                gst_number TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (shop_id) REFERENCES shops (id)
-            )
-        ''')
+_fts_trigram = None
 
-        # Create purchase_orders table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS purchase_orders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                shop_id INTEGER NOT NULL,
-                supplier_id INTEGER NOT NULL,
-                po_number TEXT NOT NULL,
-                order_date DATE NOT NULL,
-                expected_delivery DATE,
-                total_amount REAL NOT NULL,
-                status TEXT DEFAULT 'pending',
-                notes TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (shop_id) REFERENCES shops (id),
-                FOREIGN KEY (supplier_id) REFERENCES suppliers (id)
-            )
-        ''')
+def fts_trigram_supported():
+    """Whether this SQLite build has FTS5 with the trigram tokenizer"""
+    global _fts_trigram
+    if _fts_trigram is None:
+        _fts_trigram = False
+        if DATABASE_BACKEND == 'sqlite':
+            probe = sqlite3.connect(':memory:')
+            try:
+                probe.execute("CREATE VIRTUAL TABLE probe USING fts5(text, tokenize='trigram')")
+                _fts_trigram = True
+            except sqlite3.OperationalError:
+                pass
+            finally:
+                probe.close()
+    return _fts_trigram
 
-        # Create purchase_order_items table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS purchase_order_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                purchase_order_id INTEGER NOT NULL,
-                product_name TEXT NOT NULL,
-                quantity INTEGER NOT NULL,
-                unit_price REAL NOT NULL,
-                total_price REAL NOT NULL,
-                FOREIGN KEY (purchase_order_id) REFERENCES purchase_orders (id)
-            )
+# Invoice search index row for NEW (an invoice); shop_key is '|<shop_id>|'
+# so a phrase query on it matches exactly one shop
+_INVOICE_FTS_INSERT = '''
+    INSERT INTO invoices_fts (rowid, shop_key, invoice_number, customer_name, customer_phone, notes)
+    VALUES (
+        NEW.id, '|' || NEW.shop_id || '|', NEW.invoice_number,
+        (SELECT name FROM customers WHERE id = NEW.customer_id),
+        (SELECT phone FROM customers WHERE id = NEW.customer_id),
+        NEW.notes
+    );
+'''
+
+def _create_invoice_search_index(cursor):
+    """Add the FTS5 invoice search index, kept in sync by triggers"""
+    if not fts_trigram_supported():
+        print("FTS5 trigram tokenizer not available; invoice search will use LIKE")
+        return
+    
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS invoices_fts USING fts5(
+            shop_key, invoice_number, customer_name, customer_phone, notes,
+            tokenize = 'trigram'
+        )
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS invoices_fts_insert AFTER INSERT ON invoices
+        BEGIN {_INVOICE_FTS_INSERT} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS invoices_fts_update
+        AFTER UPDATE OF invoice_number, customer_id, notes ON invoices
+        BEGIN
+            DELETE FROM invoices_fts WHERE rowid = OLD.id;
+            {_INVOICE_FTS_INSERT}
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS invoices_fts_delete AFTER DELETE ON invoices
+        BEGIN
+            DELETE FROM invoices_fts WHERE rowid = OLD.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS invoices_fts_customer_update
+        AFTER UPDATE OF name, phone ON customers
+        BEGIN
+            UPDATE invoices_fts SET customer_name = NEW.name, customer_phone = NEW.phone
+            WHERE rowid IN (SELECT id FROM invoices WHERE customer_id = NEW.id);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS invoices_fts_customer_delete AFTER DELETE ON customers
+        BEGIN
+            UPDATE invoices_fts SET customer_name = NULL, customer_phone = NULL
+            WHERE rowid IN (SELECT id FROM invoices WHERE customer_id = OLD.id);
+        END
+    ''')
+    cursor.execute('''
+        INSERT INTO invoices_fts (rowid, shop_key, invoice_number, customer_name, customer_phone, notes)
+        SELECT i.id, '|' || i.shop_id || '|', i.invoice_number, c.name, c.phone, i.notes
+        FROM invoices i
+        LEFT JOIN customers c ON i.customer_id = c.id
+    ''')
+
+# Tables moved to the archive with an invoice, and the column that ties
+# their rows to it. Migrations that add columns to these tables must add
+# them to the archive copies too.
+ARCHIVED_TABLES = [
+    ('invoices', 'id'),
+    ('invoice_items', 'invoice_id'),
+    ('invoice_payments', 'invoice_id'),
+]
+
+ARCHIVE_INDEXES = [
+    ('idx_archive_invoices_id', 'invoices', 'id', True),
+    ('idx_archive_invoices_number', 'invoices', 'invoice_number', True),
+    ('idx_archive_invoices_customer', 'invoices', 'customer_id, shop_id', False),
+    ('idx_archive_invoices_original', 'invoices', 'original_invoice_id', False),
+    ('idx_archive_invoice_items_invoice', 'invoice_items', 'invoice_id', False),
+    ('idx_archive_invoice_payments_invoice', 'invoice_payments', 'invoice_id', False),
+]
+
+def _create_invoice_archive(cursor):
+    """Add empty archive copies of the invoice tables and per-shop archived totals"""
+    # Kept in the main database so lifetime stats never read the archive
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS invoice_archive_totals (
+            shop_id INTEGER PRIMARY KEY,
+            invoice_count INTEGER NOT NULL DEFAULT 0,
+            total_amount REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    if DATABASE_BACKEND == 'postgres':
+        cursor.execute(f'CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}')
+    for table, _ in ARCHIVED_TABLES:
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.{table} AS
+            SELECT * FROM {table} WHERE 1 = 0
         ''')
-        
-        # Payment verifications table
+    for name, table, columns, unique in ARCHIVE_INDEXES:
+        kind = 'UNIQUE INDEX' if unique else 'INDEX'
+        # SQLite qualifies the index with the schema, PostgreSQL the table
+        if DATABASE_BACKEND == 'postgres':
+            cursor.execute(f'CREATE {kind} IF NOT EXISTS {name} ON {ARCHIVE_SCHEMA}.{table} ({columns})')
+        else:
+            cursor.execute(f'CREATE {kind} IF NOT EXISTS {ARCHIVE_SCHEMA}.{name} ON {table} ({columns})')
+
+def _add_expenses_supplier_key(cursor):
+    """Add expenses.supplier_id's foreign key, which migration 1 cannot create on PostgreSQL"""
+    if DATABASE_BACKEND != 'postgres':
+        # SQLite already has it from migration 1
+        return
+    cursor.execute('''
+        SELECT 1 FROM pg_constraint
+        WHERE contype = 'f' AND conrelid = 'expenses'::regclass AND confrelid = 'suppliers'::regclass
+    ''')
+    if cursor.fetchone() is None:
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS payment_verifications (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                shop_id INTEGER NOT NULL,
-                amount REAL NOT NULL,
-                payment_method TEXT NOT NULL,
-                reference_number TEXT,
-                payment_proof TEXT,
-                status TEXT DEFAULT 'pending',
-                admin_notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (shop_id) REFERENCES shops (id)
-            )
+            ALTER TABLE expenses
+            ADD FOREIGN KEY (supplier_id) REFERENCES suppliers (id)
         ''')
+
+# Ordered schema migrations: (version, description, function(cursor)).
+# Append new migrations at the end; never renumber or edit applied ones.
+MIGRATIONS = [
+    (1, 'Create base tables', create_tables),
+    (2, 'Add invoices.original_invoice_id', _add_original_invoice_id),
+    (3, 'Add invoice_payments.updated_at', _add_invoice_payments_updated_at),
+    (4, 'Create secondary indexes', create_indexes),
+    (5, 'Create document_sequences', _create_document_sequences),
+    (6, 'Create shop_counters', _create_shop_counters),
+    (7, 'Add returned-quantity ledger', _add_return_ledger),
+    (8, 'Create receivables aging index and snapshots', _create_receivables_aging),
+    (9, 'Create invoice search index', _create_invoice_search_index),
+    (10, 'Create invoice archive tables', _create_invoice_archive),
+    (11, 'Add the expenses supplier foreign key on PostgreSQL', _add_expenses_supplier_key),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# Advisory lock key that serializes migrations across PostgreSQL clients
+_PG_MIGRATION_LOCK_KEY = 7290451
+
+def get_schema_version(conn):
+    """Get the schema version stamped in the database header"""
+    if DATABASE_BACKEND == 'postgres':
+        # PostgreSQL has no user_version; read the newest schema_version row
+        try:
+            row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+            return row[0] or 0
+        except sqlite3.OperationalError:
+            conn.rollback()
+            return 0
+    
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def init_db(database=None):
+    """Initialize a database (the catalog by default), applying pending schema migrations"""
+    pool = get_pool(database)
+    conn = PooledConnection(pool, pool.acquire())
+    
+    try:
+        # Warm start: an up-to-date database costs a single PRAGMA read
+        if get_schema_version(conn) >= SCHEMA_VERSION:
+            return
         
-        # Run migrations for existing databases
-        run_migrations(cursor)
-        
-        conn.commit()
-        print("Database initialized successfully")
+        applied = run_migrations(conn)
+        if applied:
+            print(f"Database migrated to schema version {SCHEMA_VERSION}")
         
     except Exception as e:
         print(f"Error initializing database: {e}")
-        conn.rollback()
     finally:
         conn.close()
 
-def run_migrations(cursor):
-    """Run database migrations for existing databases"""
+def run_migrations(conn):
+    """Apply pending migrations in order, once, under the database write lock
+
+    BEGIN IMMEDIATE takes SQLite's reserved lock (a transaction-scoped
+    advisory lock on PostgreSQL), so when several gunicorn workers boot
+    together only one of them migrates; the others wait and then see the
+    new version. Returns the list of applied versions.
+    """
+    cursor = conn.cursor()
+    if DATABASE_BACKEND == 'postgres':
+        cursor.execute('SELECT pg_advisory_xact_lock(?)', (_PG_MIGRATION_LOCK_KEY,))
+    else:
+        cursor.execute('BEGIN IMMEDIATE')
+    
     try:
-        # Check if original_invoice_id column exists in invoices table
-        cursor.execute("PRAGMA table_info(invoices)")
-        columns = [column[1] for column in cursor.fetchall()]
+        current_version = get_schema_version(conn) if DATABASE_BACKEND == 'sqlite' else None
         
-        if 'original_invoice_id' not in columns:
-            print("Adding original_invoice_id column to invoices table...")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        if current_version is None:
+            cursor.execute('SELECT MAX(version) FROM schema_version')
+            current_version = cursor.fetchone()[0] or 0
+        
+        pending = [m for m in MIGRATIONS if m[0] > current_version]
+        if not pending:
+            conn.commit()
+            return []
+        
+        for version, description, migrate in pending:
+            print(f"Applying migration {version}: {description}")
+            migrate(cursor)
             cursor.execute('''
-                ALTER TABLE invoices 
-                ADD COLUMN original_invoice_id INTEGER 
-                REFERENCES invoices (id)
-            ''')
-            print("Migration completed: original_invoice_id column added")
+                INSERT INTO schema_version (version, description)
+                VALUES (?, ?)
+            ''', (version, description))
         
-    except Exception as e:
-        print(f"Migration error: {e}")
-        # Continue without failing if migration fails
+        if DATABASE_BACKEND == 'sqlite':
+            # PRAGMA does not accept bound parameters; version is an int we control
+            cursor.execute(f'PRAGMA user_version = {int(pending[-1][0])}')
+        conn.commit()
+        return [m[0] for m in pending]
+        
+    except Exception:
+        conn.rollback()
+        raise
+
+# Dialect-specific SQL fragments for the few date expressions models need
+def sql_current_date(days=0):
+    """SQL expression for today's date, optionally shifted by whole days"""
+    if DATABASE_BACKEND == 'postgres':
+        return f"(CURRENT_DATE + {int(days)})"
+    return f"DATE('now', '{int(days):+d} days')"
+
+def sql_days_since(column, today=None):
+    """SQL expression for the whole days from a date column to today
+
+    today is an SQL expression for the end date, e.g. a '?' placeholder
+    bound to a date computed in Python; the database's current date (UTC
+    on SQLite) by default.
+    """
+    today = today or sql_current_date()
+    if DATABASE_BACKEND == 'postgres':
+        return f"(CAST({today} AS DATE) - CAST({column} AS DATE))"
+    return f"CAST(julianday({today}) - julianday({column}) AS INTEGER)"
+
+def sql_month_start():
+    """SQL expression for the first day of the current month"""
+    if DATABASE_BACKEND == 'postgres':
+        return "DATE_TRUNC('month', CURRENT_DATE)"
+    return "DATE('now', 'start of month')"
 
 # Initialize database on import
 if __name__ == "__main__":
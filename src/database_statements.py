@@ -0,0 +1,154 @@
+import threading
+from collections import OrderedDict
+from src.database_sqlite import DB_STATEMENT_CACHE_SIZE
+
+# Hot queries are registered here by name instead of being assembled ad hoc
+# in each model. Every combination of filters maps to one fixed SQL text, so
+# each variant is parsed once per pooled connection and then served from
+# that connection's statement cache.
+
+class Statement:
+    """A named query with optional filter clauses appended in a fixed order"""
+
+    def __init__(self, name, sql, filters=None, order_by=None):
+        self.name = name
+        self.sql = sql
+        self.filters = filters or {}
+        self.order_by = order_by
+        self._variants = {}
+
+    def variant(self, filters, paginate):
+        """Get the SQL text for a set of enabled filters"""
+        key = (filters, paginate)
+        text = self._variants.get(key)
+        if text is None:
+            text = self.sql
+            for name in filters:
+                text += f' AND {self.filters[name]}'
+            if self.order_by:
+                text += f' ORDER BY {self.order_by}'
+            if paginate:
+                text += ' LIMIT ? OFFSET ?'
+            self._variants[key] = text
+        return text
+
+class StatementRegistry:
+    """Registry of named statements with per-connection cache hit counters"""
+
+    def __init__(self, cache_size=DB_STATEMENT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._statements = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def register(self, name, sql, filters=None, order_by=None):
+        self._statements[name] = Statement(name, sql, filters, order_by)
+
+    def bind(self, name, params=(), filters=None, page=None):
+        """Build (sql, params) for a registered statement
+
+        filters maps filter names to their parameters; filters that are
+        absent or None are left out. page is a (limit, offset) pair.
+        """
+        statement = self._statements[name]
+        params = list(params)
+        enabled = []
+        for filter_name in statement.filters:
+            values = (filters or {}).get(filter_name)
+            if values is not None:
+                enabled.append(filter_name)
+                params.extend(values)
+        if page is not None:
+            params.extend(page)
+        return statement.variant(tuple(enabled), page is not None), params
+
+    def execute(self, cursor, name, params=(), filters=None, page=None):
+        """Execute a registered statement on a cursor"""
+        sql, params = self.bind(name, params, filters, page)
+        self._record(cursor.connection, sql)
+        return cursor.execute(sql, params)
+
+    def _record(self, conn, sql):
+        # Mirror the connection's LRU statement cache to count hits
+        prepared = getattr(conn, '_prepared_statements', None)
+        if prepared is None:
+            prepared = conn._prepared_statements = OrderedDict()
+        if sql in prepared:
+            prepared.move_to_end(sql)
+            hit = True
+        else:
+            prepared[sql] = True
+            if len(prepared) > self.cache_size:
+                prepared.popitem(last=False)
+            hit = False
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        """Statement cache counters for this worker process"""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'statements': len(self._statements),
+            'cache_size': self.cache_size,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total, 4) if total else None
+        }
+
+statements = StatementRegistry()
+
+_PRODUCT_SEARCH = '(name LIKE ? OR brand LIKE ? OR barcode LIKE ?)'
+_CUSTOMER_SEARCH = '(name LIKE ? OR phone LIKE ? OR email LIKE ?)'
+_INVOICE_SEARCH = '(i.invoice_number LIKE ? OR c.name LIKE ? OR c.phone LIKE ? OR i.notes LIKE ?)'
+# Same search through the invoices_fts trigram index (SQLite only)
+_INVOICE_FTS = 'i.id IN (SELECT rowid FROM invoices_fts WHERE invoices_fts MATCH ?)'
+
+# Keyset pagination: 'after' resumes a listing just past the last row of the
+# previous page. The id tiebreaker keeps the order total, and the row-value
+# comparison seeks straight into the (shop_id, name) / (shop_id, created_at)
+# indexes instead of counting past an OFFSET.
+_NAME_AFTER = '(name, id) > (?, ?)'
+_CREATED_AFTER = '(i.created_at, i.id) < (?, ?)'
+
+statements.register(
+    'products.by_shop', 'SELECT * FROM products WHERE shop_id = ?',
+    filters={'active': 'is_active = TRUE', 'search': _PRODUCT_SEARCH, 'category': 'category = ?',
+             'after': _NAME_AFTER},
+    order_by='name ASC, id ASC'
+)
+statements.register(
+    'products.count_by_shop', 'SELECT COUNT(*) FROM products WHERE shop_id = ?',
+    filters={'active': 'is_active = TRUE', 'search': _PRODUCT_SEARCH, 'category': 'category = ?'}
+)
+statements.register(
+    'customers.by_shop', 'SELECT * FROM customers WHERE shop_id = ?',
+    filters={'search': _CUSTOMER_SEARCH, 'after': _NAME_AFTER},
+    order_by='name ASC, id ASC'
+)
+statements.register(
+    'customers.count_by_shop', 'SELECT COUNT(*) FROM customers WHERE shop_id = ?',
+    filters={'search': _CUSTOMER_SEARCH}
+)
+statements.register(
+    'invoices.by_shop', '''
+        SELECT i.*, c.name as customer_name
+        FROM invoices i
+        LEFT JOIN customers c ON i.customer_id = c.id
+        WHERE i.shop_id = ?''',
+    filters={'status': 'i.status = ?', 'search': _INVOICE_SEARCH, 'fts': _INVOICE_FTS,
+             'after': _CREATED_AFTER},
+    order_by='i.created_at DESC, i.id DESC'
+)
+statements.register(
+    'invoices.count_by_shop', '''
+        SELECT COUNT(*) FROM invoices i
+        LEFT JOIN customers c ON i.customer_id = c.id
+        WHERE i.shop_id = ?''',
+    filters={'status': 'i.status = ?', 'search': _INVOICE_SEARCH, 'fts': _INVOICE_FTS}
+)
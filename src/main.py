@@ -6,7 +6,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from flask import Flask, send_from_directory, jsonify
 from flask_cors import CORS
 from src.models.user import db
-from src.database_sqlite import init_db
+from src.database_sqlite import init_db, init_request_scope
 
 # Import routes
 from src.routes.auth import auth_bp
@@ -29,6 +29,9 @@ CORS(app, supports_credentials=True, origins=cors_origins)
 # Initialize database
 init_db()
 
+# Share one database connection and transaction per request
+init_request_scope(app)
+
 # Register blueprints
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(admin_bp, url_prefix='/api/admin')
@@ -0,0 +1,156 @@
+from datetime import date
+from src.database_sqlite import (
+    get_catalog_connection, get_db_connection, run_write_transaction, sql_days_since
+)
+
+# Buckets by days past the due date (the invoice date when there is none);
+# invoices not yet due fall in the first bucket.
+AGING_BUCKETS = ('days_0_30', 'days_31_60', 'days_61_90', 'days_90_plus')
+
+# Days are counted to a bound as-of date rather than the database's
+# DATE('now'), which is UTC on SQLite and would disagree with the report's
+# local as_of around midnight
+_DAYS_OVERDUE = sql_days_since('COALESCE(due_date, invoice_date)', today='?')
+
+# Per-customer bucket sums over a shop's open invoices, which are read
+# through idx_invoices_shop_status_due. Parameters are the as-of date and
+# the shop id; {customer_filter} narrows it to one customer. Return
+# invoices carry a negative balance and are left out, as in a customer's
+# outstanding balance and the dashboard's pending amount, so the report
+# agrees with both.
+_AGING_QUERY = f'''
+    SELECT COALESCE(customer_id, 0) AS customer_id,
+           COUNT(*) AS invoice_count,
+           SUM(CASE WHEN days <= 30 THEN balance_amount ELSE 0 END) AS days_0_30,
+           SUM(CASE WHEN days BETWEEN 31 AND 60 THEN balance_amount ELSE 0 END) AS days_31_60,
+           SUM(CASE WHEN days BETWEEN 61 AND 90 THEN balance_amount ELSE 0 END) AS days_61_90,
+           SUM(CASE WHEN days > 90 THEN balance_amount ELSE 0 END) AS days_90_plus,
+           SUM(balance_amount) AS total
+    FROM (
+        SELECT customer_id, balance_amount, {_DAYS_OVERDUE} AS days
+        FROM invoices
+        WHERE shop_id = ? AND status IN ('pending', 'partial') AND balance_amount > 0{{customer_filter}}
+    ) open_invoices
+    GROUP BY COALESCE(customer_id, 0)
+'''
+
+class ReceivablesAging:
+    """Outstanding invoice balances by customer and days overdue"""
+
+    @classmethod
+    def compute(cls, shop_id, customer_id=None, as_of=None):
+        """Compute the aging report for a shop from its open invoices, as of today by default"""
+        as_of = (as_of or date.today()).isoformat()
+        params = [as_of, shop_id]
+        customer_filter = ''
+        if customer_id is not None:
+            customer_filter = ' AND customer_id = ?'
+            params.append(customer_id)
+        
+        with get_db_connection(shop_id) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT a.*, c.name
+                FROM ({_AGING_QUERY.format(customer_filter=customer_filter)}) a
+                LEFT JOIN customers c ON c.id = a.customer_id
+            ''', params)
+            return cls._report(as_of, cursor.fetchall())
+
+    @classmethod
+    def take_snapshot(cls, shop_id):
+        """Store today's aging report for a shop, replacing an earlier one from today"""
+        today = date.today().isoformat()
+        
+        def write(conn):
+            cursor = conn.cursor()
+            cursor.execute('''
+                DELETE FROM receivables_aging_snapshots
+                WHERE shop_id = ? AND snapshot_date = ?
+            ''', (shop_id, today))
+            cursor.execute(f'''
+                INSERT INTO receivables_aging_snapshots (
+                    shop_id, snapshot_date, customer_id, invoice_count,
+                    days_0_30, days_31_60, days_61_90, days_90_plus, total
+                )
+                SELECT ?, ?, a.*
+                FROM ({_AGING_QUERY.format(customer_filter='')}) a
+            ''', (shop_id, today, today, shop_id))
+            return cursor.rowcount
+        
+        return run_write_transaction(write, shop_id=shop_id)
+
+    @classmethod
+    def get_snapshot(cls, shop_id, snapshot_date=None, customer_id=None):
+        """Get a stored aging report (the latest by default), or None if there is none"""
+        with get_db_connection(shop_id) as conn:
+            cursor = conn.cursor()
+            if snapshot_date is None:
+                cursor.execute('''
+                    SELECT MAX(snapshot_date) FROM receivables_aging_snapshots WHERE shop_id = ?
+                ''', (shop_id,))
+                snapshot_date = cursor.fetchone()[0]
+                if snapshot_date is None:
+                    return None
+            else:
+                cursor.execute('''
+                    SELECT 1 FROM receivables_aging_snapshots WHERE shop_id = ? AND snapshot_date = ?
+                ''', (shop_id, snapshot_date))
+                if cursor.fetchone() is None:
+                    return None
+            
+            query = '''
+                SELECT s.customer_id, s.invoice_count, s.days_0_30, s.days_31_60,
+                       s.days_61_90, s.days_90_plus, s.total, c.name
+                FROM receivables_aging_snapshots s
+                LEFT JOIN customers c ON c.id = s.customer_id
+                WHERE s.shop_id = ? AND s.snapshot_date = ?
+            '''
+            params = [shop_id, snapshot_date]
+            if customer_id is not None:
+                query += ' AND s.customer_id = ?'
+                params.append(customer_id)
+            cursor.execute(query, params)
+            return cls._report(str(snapshot_date), cursor.fetchall())
+
+    @staticmethod
+    def _report(as_of, rows):
+        """Shape (customer_id, invoice_count, buckets..., total, name) rows into a report"""
+        customers = []
+        totals = dict.fromkeys(AGING_BUCKETS + ('total',), 0.0)
+        invoice_count = 0
+        for row in rows:
+            amounts = {name: round(float(value or 0), 2) for name, value in zip(AGING_BUCKETS + ('total',), row[2:7])}
+            customers.append({
+                'customer_id': row[0] or None,
+                'customer_name': row[7] if row[0] else 'Walk-in',
+                'invoice_count': row[1],
+                **amounts
+            })
+            for name, value in amounts.items():
+                totals[name] += value
+            invoice_count += row[1]
+        
+        customers.sort(key=lambda customer: customer['total'], reverse=True)
+        return {
+            'as_of': as_of,
+            'shop': {
+                'invoice_count': invoice_count,
+                **{name: round(value, 2) for name, value in totals.items()}
+            },
+            'customers': customers
+        }
+
+def snapshot_all_shops():
+    """Take today's aging snapshot for every shop"""
+    with get_catalog_connection() as conn:
+        shop_ids = [row[0] for row in conn.execute('SELECT id FROM shops ORDER BY id').fetchall()]
+    for shop_id in shop_ids:
+        try:
+            rows = ReceivablesAging.take_snapshot(shop_id)
+            print(f"Aging snapshot for shop {shop_id}: {rows} customers")
+        except Exception as e:
+            print(f"Error taking aging snapshot for shop {shop_id}: {e}")
+
+# Nightly snapshot, e.g. from cron: `python -m src.models.aging`
+if __name__ == "__main__":
+    snapshot_all_shops()
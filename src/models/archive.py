@@ -0,0 +1,170 @@
+import os
+from datetime import date, timedelta
+from src.database_sqlite import (
+    ARCHIVE_SCHEMA, ARCHIVED_TABLES, DATABASE_BACKEND, DB_SHARDING, checkpoint_wal,
+    get_catalog_connection, get_column_names, get_shard_path, run_write_transaction
+)
+from src.models.counter import ShopCounter
+from src.models.invoice import IN_LIST_BATCH_SIZE
+
+# Fully paid invoices dated more than this many days ago are moved to the
+# archive, together with their items, payments and return invoices
+INVOICE_ARCHIVE_AFTER_DAYS = int(os.environ.get('INVOICE_ARCHIVE_AFTER_DAYS', 365))
+
+# Invoices moved per write transaction, so the write lock is held briefly
+INVOICE_ARCHIVE_BATCH_SIZE = int(os.environ.get('INVOICE_ARCHIVE_BATCH_SIZE', 200))
+
+# An invoice qualifies once it is paid and neither it nor any of its
+# returns was dated or entered on or after the cutoff. Returns are only
+# moved along with their original. Parameters: shop_id and the cutoff
+# four times.
+_ARCHIVABLE = '''
+    shop_id = ? AND status = 'paid' AND original_invoice_id IS NULL
+    AND invoice_date < ? AND created_at < ?
+    AND NOT EXISTS (
+        SELECT 1 FROM invoices r
+        WHERE r.original_invoice_id = i.id AND (r.invoice_date >= ? OR r.created_at >= ?)
+    )
+'''
+
+def _execute_in(cursor, query, values):
+    """Run a statement whose {placeholders} is an IN list, in batches"""
+    for start in range(0, len(values), IN_LIST_BATCH_SIZE):
+        batch = values[start:start + IN_LIST_BATCH_SIZE]
+        cursor.execute(query.format(placeholders=', '.join('?' * len(batch))), batch)
+
+class InvoiceArchive:
+    """Moves old paid invoices out of the hot tables into the archive"""
+
+    @classmethod
+    def archive_shop(cls, shop_id, before=None, batch_size=INVOICE_ARCHIVE_BATCH_SIZE):
+        """Archive a shop's paid invoices dated before a cutoff, returning how many were moved
+
+        before defaults to INVOICE_ARCHIVE_AFTER_DAYS ago. Each batch is
+        copied in one write transaction and deleted in a second. Archived invoices stay readable through
+        Invoice.get_by_id() and the customer history, and in the dashboard's
+        lifetime totals, but leave the invoice listings, search and counts.
+        """
+        before = str(before or date.today() - timedelta(days=INVOICE_ARCHIVE_AFTER_DAYS))
+        archived = 0
+        while True:
+            originals, invoice_ids = run_write_transaction(
+                lambda conn: cls._copy_batch(conn.cursor(), shop_id, before, batch_size),
+                shop_id=shop_id, standalone=True
+            )
+            if originals:
+                archived += run_write_transaction(
+                    lambda conn: cls._delete_batch(conn.cursor(), shop_id, before, originals, invoice_ids),
+                    shop_id=shop_id, standalone=True
+                )
+            if len(originals) < batch_size:
+                return archived
+
+    @classmethod
+    def _copy_batch(cls, cursor, shop_id, before, batch_size):
+        """Copy one batch of archivable invoices into the archive
+
+        Returns (original ids, ids of the originals and their returns).
+        The copy is committed on its own, before anything is deleted: on
+        SQLite each attached database commits separately, so a transaction
+        writing both files could lose the hot rows without an archived copy.
+        This one writes only the archive, and replaces earlier copies, so a
+        crash leaves at worst rows in both places. Reads prefer the hot
+        copy, and the next run copies and deletes them again.
+        """
+        cursor.execute(f'SELECT id FROM invoices i WHERE {_ARCHIVABLE} ORDER BY id LIMIT ?',
+                       (shop_id, before, before, before, before, batch_size))
+        originals = [row[0] for row in cursor.fetchall()]
+        if not originals:
+            return [], []
+
+        cursor.execute(f'''
+            SELECT id FROM invoices
+            WHERE original_invoice_id IN ({', '.join('?' * len(originals))})
+        ''', originals)
+        invoice_ids = originals + [row[0] for row in cursor.fetchall()]
+
+        for table, key in ARCHIVED_TABLES:
+            columns = ', '.join(get_column_names(cursor, table))
+            _execute_in(cursor, f'''
+                DELETE FROM {ARCHIVE_SCHEMA}.{table} WHERE {key} IN ({{placeholders}})
+            ''', invoice_ids)
+            _execute_in(cursor, f'''
+                INSERT INTO {ARCHIVE_SCHEMA}.{table} ({columns})
+                SELECT {columns} FROM {table} WHERE {key} IN ({{placeholders}})
+            ''', invoice_ids)
+        return originals, invoice_ids
+
+    @classmethod
+    def _delete_batch(cls, cursor, shop_id, before, originals, invoice_ids):
+        """Delete copied invoices from the hot tables, returning the number of originals moved
+
+        An invoice that stopped qualifying since it was copied, or gained a
+        return that was not copied with it, stays in the hot tables; its
+        archived copy is replaced when it is archived again.
+        """
+        cursor.execute(f'''
+            SELECT id FROM invoices i
+            WHERE {_ARCHIVABLE} AND id IN ({', '.join('?' * len(originals))})
+        ''', (shop_id, before, before, before, before, *originals))
+        originals = {row[0] for row in cursor.fetchall()}
+        if not originals:
+            return 0
+        cursor.execute(f'''
+            SELECT id, original_invoice_id FROM invoices
+            WHERE original_invoice_id IN ({', '.join('?' * len(originals))})
+        ''', list(originals))
+        returns = cursor.fetchall()
+        originals -= {row[1] for row in returns if row[0] not in set(invoice_ids)}
+        if not originals:
+            return 0
+
+        moved = sorted(originals) + [row[0] for row in returns if row[1] in originals]
+        cursor.execute(f'''
+            SELECT COALESCE(SUM(total_amount), 0) FROM invoices
+            WHERE id IN ({', '.join('?' * len(moved))})
+        ''', moved)
+        total_amount = float(cursor.fetchone()[0] or 0)
+        for table, key in reversed(ARCHIVED_TABLES):
+            _execute_in(cursor, f'DELETE FROM {table} WHERE {key} IN ({{placeholders}})', moved)
+
+        ShopCounter.add(cursor, shop_id, 'invoices', -len(moved))
+        cursor.execute('''
+            INSERT INTO invoice_archive_totals (shop_id, invoice_count, total_amount)
+            VALUES (?, ?, ?)
+            ON CONFLICT (shop_id) DO UPDATE SET
+                invoice_count = invoice_archive_totals.invoice_count + excluded.invoice_count,
+                total_amount = invoice_archive_totals.total_amount + excluded.total_amount
+        ''', (shop_id, len(moved), total_amount))
+        return len(originals)
+
+def archive_all_shops(before=None):
+    """Archive old paid invoices of every shop, then checkpoint the WAL
+
+    Archiving rewrites many pages, so the WAL is checkpointed and truncated
+    once the run is done instead of staying at its grown size.
+    """
+    with get_catalog_connection() as conn:
+        shop_ids = [row[0] for row in conn.execute('SELECT id FROM shops ORDER BY id').fetchall()]
+    databases = set()
+    for shop_id in shop_ids:
+        try:
+            archived = InvoiceArchive.archive_shop(shop_id, before=before)
+            print(f"Archived {archived} invoices for shop {shop_id}")
+            databases.add(get_shard_path(shop_id) if DB_SHARDING else None)
+        except Exception as e:
+            print(f"Error archiving invoices for shop {shop_id}: {e}")
+    
+    if DATABASE_BACKEND != 'sqlite':
+        return
+    for database in databases:
+        try:
+            busy, wal_pages, checkpointed = checkpoint_wal('TRUNCATE', database)
+            print(f"Checkpointed {checkpointed} of {wal_pages} WAL pages"
+                  f"{' (busy, will retry at the next autocheckpoint)' if busy else ''}")
+        except Exception as e:
+            print(f"Error checkpointing the WAL: {e}")
+
+# Nightly archiving, e.g. from cron: `python -m src.models.archive`
+if __name__ == "__main__":
+    archive_all_shops()
@@ -0,0 +1,53 @@
+class Model:
+    """Base class for slotted models that are hydrated straight from cursor rows
+
+    Subclasses list their table columns in _fields and the optional
+    attributes that joins add (e.g. customer_name) in _extras, and declare
+    __slots__ = _fields + _extras. Columns are matched by name, so extra
+    or reordered columns (e.g. added by a migration) are handled.
+    """
+    __slots__ = ()
+    _fields = ()
+    _extras = ()
+
+    @classmethod
+    def row_factory(cls, description):
+        """Build a sqlite3 row factory for a result set with this description"""
+        setters = []
+        for column in description:
+            if column[0] in cls._fields or column[0] in cls._extras:
+                setters.append(getattr(cls, column[0]).__set__)
+            else:
+                setters.append(None)
+        # Columns missing from the result set default to None; extras stay unset
+        selected = {column[0] for column in description}
+        missing = [getattr(cls, name).__set__ for name in cls._fields if name not in selected]
+        new = cls.__new__
+
+        def factory(cursor, row):
+            obj = new(cls)
+            for setter, value in zip(setters, row):
+                if setter is not None:
+                    setter(obj, value)
+            for setter in missing:
+                setter(obj, None)
+            return obj
+        return factory
+
+    @classmethod
+    def fetch_one(cls, cursor):
+        """Fetch the next row of an executed cursor as an instance"""
+        cursor.row_factory = cls.row_factory(cursor.description)
+        try:
+            return cursor.fetchone()
+        finally:
+            cursor.row_factory = None
+
+    @classmethod
+    def fetch_all(cls, cursor):
+        """Fetch the remaining rows of an executed cursor as instances"""
+        cursor.row_factory = cls.row_factory(cursor.description)
+        try:
+            return cursor.fetchall()
+        finally:
+            cursor.row_factory = None
@@ -0,0 +1,94 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from src.database_statements import statements
+
+# List totals: 'estimate' (default) answers unfiltered totals from the shop
+# counters and filtered ones from a short-lived cache, 'exact' always runs
+# COUNT(*), and 'none' skips the count for clients that only need has_more.
+COUNT_MODES = ('estimate', 'exact', 'none')
+COUNT_CACHE_TTL = float(os.environ.get('COUNT_CACHE_TTL', 30))
+COUNT_CACHE_SIZE = int(os.environ.get('COUNT_CACHE_SIZE', 1024))
+
+class ShopCounter:
+    """Per-shop row counts kept in step with inserts and deletes
+
+    Counted: 'customers', 'products' (active only) and 'invoices'. Every
+    write that adds or removes one of these rows adjusts its counter on the
+    same cursor, so the count commits or rolls back with the row.
+    """
+
+    @classmethod
+    def add(cls, cursor, shop_id, name, delta=1):
+        """Adjust a shop's counter by delta"""
+        if not delta:
+            return
+        cursor.execute('''
+            INSERT INTO shop_counters (shop_id, name, value)
+            VALUES (?, ?, ?)
+            ON CONFLICT (shop_id, name)
+            DO UPDATE SET value = shop_counters.value + excluded.value
+        ''', (shop_id, name, delta))
+
+    @classmethod
+    def get(cls, cursor, shop_id, name):
+        """Get a shop's counter; shops without rows have no counter yet"""
+        cursor.execute('''
+            SELECT value FROM shop_counters WHERE shop_id = ? AND name = ?
+        ''', (shop_id, name))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+class CountCache:
+    """Filtered list counts kept for a few seconds, per worker process"""
+
+    def __init__(self, ttl=COUNT_CACHE_TTL, size=COUNT_CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+count_cache = CountCache()
+
+def count_rows(cursor, statement, shop_id, filters=None, mode='estimate', counter=None):
+    """Get the total for a shop's list page, or None in 'none' mode
+
+    statement is a registered COUNT statement taking shop_id and filters.
+    counter names the ShopCounter that holds the unfiltered total; pass it
+    only when no filter narrows the list.
+    """
+    if mode == 'none':
+        return None
+    if mode == 'estimate' and counter:
+        return ShopCounter.get(cursor, shop_id, counter)
+    
+    sql, params = statements.bind(statement, [shop_id], filters)
+    key = (sql, tuple(params))
+    if mode == 'estimate':
+        total = count_cache.get(key)
+        if total is not None:
+            return total
+    
+    statements.execute(cursor, statement, [shop_id], filters)
+    total = cursor.fetchone()[0]
+    count_cache.set(key, total)
+    return total
@@ -1,8 +1,15 @@
 import sqlite3
 from datetime import datetime
-from src.database_sqlite import get_db_connection
+from src.database_sqlite import ARCHIVE_SCHEMA, get_db_connection
+from src.database_statements import statements
+from src.models.base import Model
+from src.models.counter import ShopCounter
+
+class Customer(Model):
+    _fields = ('id', 'shop_id', 'name', 'phone', 'email', 'address', 'city', 'state', 'pincode',
+               'gst_number', 'created_at', 'updated_at')
+    __slots__ = _fields
 
-class Customer:
     def __init__(self, id=None, shop_id=None, name=None, phone=None, email=None,
                  address=None, city=None, state=None, pincode=None, gst_number=None,
                  created_at=None, updated_at=None):
@@ -34,9 +41,10 @@ class Customer:
                 customer_data.get('city'), customer_data.get('state'),
                 customer_data.get('pincode'), customer_data.get('gst_number')
             ))
+            customer_id = cursor.lastrowid
+            ShopCounter.add(cursor, shop_id, 'customers')
             conn.commit()
             
-            customer_id = cursor.lastrowid
             return cls.get_by_id(customer_id)
 
     @classmethod
@@ -45,39 +53,21 @@ class Customer:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM customers WHERE id = ?', (customer_id,))
-            row = cursor.fetchone()
-            
-            if row:
-                return cls(*row)
-            return None
+            return cls.fetch_one(cursor)
 
     @classmethod
-    def get_by_shop_id(cls, shop_id, limit=None, offset=None, search=None):
-        """Get customers by shop ID with optional search"""
+    def get_by_shop_id(cls, shop_id, limit=None, offset=None, search=None, after=None):
+        """Get customers by shop ID with optional search
+
+        after is a (name, id) keyset to list the customers following.
+        """
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            
-            query = 'SELECT * FROM customers WHERE shop_id = ?'
-            params = [shop_id]
-            
-            if search:
-                query += ' AND (name LIKE ? OR phone LIKE ? OR email LIKE ?)'
-                search_term = f'%{search}%'
-                params.extend([search_term, search_term, search_term])
-            
-            query += ' ORDER BY name ASC'
-            
-            if limit:
-                query += ' LIMIT ?'
-                params.append(limit)
-                if offset:
-                    query += ' OFFSET ?'
-                    params.append(offset)
-            
-            cursor.execute(query, params)
-            rows = cursor.fetchall()
-            
-            return [cls(*row) for row in rows]
+            statements.execute(cursor, 'customers.by_shop', [shop_id], filters={
+                'search': [f'%{search}%'] * 3 if search else None,
+                'after': list(after) if after else None
+            }, page=(limit, offset or 0) if limit else None)
+            return cls.fetch_all(cursor)
 
     @classmethod
     def search_by_phone(cls, shop_id, phone):
@@ -88,9 +78,7 @@ class Customer:
                 SELECT * FROM customers 
                 WHERE shop_id = ? AND phone LIKE ?
             ''', (shop_id, f'%{phone}%'))
-            rows = cursor.fetchall()
-            
-            return [cls(*row) for row in rows]
+            return cls.fetch_all(cursor)
 
     def update(self, **kwargs):
         """Update customer fields"""
@@ -127,40 +115,43 @@ class Customer:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM customers WHERE id = ?', (self.id,))
+            deleted = cursor.rowcount
+            ShopCounter.add(cursor, self.shop_id, 'customers', -deleted)
             conn.commit()
-            return cursor.rowcount > 0
+            return deleted > 0
 
     def get_invoices(self, limit=None):
-        """Get customer's invoices"""
+        """Get customer's invoices, archived ones included"""
+        from src.models.invoice import Invoice
         with get_db_connection() as conn:
             cursor = conn.cursor()
             
-            query = '''
-                SELECT * FROM invoices 
+            columns = ', '.join(Invoice._fields)
+            query = f'''
+                SELECT {columns}, 0 AS archived FROM invoices 
+                WHERE customer_id = ? 
+                UNION ALL
+                SELECT {columns}, 1 AS archived FROM {ARCHIVE_SCHEMA}.invoices 
                 WHERE customer_id = ? 
                 ORDER BY invoice_date DESC
             '''
-            params = [self.id]
+            params = [self.id, self.id]
             
             if limit:
                 query += ' LIMIT ?'
                 params.append(limit)
             
             cursor.execute(query, params)
-            rows = cursor.fetchall()
-            
-            from src.models.invoice import Invoice
-            return [Invoice(*row) for row in rows]
+            return Invoice.fetch_all(cursor)
 
     def get_total_purchases(self):
         """Get total purchase amount for customer"""
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT COALESCE(SUM(total_amount), 0) 
-                FROM invoices 
-                WHERE customer_id = ?
-            ''', (self.id,))
+            cursor.execute(f'''
+                SELECT (SELECT COALESCE(SUM(total_amount), 0) FROM invoices WHERE customer_id = ?)
+                     + (SELECT COALESCE(SUM(total_amount), 0) FROM {ARCHIVE_SCHEMA}.invoices WHERE customer_id = ?)
+            ''', (self.id, self.id))
             return float(cursor.fetchone()[0])
 
     def get_outstanding_balance(self):
@@ -1,13 +1,19 @@
 import sqlite3
 from datetime import datetime
 from src.database_sqlite import get_db_connection
+from src.models.base import Model
 
 def format_datetime(dt):
     if isinstance(dt, str):
         return dt
     return dt.isoformat() if dt else None
 
-class Expense:
+class Expense(Model):
+    _fields = ('id', 'shop_id', 'title', 'amount', 'category', 'supplier_id', 'date', 'description',
+               'payment_method', 'created_at', 'updated_at')
+    _extras = ('supplier',)
+    __slots__ = _fields + _extras
+
     def __init__(self, id, shop_id, title, amount, category, supplier_id, date, description, payment_method, created_at, updated_at):
         self.id = id
         self.shop_id = shop_id
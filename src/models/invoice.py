@@ -1,12 +1,61 @@
+import hashlib
+import math
+import os
 import sqlite3
 from datetime import datetime, date
-from src.database_sqlite import get_db_connection
+from src.database_sqlite import (
+    ARCHIVE_SCHEMA, DB_FTS_SEARCH, fts_trigram_supported, get_db_connection, run_write_transaction
+)
+from src.database_statements import statements
+from src.models.base import Model
+from src.models.counter import ShopCounter
+from src.models.sequence import DocumentSequence, INVOICE_NUMBER_FORMAT, INVOICE_NUMBER_RESET
+
+# Invoices written per transaction by Invoice.bulk_import
+INVOICE_IMPORT_CHUNK_SIZE = int(os.environ.get('INVOICE_IMPORT_CHUNK_SIZE', 500))
+
+# Values bound per IN (...) list, well below SQLite's variable limit
+IN_LIST_BATCH_SIZE = 500
+
+PAYMENT_ALLOCATION_POLICIES = ('oldest_first', 'largest_first', 'explicit')
+
+class PaymentConflictError(Exception):
+    """A payment no longer fits the invoice's balance"""
+
+class InvalidImportRecord:
+    """Stands in for an imported record that could not be parsed"""
+
+    def __init__(self, error):
+        self.error = error
+
+def _fetch_in(cursor, query, params, values, model=None):
+    """Run a query whose {placeholders} is an IN list of values, after params
+
+    Rows are hydrated as model instances when a model is given.
+    """
+    values = list(values)
+    rows = []
+    for start in range(0, len(values), IN_LIST_BATCH_SIZE):
+        batch = values[start:start + IN_LIST_BATCH_SIZE]
+        cursor.execute(query.format(placeholders=', '.join('?' * len(batch))), list(params) + batch)
+        rows.extend(model.fetch_all(cursor) if model else cursor.fetchall())
+    return rows
+
+class Invoice(Model):
+    _fields = ('id', 'shop_id', 'customer_id', 'invoice_number', 'invoice_date', 'due_date',
+               'subtotal', 'tax_amount', 'discount_amount', 'total_amount', 'paid_amount',
+               'balance_amount', 'status', 'notes', 'original_invoice_id', 'returned_amount',
+               'created_at', 'updated_at')
+    # _customer, _items and _payments hold relations loaded by prefetch();
+    # archived is set on invoices read from the archive
+    _extras = ('customer_name', 'archived', '_customer', '_items', '_payments')
+    __slots__ = _fields + _extras
 
-class Invoice:
     def __init__(self, id=None, shop_id=None, customer_id=None, invoice_number=None,
                  invoice_date=None, due_date=None, subtotal=None, tax_amount=0,
                  discount_amount=0, total_amount=None, paid_amount=0, balance_amount=None,
-                 status='pending', notes=None, original_invoice_id=None, created_at=None, updated_at=None):
+                 status='pending', notes=None, original_invoice_id=None, returned_amount=0,
+                 created_at=None, updated_at=None):
         self.id = id
         self.shop_id = shop_id
         self.customer_id = customer_id
@@ -22,30 +71,34 @@ class Invoice:
         self.status = status
         self.notes = notes
         self.original_invoice_id = original_invoice_id
+        self.returned_amount = returned_amount
         self.created_at = created_at
         self.updated_at = updated_at
 
     @classmethod
-    def generate_invoice_number(cls, shop_id):
-        """Generate unique invoice number"""
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT COUNT(*) FROM invoices WHERE shop_id = ?
-            ''', (shop_id,))
-            count = cursor.fetchone()[0]
-            
-            today = date.today()
-            return f"INV-{shop_id}-{today.strftime('%Y%m%d')}-{count + 1:04d}"
+    def generate_invoice_number(cls, shop_id, cursor):
+        """Generate unique invoice number
+
+        Pass the cursor of the write transaction that creates the invoice;
+        the number comes from the shop's invoice sequence.
+        """
+        return DocumentSequence.next_number(
+            cursor, shop_id, 'invoice', INVOICE_NUMBER_FORMAT, INVOICE_NUMBER_RESET
+        )
 
     @classmethod
     def create(cls, shop_id, invoice_data, items_data):
         """Create a new invoice with items"""
-        with get_db_connection() as conn:
+        def write(conn):
             cursor = conn.cursor()
             
             # Generate invoice number if not provided
-            invoice_number = invoice_data.get('invoice_number') or cls.generate_invoice_number(shop_id)
+            invoice_number = invoice_data.get('invoice_number') or cls.generate_invoice_number(shop_id, cursor)
+            if invoice_data.get('invoice_number'):
+                # The UNIQUE constraint only covers the hot table
+                cursor.execute(f'SELECT 1 FROM {ARCHIVE_SCHEMA}.invoices WHERE invoice_number = ?', (invoice_number,))
+                if cursor.fetchone():
+                    raise Exception("Invoice number already exists")
             
             # Calculate totals
             subtotal = sum(float(item['quantity'] or 0) * float(item['unit_price'] or 0) for item in items_data)
@@ -82,36 +135,10 @@ class Invoice:
             ))
             
             invoice_id = cursor.lastrowid
+            ShopCounter.add(cursor, shop_id, 'invoices')
             
-            # Create invoice items
-            for item in items_data:
-                quantity = float(item['quantity'] or 0)
-                unit_price = float(item['unit_price'] or 0)
-                total_price = quantity * unit_price
-                
-                # Get product details
-                cursor.execute('SELECT name, unit FROM products WHERE id = ?', (item['product_id'],))
-                product_result = cursor.fetchone()
-                if not product_result:
-                    raise Exception(f"Product with ID {item['product_id']} not found")
-                
-                product_name, product_unit = product_result
-                
-                cursor.execute('''
-                    INSERT INTO invoice_items (
-                        invoice_id, product_id, product_name, unit, quantity, unit_price, total_price
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    invoice_id, item['product_id'], product_name, product_unit, quantity,
-                    unit_price, total_price
-                ))
-                
-                # Update product stock
-                cursor.execute('''
-                    UPDATE products 
-                    SET stock_quantity = stock_quantity - ?
-                    WHERE id = ?
-                ''', (int(quantity), item['product_id']))
+            # Create invoice items and take them out of stock
+            cls._add_items(cursor, shop_id, invoice_id, items_data, returned=False)
             
             # Record initial payment if provided
             if initial_payment > 0:
@@ -130,12 +157,311 @@ class Invoice:
                     reference_number, notes, datetime.now(), datetime.now()
                 ))
             
-            conn.commit()
-            return cls.get_by_id(invoice_id)
+            return invoice_id
+        
+        invoice_id = run_write_transaction(write, shop_id=shop_id)
+        return cls.get_by_id(invoice_id)
+
+    @classmethod
+    def bulk_import(cls, shop_id, records, adjust_stock=True, chunk_size=INVOICE_IMPORT_CHUNK_SIZE):
+        """Import invoices with their items and payments
+
+        records is any iterable of invoice dicts (as accepted by create(),
+        plus an optional 'payments' list), so a streamed body is never held
+        in memory at once. Valid records are written in chunks, each in its
+        own transaction using executemany. Returns a report with an error
+        entry for every record that was skipped.
+        """
+        report = {'imported': 0, 'failed': 0, 'errors': []}
+        
+        def fail(row, record, error):
+            report['failed'] += 1
+            report['errors'].append({
+                'row': row,
+                'invoice_number': record.get('invoice_number') if isinstance(record, dict) else None,
+                'error': error
+            })
+        
+        def flush(chunk):
+            try:
+                imported, errors = run_write_transaction(
+                    lambda conn: cls._import_chunk(conn, shop_id, chunk, adjust_stock),
+                    shop_id=shop_id, standalone=True
+                )
+            except Exception as e:
+                for row, record in chunk:
+                    fail(row, record, f"Database error: {e}")
+                return
+            report['imported'] += imported
+            for row, record, error in errors:
+                fail(row, record, error)
+        
+        chunk = []
+        for row, record in enumerate(records):
+            error = cls._validate_import_record(record)
+            if error:
+                fail(row, record, error)
+                continue
+            chunk.append((row, record))
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+        
+        report['errors'].sort(key=lambda error: error['row'])
+        return report
+
+    @staticmethod
+    def _validate_import_record(record):
+        """Check an imported invoice record, returning an error message or None"""
+        if isinstance(record, InvalidImportRecord):
+            return record.error
+        
+        if not isinstance(record, dict):
+            return "Invoice record must be a JSON object"
+        
+        if not record.get('invoice_date'):
+            return "Invoice date is required"
+        
+        # Must be checked here: a bad value inside a chunk's transaction
+        # would fail every record of the chunk
+        customer_id = record.get('customer_id')
+        if customer_id not in (None, '', 'walk-in') and not str(customer_id).isdecimal():
+            return "Invalid customer ID"
+        
+        items = record.get('items')
+        if not items or not isinstance(items, list):
+            return "Invoice items are required"
+        
+        for item in items:
+            if not isinstance(item, dict) or not all(key in item for key in ['product_id', 'quantity', 'unit_price']):
+                return "Invalid item data"
+            try:
+                int(item['product_id'])
+                if float(item['quantity'] or 0) <= 0 or float(item['unit_price'] or 0) <= 0:
+                    return "Quantity and unit price must be greater than 0"
+            except (ValueError, TypeError):
+                return "Invalid numeric values in items"
+        
+        payments = record.get('payments') or []
+        if not isinstance(payments, list):
+            return "Invalid payment data"
+        try:
+            for key in ('tax_amount', 'discount_amount', 'initial_payment'):
+                float(record.get(key, 0) or 0)
+            for payment in payments:
+                if float(payment.get('amount') or 0) <= 0:
+                    return "Payment amount must be positive"
+        except (ValueError, TypeError, AttributeError):
+            return "Invalid numeric values"
+        
+        return None
+
+    @classmethod
+    def _import_chunk(cls, conn, shop_id, chunk, adjust_stock):
+        """Write one chunk of validated import records, returning (imported, errors)"""
+        cursor = conn.cursor()
+        errors = []
+        
+        # Everything the chunk references, loaded with one query per table
+        products = {row[0]: (row[1], row[2]) for row in _fetch_in(
+            cursor, 'SELECT id, name, unit FROM products WHERE shop_id = ? AND id IN ({placeholders})',
+            [shop_id], {int(item['product_id']) for _, record in chunk for item in record['items']}
+        )}
+        customer_ids = {row[0] for row in _fetch_in(
+            cursor, 'SELECT id FROM customers WHERE shop_id = ? AND id IN ({placeholders})',
+            [shop_id], {int(record['customer_id']) for _, record in chunk
+                      if record.get('customer_id') not in (None, '', 'walk-in')}
+        )}
+        # Invoice numbers are unique across all shops, archived invoices included
+        numbers = {record['invoice_number'] for _, record in chunk if record.get('invoice_number')}
+        numbers_taken = {row[0] for table in ('invoices', f'{ARCHIVE_SCHEMA}.invoices') for row in _fetch_in(
+            cursor, f'SELECT invoice_number FROM {table} WHERE invoice_number IN ({{placeholders}})',
+            [], numbers
+        )}
+        
+        accepted = []
+        for row, record in chunk:
+            customer_id = record.get('customer_id')
+            customer_id = None if customer_id in (None, '', 'walk-in') else int(customer_id)
+            missing = [item['product_id'] for item in record['items'] if int(item['product_id']) not in products]
+            if missing:
+                errors.append((row, record, f"Product with ID {missing[0]} not found"))
+            elif customer_id is not None and customer_id not in customer_ids:
+                errors.append((row, record, f"Customer with ID {customer_id} not found"))
+            elif record.get('invoice_number') in numbers_taken:
+                errors.append((row, record, "Invoice number already exists"))
+            else:
+                if record.get('invoice_number'):
+                    numbers_taken.add(record['invoice_number'])
+                accepted.append((record, customer_id))
+        if not accepted:
+            return 0, errors
+        
+        # Records without a number get a block of numbers from the sequence
+        needed = sum(1 for record, _ in accepted if not record.get('invoice_number'))
+        generated = iter(DocumentSequence.next_numbers(
+            cursor, shop_id, 'invoice', INVOICE_NUMBER_FORMAT, INVOICE_NUMBER_RESET, count=needed
+        ) if needed else [])
+        numbers = [record.get('invoice_number') or next(generated) for record, _ in accepted]
+        
+        invoice_rows = []
+        for (record, customer_id), invoice_number in zip(accepted, numbers):
+            subtotal = sum(float(item['quantity']) * float(item['unit_price']) for item in record['items'])
+            tax_amount = float(record.get('tax_amount', 0) or 0)
+            discount_amount = float(record.get('discount_amount', 0) or 0)
+            total_amount = subtotal + tax_amount - discount_amount
+            paid_amount = float(record.get('initial_payment', 0) or 0) + sum(
+                float(payment['amount']) for payment in record.get('payments') or []
+            )
+            balance_amount = total_amount - paid_amount
+            
+            if balance_amount <= 0:
+                status = 'paid'
+            elif paid_amount > 0:
+                status = 'partial'
+            else:
+                status = 'pending'
+            
+            invoice_rows.append((
+                shop_id, customer_id, invoice_number, record['invoice_date'],
+                record.get('due_date'), subtotal, tax_amount, discount_amount, total_amount,
+                paid_amount, balance_amount, status, record.get('notes')
+            ))
+        
+        cursor.executemany('''
+            INSERT INTO invoices (
+                shop_id, customer_id, invoice_number, invoice_date, due_date,
+                subtotal, tax_amount, discount_amount, total_amount,
+                paid_amount, balance_amount, status, notes
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', invoice_rows)
+        ShopCounter.add(cursor, shop_id, 'invoices', len(invoice_rows))
+        
+        # executemany has no lastrowid per row; invoice numbers are unique
+        invoice_ids = {row[1]: row[0] for row in _fetch_in(
+            cursor, 'SELECT id, invoice_number FROM invoices WHERE shop_id = ? AND invoice_number IN ({placeholders})',
+            [shop_id], numbers
+        )}
+        
+        item_rows = []
+        payment_rows = []
+        stock_changes = {}
+        now = datetime.now()
+        for (record, _), invoice_number in zip(accepted, numbers):
+            invoice_id = invoice_ids[invoice_number]
+            for item in record['items']:
+                product_id = int(item['product_id'])
+                product_name, product_unit = products[product_id]
+                quantity = float(item['quantity'])
+                unit_price = float(item['unit_price'])
+                item_rows.append((
+                    invoice_id, product_id, product_name, product_unit, quantity,
+                    unit_price, quantity * unit_price
+                ))
+                stock_changes[product_id] = stock_changes.get(product_id, 0) - int(quantity)
+            
+            payments = list(record.get('payments') or [])
+            if float(record.get('initial_payment', 0) or 0) > 0:
+                payments.insert(0, {
+                    'amount': record['initial_payment'],
+                    'payment_method': record.get('payment_method', 'cash'),
+                    'payment_date': record.get('payment_date'),
+                    'reference_number': record.get('reference_number'),
+                    'notes': record.get('payment_notes', 'Initial payment')
+                })
+            for payment in payments:
+                payment_rows.append((
+                    invoice_id, float(payment['amount']), payment.get('payment_method', 'cash'),
+                    payment.get('payment_date') or record['invoice_date'],
+                    payment.get('reference_number'), payment.get('notes'), now, now
+                ))
+        
+        cursor.executemany('''
+            INSERT INTO invoice_items (
+                invoice_id, product_id, product_name, unit, quantity, unit_price, total_price
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', item_rows)
+        
+        if payment_rows:
+            cursor.executemany('''
+                INSERT INTO invoice_payments (
+                    invoice_id, amount, payment_method, payment_date,
+                    reference_number, notes, created_at, updated_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', payment_rows)
+        
+        if adjust_stock:
+            cls._apply_stock_changes(cursor, shop_id, stock_changes)
+        
+        return len(accepted), errors
+
+    @classmethod
+    def _add_items(cls, cursor, shop_id, invoice_id, items_data, returned):
+        """Insert invoice items and adjust stock with a fixed number of queries
+
+        Products are loaded with one IN query scoped to the shop, items are
+        inserted with executemany and stock is updated in one statement.
+        """
+        if not items_data:
+            return
+        
+        products = {row[0]: (row[1], row[2]) for row in _fetch_in(
+            cursor, 'SELECT id, name, unit FROM products WHERE shop_id = ? AND id IN ({placeholders})',
+            [shop_id], dict.fromkeys(int(item['product_id']) for item in items_data)
+        )}
+        
+        rows = []
+        stock_changes = {}
+        for item in items_data:
+            product_id = int(item['product_id'])
+            if product_id not in products:
+                raise Exception(f"Product with ID {item['product_id']} not found")
+            
+            product_name, product_unit = products[product_id]
+            quantity = float(item['quantity'] or 0)
+            unit_price = float(item['unit_price'] or 0)
+            if returned:
+                quantity = -quantity  # Negative quantity for return
+            rows.append((
+                invoice_id, product_id, product_name, product_unit, quantity,
+                unit_price, quantity * unit_price
+            ))
+            # Sales take stock out, returns add it back
+            stock_changes[product_id] = stock_changes.get(product_id, 0) + (
+                int(abs(quantity)) if returned else -int(quantity)
+            )
+        
+        cursor.executemany('''
+            INSERT INTO invoice_items (
+                invoice_id, product_id, product_name, unit, quantity, unit_price, total_price
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        
+        cls._apply_stock_changes(cursor, shop_id, stock_changes)
+
+    @staticmethod
+    def _apply_stock_changes(cursor, shop_id, stock_changes):
+        """Add {product_id: quantity} to product stock in one statement"""
+        cases = ' '.join('WHEN ? THEN ?' for _ in stock_changes)
+        params = [value for change in stock_changes.items() for value in change]
+        placeholders = ', '.join('?' * len(stock_changes))
+        cursor.execute(f'''
+            UPDATE products
+            SET stock_quantity = stock_quantity + CASE id {cases} END
+            WHERE shop_id = ? AND id IN ({placeholders})
+        ''', params + [shop_id] + list(stock_changes))
 
     @classmethod
     def create_return_invoice(cls, original_invoice_id, return_data, items_data):
-        """Create a return invoice (negative invoice) for returned items"""
+        """Create a return invoice (negative invoice) for returned items
+
+        Returned quantities are checked against, and booked on, the original
+        lines' returned-quantity ledger in the same transaction, so earlier
+        returns count. Raises ValueError for an item that was not sold on
+        the original invoice or exceeds the quantity still returnable.
+        """
         with get_db_connection() as conn:
             cursor = conn.cursor()
             
@@ -144,8 +470,16 @@ class Invoice:
             if not original_invoice:
                 raise Exception("Original invoice not found")
             
-            # Generate return invoice number
+            cls._book_returned_quantities(cursor, original_invoice_id, items_data)
+            
+            # Generate return invoice number; later returns get the next free suffix
+            cursor.execute('SELECT invoice_number FROM invoices WHERE original_invoice_id = ?', (original_invoice_id,))
+            taken = {row[0] for row in cursor.fetchall()}
             return_invoice_number = f"RET-{original_invoice.invoice_number}"
+            suffix = 1
+            while return_invoice_number in taken:
+                suffix += 1
+                return_invoice_number = f"RET-{original_invoice.invoice_number}-{suffix}"
             
             # Calculate totals (negative values for return)
             subtotal = -sum(float(item['quantity'] or 0) * float(item['unit_price'] or 0) for item in items_data)
@@ -170,209 +504,520 @@ class Invoice:
             ))
             
             return_invoice_id = cursor.lastrowid
+            ShopCounter.add(cursor, original_invoice.shop_id, 'invoices')
             
-            # Create return invoice items
-            for item in items_data:
-                quantity = -float(item['quantity'] or 0)  # Negative quantity for return
-                unit_price = float(item['unit_price'] or 0)
-                total_price = quantity * unit_price
-                
-                # Get product details
-                cursor.execute('SELECT name, unit FROM products WHERE id = ?', (item['product_id'],))
-                product_result = cursor.fetchone()
-                if not product_result:
-                    raise Exception(f"Product with ID {item['product_id']} not found")
-                
-                product_name, product_unit = product_result
-                
-                cursor.execute('''
-                    INSERT INTO invoice_items (
-                        invoice_id, product_id, product_name, unit, quantity, unit_price, total_price
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    return_invoice_id, item['product_id'], product_name, product_unit, quantity,
-                    unit_price, total_price
-                ))
-                
-                # Update product stock (add back returned items)
-                cursor.execute('''
-                    UPDATE products 
-                    SET stock_quantity = stock_quantity + ?
-                    WHERE id = ?
-                ''', (int(abs(quantity)), item['product_id']))
+            # Return totals are negative; the original keeps a positive running total
+            cursor.execute('''
+                UPDATE invoices 
+                SET returned_amount = returned_amount - ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (total_amount, original_invoice_id))
+            
+            # Create return invoice items (negative quantities) and add them back to stock
+            cls._add_items(cursor, original_invoice.shop_id, return_invoice_id, items_data, returned=True)
             
             conn.commit()
             return cls.get_by_id(return_invoice_id)
 
+    @staticmethod
+    def _book_returned_quantities(cursor, invoice_id, items_data):
+        """Validate returned items against the ledger and add them to it
+
+        A product sold on several lines is charged to its earliest lines
+        first. Each ledger update is conditional on the line still having
+        the quantity available, so concurrent returns cannot overbook it.
+        """
+        cursor.execute('''
+            SELECT id, product_id, quantity - returned_quantity
+            FROM invoice_items
+            WHERE invoice_id = ?
+            ORDER BY id
+        ''', (invoice_id,))
+        returnable = {}
+        for line_id, product_id, available in cursor.fetchall():
+            returnable.setdefault(product_id, []).append([line_id, float(available)])
+        
+        bookings = []
+        for item in items_data:
+            product_id = int(item['product_id'])
+            quantity = float(item.get('quantity') or 0)
+            lines = returnable.get(product_id)
+            if not lines:
+                raise ValueError(f"Product {product_id} not found in original invoice")
+            available = sum(line[1] for line in lines)
+            if quantity > available:
+                raise ValueError(
+                    f"Return quantity cannot exceed the {available:g} still returnable for product {product_id}"
+                )
+            for line in lines:
+                booked = min(quantity, line[1])
+                if booked <= 0:
+                    continue
+                line[1] -= booked
+                quantity -= booked
+                bookings.append((booked, line[0], booked))
+                if quantity <= 0:
+                    break
+        
+        if not bookings:
+            return
+        cursor.executemany('''
+            UPDATE invoice_items 
+            SET returned_quantity = returned_quantity + ?
+            WHERE id = ? AND quantity - returned_quantity >= ?
+        ''', bookings)
+        if cursor.rowcount != len(bookings):
+            raise ValueError("Items on this invoice were returned concurrently; please retry")
+
+    @classmethod
+    def rebuild_return_ledger(cls, cursor, invoice_ids):
+        """Recompute the returned-quantity ledger of invoices from their return invoices
+
+        Used to fill the ledger for existing data and after a return
+        invoice is deleted.
+        """
+        invoice_ids = list(dict.fromkeys(invoice_ids))
+        if not invoice_ids:
+            return
+        for start in range(0, len(invoice_ids), IN_LIST_BATCH_SIZE):
+            batch = invoice_ids[start:start + IN_LIST_BATCH_SIZE]
+            placeholders = ', '.join('?' * len(batch))
+            cursor.execute(f'''
+                UPDATE invoice_items SET returned_quantity = 0 WHERE invoice_id IN ({placeholders})
+            ''', batch)
+            cursor.execute(f'''
+                UPDATE invoices 
+                SET returned_amount = COALESCE((
+                    SELECT -SUM(r.total_amount) FROM invoices r WHERE r.original_invoice_id = invoices.id
+                ), 0)
+                WHERE id IN ({placeholders})
+            ''', batch)
+        
+        returned = _fetch_in(cursor, '''
+            SELECT r.original_invoice_id, ri.product_id, -SUM(ri.quantity)
+            FROM invoice_items ri
+            JOIN invoices r ON ri.invoice_id = r.id
+            WHERE r.original_invoice_id IN ({placeholders})
+            GROUP BY r.original_invoice_id, ri.product_id
+        ''', [], invoice_ids)
+        lines = {}
+        for line_id, invoice_id, product_id, quantity in _fetch_in(cursor, '''
+            SELECT id, invoice_id, product_id, quantity FROM invoice_items
+            WHERE invoice_id IN ({placeholders})
+            ORDER BY id
+        ''', [], invoice_ids):
+            lines.setdefault((invoice_id, product_id), []).append((line_id, float(quantity)))
+        
+        bookings = []
+        for invoice_id, product_id, quantity in returned:
+            product_lines = lines.get((invoice_id, product_id), [])
+            remaining = float(quantity)
+            for index, (line_id, line_quantity) in enumerate(product_lines):
+                # Anything returned beyond the lines' quantities stays on the last line
+                booked = remaining if index == len(product_lines) - 1 else min(remaining, line_quantity)
+                if booked <= 0:
+                    break
+                bookings.append((booked, line_id))
+                remaining -= booked
+        
+        if bookings:
+            cursor.executemany('UPDATE invoice_items SET returned_quantity = ? WHERE id = ?', bookings)
+
     @classmethod
     def get_by_id(cls, invoice_id):
-        """Get invoice by ID"""
+        """Get invoice by ID, from the archive if it has been archived"""
+        with get_db_connection() as conn:
+            return cls._fetch_with_archive(conn.cursor(), 'id = ?', (invoice_id,))
+
+    @classmethod
+    def _fetch_with_archive(cls, cursor, where, params):
+        """Fetch one invoice from the hot table, falling back to the archive"""
+        cursor.execute(f'SELECT * FROM invoices WHERE {where}', params)
+        invoice = cls.fetch_one(cursor)
+        if invoice is None:
+            cursor.execute(f'SELECT *, 1 AS archived FROM {ARCHIVE_SCHEMA}.invoices WHERE {where}', params)
+            invoice = cls.fetch_one(cursor)
+        return invoice
+
+    @classmethod
+    def get_by_shop_id(cls, shop_id, limit=None, offset=None, status=None, search=None, after=None):
+        """Get invoices by shop ID with optional filtering
+
+        after is a (created_at, id) keyset to list the invoices older than.
+        """
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM invoices WHERE id = ?', (invoice_id,))
-            row = cursor.fetchone()
-            
-            if row:
-                return cls(*row)
-            return None
+            filters = cls.search_filters(shop_id, status=status, search=search)
+            filters['after'] = list(after) if after else None
+            statements.execute(cursor, 'invoices.by_shop', [shop_id], filters=filters,
+                               page=(limit, offset or 0) if limit else None)
+            return cls.fetch_all(cursor)
+
+    @staticmethod
+    def search_filters(shop_id, status=None, search=None):
+        """Statement filters for listing (and counting) a shop's invoices
+
+        search matches the invoice number, customer name and phone, and
+        notes. Terms of three or more characters go through the invoices_fts
+        trigram index, which has the same case-insensitive substring
+        semantics as LIKE; shorter terms, and PostgreSQL, use LIKE.
+        """
+        filters = {'status': [status] if status else None, 'search': None, 'fts': None}
+        if search and len(search) >= 3 and DB_FTS_SEARCH and fts_trigram_supported():
+            phrase = search.replace('"', '""')
+            filters['fts'] = [
+                f'shop_key : "|{int(shop_id)}|" AND '
+                f'{{invoice_number customer_name customer_phone notes}} : "{phrase}"'
+            ]
+        elif search:
+            filters['search'] = [f'%{search}%'] * 4
+        return filters
 
     @classmethod
-    def get_by_shop_id(cls, shop_id, limit=None, offset=None, status=None, search=None):
-        """Get invoices by shop ID with optional filtering"""
+    def get_detail_version(cls, invoice_id, shop_id):
+        """Get a version tag for an invoice's detail view, or None if not found
+
+        A hash of the invoice, customer and return invoice rows, not of
+        their updated_at: CURRENT_TIMESTAMP only has one-second resolution
+        on SQLite, so two edits within a second would share a version.
+        Payments and returned quantities show up in the invoice's amounts.
+        """
         with get_db_connection() as conn:
             cursor = conn.cursor()
+            for table in ('invoices', f'{ARCHIVE_SCHEMA}.invoices'):
+                cursor.execute(f'''
+                    SELECT i.*, c.*
+                    FROM {table} i
+                    LEFT JOIN customers c ON i.customer_id = c.id
+                    WHERE i.id = ? AND i.shop_id = ?
+                ''', (invoice_id, shop_id))
+                row = cursor.fetchone()
+                if row:
+                    cursor.execute(f'''
+                        SELECT * FROM {table} WHERE original_invoice_id = ? ORDER BY id
+                    ''', (invoice_id,))
+                    returns = [tuple(return_row) for return_row in cursor.fetchall()]
+                    content = repr((table, tuple(row), returns))
+                    return hashlib.sha1(content.encode()).hexdigest()[:20]
+            return None
+
+    @classmethod
+    def get_detail(cls, invoice_id, shop_id):
+        """Get an invoice with its customer, items, payments and return invoices
+
+        Everything is read on one connection, so a GET request sees a single
+        consistent snapshot. Returns (invoice, returns), or None if not found.
+        """
+        with get_db_connection() as conn:
+            invoice = cls._fetch_with_archive(conn.cursor(), 'id = ? AND shop_id = ?', (invoice_id, shop_id))
+            if not invoice:
+                return None
             
-            query = '''
-                SELECT i.*, c.name as customer_name 
-                FROM invoices i 
-                LEFT JOIN customers c ON i.customer_id = c.id 
-                WHERE i.shop_id = ?
-            '''
-            params = [shop_id]
-            
-            if status:
-                query += ' AND i.status = ?'
-                params.append(status)
-            
-            if search:
-                query += ' AND (i.invoice_number LIKE ? OR c.name LIKE ?)'
-                search_term = f'%{search}%'
-                params.extend([search_term, search_term])
-            
-            query += ' ORDER BY i.created_at DESC'
-            
-            if limit:
-                query += ' LIMIT ?'
-                params.append(limit)
-                if offset:
-                    query += ' OFFSET ?'
-                    params.append(offset)
-            
-            cursor.execute(query, params)
-            rows = cursor.fetchall()
-            
-            invoices = []
-            for row in rows:
-                invoice = cls(*row[:-1])  # Exclude customer_name from constructor
-                invoice.customer_name = row[-1]  # Add customer_name as attribute
-                invoices.append(invoice)
-            
-            return invoices
+            cls.prefetch([invoice], items=True, payments=True)
+            returns = cls.prefetch(invoice.get_return_invoices(), customers=False, items=True)
+            return invoice, returns
 
     @classmethod
     def get_by_customer_id(cls, customer_id, shop_id):
-        """Get invoices by customer ID for a specific shop"""
+        """Get invoices by customer ID for a specific shop, archived ones included"""
         with get_db_connection() as conn:
             cursor = conn.cursor()
             
-            query = '''
-                SELECT i.*, c.name as customer_name 
+            columns = ', '.join(f'i.{name} AS {name}' for name in cls._fields)
+            query = f'''
+                SELECT {columns}, c.name as customer_name, 0 AS archived
                 FROM invoices i 
                 LEFT JOIN customers c ON i.customer_id = c.id 
                 WHERE i.customer_id = ? AND i.shop_id = ?
-                ORDER BY i.created_at DESC
+                UNION ALL
+                SELECT {columns}, c.name as customer_name, 1 AS archived
+                FROM {ARCHIVE_SCHEMA}.invoices i 
+                LEFT JOIN customers c ON i.customer_id = c.id 
+                WHERE i.customer_id = ? AND i.shop_id = ?
+                ORDER BY created_at DESC
             '''
             
-            cursor.execute(query, (customer_id, shop_id))
-            rows = cursor.fetchall()
+            cursor.execute(query, (customer_id, shop_id, customer_id, shop_id))
+            return cls.fetch_all(cursor)
+
+    @classmethod
+    def prefetch(cls, invoices, customers=True, items=False, payments=False):
+        """Load related rows for a list of invoices with one query per relation
+
+        get_customer(), get_items() and get_payments() (and so to_dict())
+        then use the loaded rows instead of querying once per invoice.
+        """
+        if not invoices:
+            return invoices
+        
+        from src.models.customer import Customer
+        from src.models.payment import InvoicePayment
+        invoice_ids = [invoice.id for invoice in invoices]
+        # Archived invoices keep their items and payments in the archive
+        sources = [(prefix, ids) for prefix, ids in (
+            ('', [invoice.id for invoice in invoices if not invoice.is_archived()]),
+            (f'{ARCHIVE_SCHEMA}.', [invoice.id for invoice in invoices if invoice.is_archived()])
+        ) if ids]
+        
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            
+            if customers:
+                customer_ids = {invoice.customer_id for invoice in invoices if invoice.customer_id}
+                by_id = {customer.id: customer for customer in _fetch_in(
+                    cursor, 'SELECT * FROM customers WHERE id IN ({placeholders})',
+                    [], customer_ids, model=Customer
+                )}
+                for invoice in invoices:
+                    invoice._customer = by_id.get(invoice.customer_id)
             
-            invoices = []
-            for row in rows:
-                invoice = cls(*row[:-1])  # Exclude customer_name from constructor
-                invoice.customer_name = row[-1]  # Add customer_name as attribute
-                invoices.append(invoice)
+            if items:
+                grouped = {invoice_id: [] for invoice_id in invoice_ids}
+                for prefix, ids in sources:
+                    for item in _fetch_in(
+                        cursor, f'SELECT * FROM {prefix}invoice_items WHERE invoice_id IN ({{placeholders}}) ORDER BY id',
+                        [], ids, model=InvoiceItem
+                    ):
+                        grouped[item.invoice_id].append(item.to_dict())
+                for invoice in invoices:
+                    invoice._items = grouped[invoice.id]
             
-            return invoices
+            if payments:
+                grouped = {invoice_id: [] for invoice_id in invoice_ids}
+                for prefix, ids in sources:
+                    for payment in _fetch_in(
+                        cursor, f'''
+                            SELECT * FROM {prefix}invoice_payments
+                            WHERE invoice_id IN ({{placeholders}})
+                            ORDER BY payment_date DESC
+                        ''', [], ids, model=InvoicePayment
+                    ):
+                        grouped[payment.invoice_id].append(payment)
+                for invoice in invoices:
+                    invoice._payments = grouped[invoice.id]
+        
+        return invoices
 
     def get_items(self):
         """Get invoice items"""
+        if hasattr(self, '_items'):
+            return self._items
+        
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, invoice_id, product_id, product_name, unit, quantity, unit_price, total_price, created_at
-                FROM invoice_items
+            cursor.execute(f'''
+                SELECT * FROM {self._table('invoice_items')}
                 WHERE invoice_id = ?
+                ORDER BY id
             ''', (self.id,))
-            rows = cursor.fetchall()
-            
-            return [{
-                'id': row[0],
-                'invoice_id': row[1],
-                'product_id': row[2],
-                'product_name': row[3],
-                'unit': row[4],
-                'quantity': float(row[5]),
-                'unit_price': float(row[6]),
-                'total_price': float(row[7]),
-                'created_at': row[8]
-            } for row in rows]
+            return [item.to_dict() for item in InvoiceItem.fetch_all(cursor)]
 
     def get_payments(self):
         """Get invoice payments"""
+        if hasattr(self, '_payments'):
+            return self._payments
+        
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM invoice_payments 
+            cursor.execute(f'''
+                SELECT * FROM {self._table('invoice_payments')} 
                 WHERE invoice_id = ? 
                 ORDER BY payment_date DESC
             ''', (self.id,))
-            rows = cursor.fetchall()
             
             from src.models.payment import InvoicePayment
-            return [InvoicePayment(*row) for row in rows]
+            return InvoicePayment.fetch_all(cursor)
 
     def add_payment(self, amount, payment_method, payment_date=None, reference_number=None, notes=None):
-        """Add payment to invoice"""
+        """Add payment to invoice
+
+        The balance check, the increment and the status change are a single
+        conditional UPDATE, so concurrent payments on one invoice can never
+        overpay it or overwrite each other. Raises PaymentConflictError when
+        the invoice's current balance is smaller than the amount.
+        """
         if payment_date is None:
             payment_date = date.today()
         
-        with get_db_connection() as conn:
+        amount = float(amount)
+        
+        # Validate payment amount
+        if amount <= 0:
+            raise Exception("Payment amount must be positive")
+        
+        def write(conn):
+            from src.models.payment import InvoicePayment
             cursor = conn.cursor()
             
-            # Validate payment amount
-            if amount <= 0:
-                raise Exception("Payment amount must be positive")
+            # Apply the payment against the balance as stored right now
+            applied = self._apply_payments(cursor, self.shop_id, {self.id: amount}) > 0
             
-            if amount > self.balance_amount:
-                raise Exception("Payment amount cannot exceed balance amount")
+            cursor.execute('''
+                SELECT paid_amount, balance_amount, status FROM invoices WHERE id = ?
+            ''', (self.id,))
+            row = cursor.fetchone()
+            if not row:
+                raise Exception("Invoice not found")
+            if not applied:
+                raise PaymentConflictError(
+                    f"Payment amount {amount} exceeds the invoice's current balance of {row[1]}"
+                )
             
             # Create payment record in invoice_payments table
-            cursor.execute('''
-                INSERT INTO invoice_payments (
-                    invoice_id, amount, payment_method, payment_date,
-                    reference_number, notes, created_at, updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                self.id, amount, payment_method, payment_date,
-                reference_number, notes, datetime.now(), datetime.now()
-            ))
+            InvoicePayment.create_many(cursor, [
+                (self.id, amount, payment_method, payment_date, reference_number, notes)
+            ])
+            return row
+        
+        # Update instance attributes
+        self.paid_amount, self.balance_amount, self.status = run_write_transaction(write, shop_id=self.shop_id)
+        if hasattr(self, '_payments'):
+            del self._payments
+        
+        return True
+
+    @classmethod
+    def allocate_payment(cls, shop_id, customer_id, amount, payment_method, policy='oldest_first',
+                         allocations=None, payment_date=None, reference_number=None, notes=None):
+        """Split one payment from a customer over their open invoices
+
+        'oldest_first' and 'largest_first' fill the customer's open invoices
+        in that order until the amount is used up; 'explicit' takes
+        allocations, a list of {'invoice_id', 'amount'} (amount may then be
+        None to pay their sum). Every invoice is updated with add_payment's
+        conditional update, all in one transaction, and the payment rows are
+        inserted in one batch. Raises ValueError for invalid input and
+        PaymentConflictError when the balances no longer cover the amount.
+        """
+        if policy not in PAYMENT_ALLOCATION_POLICIES:
+            raise ValueError(f"policy must be one of: {', '.join(PAYMENT_ALLOCATION_POLICIES)}")
+        if payment_date is None:
+            payment_date = date.today()
+        
+        if amount is not None:
+            amount = cls._parse_amount(amount, "Payment amount")
+        
+        requested = {}
+        if policy == 'explicit':
+            if not isinstance(allocations, (list, type(None))):
+                raise ValueError("allocations must be a list of {'invoice_id', 'amount'} objects")
+            for allocation in allocations or []:
+                try:
+                    invoice_id = int(allocation['invoice_id'])
+                except (KeyError, TypeError, ValueError):
+                    raise ValueError("Each allocation needs an integer invoice_id and an amount")
+                value = cls._parse_amount(allocation.get('amount'), "Allocation amount")
+                requested[invoice_id] = round(requested.get(invoice_id, 0) + value, 2)
+            if not requested:
+                raise ValueError("allocations are required for the explicit policy")
+            total = round(sum(requested.values()), 2)
+            if amount is not None and amount != total:
+                raise ValueError(f"Allocations add up to {total}, not {amount}")
+            amount = total
+        elif amount is None:
+            raise ValueError("Payment amount is required")
+        
+        def write(conn):
+            from src.models.payment import InvoicePayment
+            cursor = conn.cursor()
             
-            # Update invoice paid amount and balance
-            new_paid_amount = self.paid_amount + amount
-            new_balance_amount = self.total_amount - new_paid_amount
+            order_by = 'balance_amount DESC, id ASC' if policy == 'largest_first' else 'invoice_date ASC, id ASC'
+            cursor.execute(f'''
+                SELECT id, balance_amount FROM invoices
+                WHERE shop_id = ? AND customer_id = ? AND balance_amount > 0
+                ORDER BY {order_by}
+            ''', (shop_id, customer_id))
+            open_invoices = cursor.fetchall()
             
-            # Update status based on balance
-            if new_balance_amount <= 0:
-                new_status = 'paid'
-            elif new_paid_amount > 0:
-                new_status = 'partial'
+            if policy == 'explicit':
+                balances = dict(open_invoices)
+                for invoice_id, value in requested.items():
+                    if invoice_id not in balances:
+                        raise ValueError(f"Invoice {invoice_id} is not an open invoice of this customer")
+                    if value > balances[invoice_id]:
+                        raise PaymentConflictError(
+                            f"Allocation {value} exceeds the balance of {balances[invoice_id]} on invoice {invoice_id}"
+                        )
+                plan = requested
             else:
-                new_status = 'pending'
+                outstanding = round(sum(balance for _, balance in open_invoices), 2)
+                if amount > outstanding:
+                    raise PaymentConflictError(
+                        f"Payment amount {amount} exceeds the customer's outstanding balance of {outstanding}"
+                    )
+                plan = {}
+                remaining = amount
+                for invoice_id, balance in open_invoices:
+                    if remaining <= 0:
+                        break
+                    plan[invoice_id] = min(remaining, balance)
+                    remaining = round(remaining - plan[invoice_id], 2)
             
-            cursor.execute('''
-                UPDATE invoices 
-                SET paid_amount = ?, balance_amount = ?, status = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            ''', (new_paid_amount, new_balance_amount, new_status, self.id))
-            
-            conn.commit()
+            if cls._apply_payments(cursor, shop_id, plan) != len(plan):
+                raise PaymentConflictError("Invoice balances changed while the payment was being applied")
             
-            # Update instance attributes
-            self.paid_amount = new_paid_amount
-            self.balance_amount = new_balance_amount
-            self.status = new_status
+            InvoicePayment.create_many(cursor, [
+                (invoice_id, value, payment_method, payment_date, reference_number, notes)
+                for invoice_id, value in plan.items()
+            ])
             
-            return True
+            updated = {row[0]: row for row in _fetch_in(
+                cursor, '''
+                    SELECT id, invoice_number, paid_amount, balance_amount, status
+                    FROM invoices WHERE shop_id = ? AND id IN ({placeholders})
+                ''', [shop_id], list(plan)
+            )}
+            return [{
+                'invoice_id': invoice_id,
+                'invoice_number': updated[invoice_id][1],
+                'amount': value,
+                'paid_amount': float(updated[invoice_id][2]),
+                'balance_amount': float(updated[invoice_id][3]),
+                'status': updated[invoice_id][4]
+            } for invoice_id, value in plan.items()]
+        
+        return run_write_transaction(write, shop_id=shop_id)
+
+    @staticmethod
+    def _parse_amount(value, label):
+        """Parse a positive amount rounded to cents, raising ValueError otherwise"""
+        try:
+            amount = round(float(value), 2)
+        except (TypeError, ValueError):
+            raise ValueError(f"{label} must be a number")
+        if not math.isfinite(amount) or amount <= 0:
+            raise ValueError(f"{label} must be positive")
+        return amount
+
+    @staticmethod
+    def _apply_payments(cursor, shop_id, payments):
+        """Add {invoice_id: amount} payments to invoices with conditional updates
+
+        An invoice is only updated while its stored balance still covers its
+        amount, and its status is derived in the same statement. Returns the
+        number of invoices updated.
+        """
+        applied = 0
+        invoice_ids = list(payments)
+        for start in range(0, len(invoice_ids), IN_LIST_BATCH_SIZE):
+            batch = invoice_ids[start:start + IN_LIST_BATCH_SIZE]
+            amount = 'CASE id ' + ' '.join('WHEN ? THEN ?' for _ in batch) + ' END'
+            amount_params = [value for invoice_id in batch for value in (invoice_id, payments[invoice_id])]
+            placeholders = ', '.join('?' * len(batch))
+            cursor.execute(f'''
+                UPDATE invoices 
+                SET paid_amount = paid_amount + {amount},
+                    balance_amount = balance_amount - {amount},
+                    status = CASE
+                        WHEN balance_amount - {amount} <= 0 THEN 'paid'
+                        WHEN paid_amount + {amount} > 0 THEN 'partial'
+                        ELSE 'pending'
+                    END,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE shop_id = ? AND id IN ({placeholders}) AND balance_amount >= {amount}
+            ''', amount_params * 4 + [shop_id] + batch + amount_params)
+            applied += cursor.rowcount
+        return applied
 
     def get_payment_history(self):
         """Get detailed payment history for this invoice"""
@@ -454,10 +1099,20 @@ class Invoice:
             self.status = status
             return cursor.rowcount > 0
 
+    def is_archived(self):
+        """Whether the invoice was read from the archive"""
+        return bool(getattr(self, 'archived', False))
+
+    def _table(self, name):
+        """Table holding this invoice's rows of name (the archive copy once archived)"""
+        return f'{ARCHIVE_SCHEMA}.{name}' if self.is_archived() else name
+
     def get_customer(self):
         """Get customer details"""
         if not self.customer_id:
             return None
+        if hasattr(self, '_customer'):
+            return self._customer
         
         from src.models.customer import Customer
         return Customer.get_by_id(self.customer_id)
@@ -480,6 +1135,8 @@ class Invoice:
             'status': self.status,
             'notes': self.notes,
             'original_invoice_id': self.original_invoice_id,
+            'returned_amount': float(self.returned_amount or 0),
+            'archived': self.is_archived(),
             'created_at': self.created_at,
             'updated_at': self.updated_at
         }
@@ -497,26 +1154,58 @@ class Invoice:
         """Get all return invoices for this invoice"""
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM invoices 
+            # Returns are archived together with their original invoice
+            cursor.execute(f'''
+                SELECT *, {int(self.is_archived())} AS archived FROM {self._table('invoices')} 
                 WHERE original_invoice_id = ? 
                 ORDER BY created_at DESC
             ''', (self.id,))
-            rows = cursor.fetchall()
-            return [cls(*row) for row in rows]
+            return Invoice.fetch_all(cursor)
 
     def get_total_returns(self):
         """Get total amount returned for this invoice"""
-        return_invoices = self.get_return_invoices()
-        return sum(abs(invoice.total_amount) for invoice in return_invoices)
+        return float(self.returned_amount or 0)
 
     def get_net_amount(self):
         """Get net amount after returns"""
         return self.total_amount - self.get_total_returns()
 
-class InvoiceItem:
+    def get_return_summary(self):
+        """Get returned and still-returnable quantities per invoice line"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT id, product_id, product_name, unit, quantity, returned_quantity
+                FROM {self._table('invoice_items')}
+                WHERE invoice_id = ?
+                ORDER BY id
+            ''', (self.id,))
+            items = [{
+                'id': row[0],
+                'product_id': row[1],
+                'product_name': row[2],
+                'unit': row[3],
+                'quantity': float(row[4]),
+                'returned_quantity': float(row[5]),
+                'returnable_quantity': float(row[4]) - float(row[5])
+            } for row in cursor.fetchall()]
+        
+        return {
+            'invoice_id': self.id,
+            'invoice_number': self.invoice_number,
+            'total_amount': float(self.total_amount),
+            'returned_amount': self.get_total_returns(),
+            'net_amount': float(self.get_net_amount()),
+            'items': items
+        }
+
+class InvoiceItem(Model):
+    _fields = ('id', 'invoice_id', 'product_id', 'product_name', 'unit', 'quantity',
+               'unit_price', 'total_price', 'returned_quantity', 'created_at')
+    __slots__ = _fields
+
     def __init__(self, id=None, invoice_id=None, product_id=None, product_name=None, unit=None,
-                 quantity=None, unit_price=None, total_price=None, created_at=None):
+                 quantity=None, unit_price=None, total_price=None, returned_quantity=0, created_at=None):
         self.id = id
         self.invoice_id = invoice_id
         self.product_id = product_id
@@ -525,6 +1214,7 @@ class InvoiceItem:
         self.quantity = quantity
         self.unit_price = unit_price
         self.total_price = total_price
+        self.returned_quantity = returned_quantity
         self.created_at = created_at
 
     def to_dict(self):
@@ -538,6 +1228,7 @@ class InvoiceItem:
             'quantity': float(self.quantity),
             'unit_price': float(self.unit_price),
             'total_price': float(self.total_price),
+            'returned_quantity': float(self.returned_quantity or 0),
             'created_at': self.created_at
         }
 
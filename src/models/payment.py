@@ -1,8 +1,14 @@
 import sqlite3
 from datetime import datetime
-from src.database_sqlite import get_db_connection
+from src.database_sqlite import ARCHIVE_SCHEMA, get_catalog_connection, get_db_connection
+from src.models.base import Model
+
+class PaymentVerification(Model):
+    _fields = ('id', 'shop_id', 'amount', 'payment_method', 'reference_number',
+               'payment_proof', 'status', 'admin_notes', 'created_at', 'updated_at')
+    _extras = ('shop_name', 'shop')
+    __slots__ = _fields + _extras
 
-class PaymentVerification:
     def __init__(self, id=None, shop_id=None, amount=None, payment_method=None,
                  reference_number=None, payment_proof=None, status='pending',
                  admin_notes=None, created_at=None, updated_at=None):
@@ -20,7 +26,7 @@ class PaymentVerification:
     @classmethod
     def create(cls, shop_id, payment_data):
         """Create a new payment verification"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
@@ -49,16 +55,12 @@ class PaymentVerification:
     @classmethod
     def get_by_id(cls, verification_id):
         """Get payment verification by ID"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
             cursor.execute('SELECT * FROM payment_verifications WHERE id = ?', (verification_id,))
-            row = cursor.fetchone()
-            
-            if row:
-                return cls(*row)
-            return None
+            return cls.fetch_one(cursor)
             
         except sqlite3.Error as e:
             raise Exception(f"Database error: {e}")
@@ -68,7 +70,7 @@ class PaymentVerification:
     @classmethod
     def get_by_shop_id(cls, shop_id):
         """Get payment verifications by shop ID"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
@@ -78,8 +80,7 @@ class PaymentVerification:
                 ORDER BY created_at DESC
             ''', (shop_id,))
             
-            rows = cursor.fetchall()
-            return [cls(*row) for row in rows]
+            return cls.fetch_all(cursor)
             
         except sqlite3.Error as e:
             raise Exception(f"Database error: {e}")
@@ -89,7 +90,7 @@ class PaymentVerification:
     @classmethod
     def get_all_paginated(cls, page=1, limit=10, status=''):
         """Get all payment verifications with pagination"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
@@ -111,13 +112,9 @@ class PaymentVerification:
                     LIMIT ? OFFSET ?
                 ''', (limit, offset))
             
-            rows = cursor.fetchall()
-            verifications = []
-            
-            for row in rows:
-                verification = cls(*row[:-1])  # Exclude shop_name from verification object
-                verification.shop = {'shop_name': row[-1]}  # Add shop info
-                verifications.append(verification)
+            verifications = cls.fetch_all(cursor)
+            for verification in verifications:
+                verification.shop = {'shop_name': verification.shop_name}  # Add shop info
             
             return verifications
             
@@ -129,7 +126,7 @@ class PaymentVerification:
     @classmethod
     def count_pending(cls):
         """Count pending payment verifications"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
@@ -144,7 +141,7 @@ class PaymentVerification:
     @classmethod
     def get_total_verified_amount(cls):
         """Get total amount of verified payments"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
@@ -159,7 +156,7 @@ class PaymentVerification:
 
     def verify(self, admin_notes=''):
         """Verify the payment"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
@@ -181,7 +178,7 @@ class PaymentVerification:
 
     def reject(self, admin_notes=''):
         """Reject the payment"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
@@ -228,7 +225,12 @@ class PaymentVerification:
         }
 
 
-class InvoicePayment:
+class InvoicePayment(Model):
+    _fields = ('id', 'invoice_id', 'amount', 'payment_method', 'payment_date',
+               'reference_number', 'notes', 'created_at', 'updated_at')
+    _extras = ('invoice_number',)
+    __slots__ = _fields + _extras
+
     def __init__(self, id=None, invoice_id=None, amount=None, payment_method=None,
                  payment_date=None, reference_number=None, notes=None,
                  created_at=None, updated_at=None):
@@ -271,6 +273,21 @@ class InvoicePayment:
         finally:
             conn.close()
 
+    @classmethod
+    def create_many(cls, cursor, payments):
+        """Insert (invoice_id, amount, payment_method, payment_date, reference_number, notes) rows
+
+        Runs on the caller's cursor, inside the transaction that applies the
+        payments to the invoices.
+        """
+        now = datetime.now()
+        cursor.executemany('''
+            INSERT INTO invoice_payments (
+                invoice_id, amount, payment_method, payment_date,
+                reference_number, notes, created_at, updated_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [payment + (now, now) for payment in payments])
+
     @classmethod
     def get_by_id(cls, payment_id):
         """Get invoice payment by ID"""
@@ -279,11 +296,7 @@ class InvoicePayment:
         
         try:
             cursor.execute('SELECT * FROM invoice_payments WHERE id = ?', (payment_id,))
-            row = cursor.fetchone()
-            
-            if row:
-                return cls(*row)
-            return None
+            return cls.fetch_one(cursor)
             
         except sqlite3.Error as e:
             raise Exception(f"Database error: {e}")
@@ -303,8 +316,7 @@ class InvoicePayment:
                 ORDER BY payment_date DESC
             ''', (invoice_id,))
             
-            rows = cursor.fetchall()
-            return [cls(*row) for row in rows]
+            return cls.fetch_all(cursor)
             
         except sqlite3.Error as e:
             raise Exception(f"Database error: {e}")
@@ -313,27 +325,26 @@ class InvoicePayment:
 
     @classmethod
     def get_by_customer_id(cls, customer_id, shop_id):
-        """Get payments by customer ID for a specific shop"""
+        """Get payments by customer ID for a specific shop, archived ones included"""
         conn = get_db_connection()
         cursor = conn.cursor()
         
         try:
-            cursor.execute('''
-                SELECT ip.*, i.invoice_number 
+            columns = ', '.join(f'ip.{name} AS {name}' for name in cls._fields)
+            cursor.execute(f'''
+                SELECT {columns}, i.invoice_number 
                 FROM invoice_payments ip
                 JOIN invoices i ON ip.invoice_id = i.id
                 WHERE i.customer_id = ? AND i.shop_id = ?
-                ORDER BY ip.payment_date DESC
-            ''', (customer_id, shop_id))
-            
-            rows = cursor.fetchall()
-            payments = []
-            for row in rows:
-                payment = cls(*row[:-1])  # Exclude invoice_number from constructor
-                payment.invoice_number = row[-1]  # Add invoice_number as attribute
-                payments.append(payment)
+                UNION ALL
+                SELECT {columns}, i.invoice_number 
+                FROM {ARCHIVE_SCHEMA}.invoice_payments ip
+                JOIN {ARCHIVE_SCHEMA}.invoices i ON ip.invoice_id = i.id
+                WHERE i.customer_id = ? AND i.shop_id = ?
+                ORDER BY payment_date DESC
+            ''', (customer_id, shop_id, customer_id, shop_id))
             
-            return payments
+            return cls.fetch_all(cursor)
             
         except sqlite3.Error as e:
             raise Exception(f"Database error: {e}")
@@ -1,8 +1,15 @@
 import sqlite3
 from datetime import datetime
-from src.database_sqlite import get_db_connection
+from src.database_sqlite import get_db_connection, run_write_transaction
+from src.database_statements import statements
+from src.models.base import Model
+from src.models.counter import ShopCounter
+
+class Product(Model):
+    _fields = ('id', 'shop_id', 'name', 'category', 'brand', 'description', 'unit', 'price',
+               'stock_quantity', 'min_stock_level', 'barcode', 'is_active', 'created_at', 'updated_at')
+    __slots__ = _fields
 
-class Product:
     def __init__(self, id=None, shop_id=None, name=None, category=None, brand=None,
                  description=None, unit=None, price=None, stock_quantity=0,
                  min_stock_level=0, barcode=None, is_active=True,
@@ -40,9 +47,10 @@ class Product:
                 product_data.get('min_stock_level', 0),
                 product_data.get('barcode')
             ))
+            product_id = cursor.lastrowid
+            ShopCounter.add(cursor, shop_id, 'products')
             conn.commit()
             
-            product_id = cursor.lastrowid
             return cls.get_by_id(product_id)
 
     @classmethod
@@ -51,46 +59,23 @@ class Product:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM products WHERE id = ?', (product_id,))
-            row = cursor.fetchone()
-            
-            if row:
-                return cls(*row)
-            return None
+            return cls.fetch_one(cursor)
 
     @classmethod
-    def get_by_shop_id(cls, shop_id, limit=None, offset=None, search=None, category=None, active_only=True):
-        """Get products by shop ID with optional filtering"""
+    def get_by_shop_id(cls, shop_id, limit=None, offset=None, search=None, category=None, active_only=True, after=None):
+        """Get products by shop ID with optional filtering
+
+        after is a (name, id) keyset to list the products following.
+        """
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            
-            query = 'SELECT * FROM products WHERE shop_id = ?'
-            params = [shop_id]
-            
-            if active_only:
-                query += ' AND is_active = 1'
-            
-            if search:
-                query += ' AND (name LIKE ? OR brand LIKE ? OR barcode LIKE ?)'
-                search_term = f'%{search}%'
-                params.extend([search_term, search_term, search_term])
-            
-            if category:
-                query += ' AND category = ?'
-                params.append(category)
-            
-            query += ' ORDER BY name ASC'
-            
-            if limit:
-                query += ' LIMIT ?'
-                params.append(limit)
-                if offset:
-                    query += ' OFFSET ?'
-                    params.append(offset)
-            
-            cursor.execute(query, params)
-            rows = cursor.fetchall()
-            
-            return [cls(*row) for row in rows]
+            statements.execute(cursor, 'products.by_shop', [shop_id], filters={
+                'active': () if active_only else None,
+                'search': [f'%{search}%'] * 3 if search else None,
+                'category': [category] if category else None,
+                'after': list(after) if after else None
+            }, page=(limit, offset or 0) if limit else None)
+            return cls.fetch_all(cursor)
 
     @classmethod
     def get_categories(cls, shop_id):
@@ -100,7 +85,7 @@ class Product:
             cursor.execute('''
                 SELECT DISTINCT category 
                 FROM products 
-                WHERE shop_id = ? AND is_active = 1 
+                WHERE shop_id = ? AND is_active = TRUE 
                 ORDER BY category
             ''', (shop_id,))
             rows = cursor.fetchall()
@@ -114,12 +99,10 @@ class Product:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT * FROM products 
-                WHERE shop_id = ? AND is_active = 1 AND stock_quantity <= min_stock_level
+                WHERE shop_id = ? AND is_active = TRUE AND stock_quantity <= min_stock_level
                 ORDER BY stock_quantity ASC
             ''', (shop_id,))
-            rows = cursor.fetchall()
-            
-            return [cls(*row) for row in rows]
+            return cls.fetch_all(cursor)
 
     @classmethod
     def search_by_barcode(cls, shop_id, barcode):
@@ -128,13 +111,9 @@ class Product:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT * FROM products 
-                WHERE shop_id = ? AND barcode = ? AND is_active = 1
+                WHERE shop_id = ? AND barcode = ? AND is_active = TRUE
             ''', (shop_id, barcode))
-            row = cursor.fetchone()
-            
-            if row:
-                return cls(*row)
-            return None
+            return cls.fetch_one(cursor)
 
     def update(self, **kwargs):
         """Update product fields"""
@@ -143,6 +122,9 @@ class Product:
             'stock_quantity', 'min_stock_level', 'barcode', 'is_active'
         ]
         
+        if 'is_active' in kwargs:
+            kwargs['is_active'] = self._parse_bool(kwargs['is_active'], 'is_active')
+        
         update_fields = []
         values = []
         
@@ -156,15 +138,38 @@ class Product:
         
         values.append(self.id)
         
-        with get_db_connection() as conn:
+        def write(conn):
             cursor = conn.cursor()
+            was_active = None
+            if 'is_active' in kwargs:
+                cursor.execute('SELECT is_active FROM products WHERE id = ?', (self.id,))
+                row = cursor.fetchone()
+                was_active = bool(row[0]) if row else None
+            
             cursor.execute(f'''
                 UPDATE products 
                 SET {', '.join(update_fields)}, updated_at = CURRENT_TIMESTAMP
                 WHERE id = ?
             ''', values)
-            conn.commit()
-            return cursor.rowcount > 0
+            updated = cursor.rowcount > 0
+            
+            # Only active products are counted
+            if updated and was_active is not None and was_active != bool(kwargs['is_active']):
+                ShopCounter.add(cursor, self.shop_id, 'products', 1 if kwargs['is_active'] else -1)
+            return updated
+        
+        return run_write_transaction(write, shop_id=self.shop_id)
+
+    @staticmethod
+    def _parse_bool(value, field):
+        """Parse a JSON or form boolean; bool("false") would be True"""
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, int) and value in (0, 1):
+            return bool(value)
+        if isinstance(value, str) and value.strip().lower() in ('true', '1', 'yes', 'false', '0', 'no'):
+            return value.strip().lower() in ('true', '1', 'yes')
+        raise ValueError(f"{field} must be true or false")
 
     def update_stock(self, quantity_change):
         """Update stock quantity"""
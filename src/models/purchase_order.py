@@ -1,13 +1,20 @@
 import sqlite3
 from datetime import datetime
 from src.database_sqlite import get_db_connection
+from src.models.base import Model
+from src.models.sequence import DocumentSequence, PO_NUMBER_FORMAT, PO_NUMBER_RESET
 
 def format_datetime(dt):
     if isinstance(dt, str):
         return dt
     return dt.isoformat() if dt else None
 
-class PurchaseOrder:
+class PurchaseOrder(Model):
+    _fields = ('id', 'shop_id', 'supplier_id', 'po_number', 'order_date', 'expected_delivery',
+               'total_amount', 'status', 'notes', 'created_at', 'updated_at')
+    _extras = ('supplier',)
+    __slots__ = _fields + _extras
+
     def __init__(self, id, shop_id, supplier_id, po_number, order_date, expected_delivery, total_amount, status, notes, created_at, updated_at, supplier=None):
         self.id = id
         self.shop_id = shop_id
@@ -29,7 +36,9 @@ class PurchaseOrder:
         
         try:
             # Generate PO number
-            po_number = f"PO-{datetime.now().strftime('%Y%m%d')}-{shop_id:03d}"
+            po_number = DocumentSequence.next_number(
+                cursor, shop_id, 'purchase_order', PO_NUMBER_FORMAT, PO_NUMBER_RESET
+            )
             
             cursor.execute('''
                 INSERT INTO purchase_orders (shop_id, supplier_id, po_number, order_date, expected_delivery, total_amount, status, notes, created_at, updated_at)
@@ -0,0 +1,88 @@
+import os
+import string
+from datetime import date
+
+# Number formats are str.format templates with these fields:
+#   {shop_id}  the shop id
+#   {date}     today's date, e.g. {date:%Y%m%d}
+#   {fy}       the financial year, e.g. 2024-25
+#   {seq}      the sequence value, e.g. {seq:05d} for zero padding
+# The reset policy restarts {seq} at 1 every 'financial_year', 'year' or
+# 'month' ('never' by default). A format used with a reset policy must
+# include the matching period ({fy} or {date}) to stay unique. Every
+# format must include {shop_id}: invoice numbers are unique across all
+# shops, and every shop's sequence starts at 1.
+INVOICE_NUMBER_FORMAT = os.environ.get('INVOICE_NUMBER_FORMAT', 'INV-{shop_id}-{date:%Y%m%d}-{seq:04d}')
+INVOICE_NUMBER_RESET = os.environ.get('INVOICE_NUMBER_RESET', 'never')
+PO_NUMBER_FORMAT = os.environ.get('PO_NUMBER_FORMAT', 'PO-{date:%Y%m%d}-{shop_id:03d}-{seq:04d}')
+PO_NUMBER_RESET = os.environ.get('PO_NUMBER_RESET', 'never')
+
+def check_number_format(setting, number_format):
+    """Raise ValueError for a number format that would repeat across shops"""
+    fields = {field for _, field, _, _ in string.Formatter().parse(number_format) if field}
+    if 'shop_id' not in fields:
+        raise ValueError(f"{setting} must include {{shop_id}}: {number_format}")
+
+check_number_format('INVOICE_NUMBER_FORMAT', INVOICE_NUMBER_FORMAT)
+check_number_format('PO_NUMBER_FORMAT', PO_NUMBER_FORMAT)
+
+# Month the financial year starts in (April in India)
+FINANCIAL_YEAR_START_MONTH = int(os.environ.get('FINANCIAL_YEAR_START_MONTH', 4))
+
+def get_financial_year(day):
+    """Get the financial year containing a date, e.g. '2024-25'"""
+    start = day.year if day.month >= FINANCIAL_YEAR_START_MONTH else day.year - 1
+    if FINANCIAL_YEAR_START_MONTH == 1:
+        return str(start)
+    return f"{start}-{(start + 1) % 100:02d}"
+
+def get_period(reset, day):
+    """Get the sequence period a date falls in for a reset policy"""
+    if reset == 'never':
+        return ''
+    if reset == 'financial_year':
+        return get_financial_year(day)
+    if reset == 'year':
+        return str(day.year)
+    if reset == 'month':
+        return day.strftime('%Y-%m')
+    raise ValueError(f"Invalid number reset policy: {reset}")
+
+class DocumentSequence:
+    """Per-shop counters for invoice and purchase order numbers"""
+
+    @classmethod
+    def next_value(cls, cursor, shop_id, name, period='', count=1):
+        """Reserve the next count values of a sequence and return the last one
+
+        Must run inside the write transaction that uses the number: the
+        upsert takes the write lock, so concurrent transactions get
+        distinct values and a rolled-back sale does not consume one.
+        """
+        cursor.execute('''
+            INSERT INTO document_sequences (shop_id, name, period, last_value)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (shop_id, name, period)
+            DO UPDATE SET last_value = document_sequences.last_value + excluded.last_value
+        ''', (shop_id, name, period, count))
+        cursor.execute('''
+            SELECT last_value FROM document_sequences
+            WHERE shop_id = ? AND name = ? AND period = ?
+        ''', (shop_id, name, period))
+        return cursor.fetchone()[0]
+
+    @classmethod
+    def next_number(cls, cursor, shop_id, name, number_format, reset='never'):
+        """Allocate the next formatted document number for a shop"""
+        return cls.next_numbers(cursor, shop_id, name, number_format, reset)[0]
+
+    @classmethod
+    def next_numbers(cls, cursor, shop_id, name, number_format, reset='never', count=1):
+        """Allocate a block of consecutive formatted document numbers"""
+        today = date.today()
+        last = cls.next_value(cursor, shop_id, name, get_period(reset, today), count)
+        fy = get_financial_year(today)
+        return [
+            number_format.format(shop_id=int(shop_id), date=today, fy=fy, seq=seq)
+            for seq in range(last - count + 1, last + 1)
+        ]
@@ -1,8 +1,15 @@
 import sqlite3
 from datetime import datetime
-from src.database_sqlite import get_db_connection
+from src.database_sqlite import get_catalog_connection, get_db_connection, sql_current_date, sql_month_start
+from src.models.base import Model
+
+class Shop(Model):
+    _fields = ('id', 'user_id', 'shop_name', 'owner_name', 'phone', 'address', 'city', 'state',
+               'pincode', 'gst_number', 'license_number', 'is_active', 'subscription_status',
+               'created_at', 'updated_at')
+    _extras = ('email',)
+    __slots__ = _fields + _extras
 
-class Shop:
     def __init__(self, id=None, user_id=None, shop_name=None, owner_name=None, 
                  phone=None, address=None, city=None, state=None, pincode=None,
                  gst_number=None, license_number=None, is_active=False, 
@@ -26,7 +33,7 @@ class Shop:
     @classmethod
     def create(cls, user_id, shop_data):
         """Create a new shop"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
@@ -58,16 +65,12 @@ class Shop:
     @classmethod
     def get_by_id(cls, shop_id):
         """Get shop by ID"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
             cursor.execute('SELECT * FROM shops WHERE id = ?', (shop_id,))
-            row = cursor.fetchone()
-            
-            if row:
-                return cls(*row)
-            return None
+            return cls.fetch_one(cursor)
             
         except sqlite3.Error as e:
             raise Exception(f"Database error: {e}")
@@ -77,16 +80,12 @@ class Shop:
     @classmethod
     def get_by_user_id(cls, user_id):
         """Get shop by user ID"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
             cursor.execute('SELECT * FROM shops WHERE user_id = ?', (user_id,))
-            row = cursor.fetchone()
-            
-            if row:
-                return cls(*row)
-            return None
+            return cls.fetch_one(cursor)
             
         except sqlite3.Error as e:
             raise Exception(f"Database error: {e}")
@@ -96,7 +95,7 @@ class Shop:
     @classmethod
     def get_all_paginated(cls, page=1, limit=10, search=''):
         """Get all shops with pagination and search"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
@@ -118,15 +117,7 @@ class Shop:
                     LIMIT ? OFFSET ?
                 ''', (limit, offset))
             
-            rows = cursor.fetchall()
-            shops = []
-            
-            for row in rows:
-                shop = cls(*row[:-1])  # Exclude email from shop object
-                shop.email = row[-1]   # Add email as separate attribute
-                shops.append(shop)
-            
-            return shops
+            return cls.fetch_all(cursor)
             
         except sqlite3.Error as e:
             raise Exception(f"Database error: {e}")
@@ -136,7 +127,7 @@ class Shop:
     @classmethod
     def count_all(cls):
         """Count all shops"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
@@ -151,11 +142,11 @@ class Shop:
     @classmethod
     def count_active(cls):
         """Count active shops"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
-            cursor.execute('SELECT COUNT(*) FROM shops WHERE is_active = 1')
+            cursor.execute('SELECT COUNT(*) FROM shops WHERE is_active = TRUE')
             return cursor.fetchone()[0]
             
         except sqlite3.Error as e:
@@ -165,13 +156,13 @@ class Shop:
 
     def activate(self):
         """Activate the shop"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
             cursor.execute('''
                 UPDATE shops 
-                SET is_active = 1, subscription_status = 'active', updated_at = ?
+                SET is_active = TRUE, subscription_status = 'active', updated_at = ?
                 WHERE id = ?
             ''', (datetime.now(), self.id))
             
@@ -187,13 +178,13 @@ class Shop:
 
     def deactivate(self):
         """Deactivate the shop"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
             cursor.execute('''
                 UPDATE shops 
-                SET is_active = 0, subscription_status = 'inactive', updated_at = ?
+                SET is_active = FALSE, subscription_status = 'inactive', updated_at = ?
                 WHERE id = ?
             ''', (datetime.now(), self.id))
             
@@ -209,7 +200,7 @@ class Shop:
 
     def get_dashboard_stats(self):
         """Get dashboard statistics for the shop"""
-        conn = get_db_connection()
+        conn = get_db_connection(shop_id=self.id)
         cursor = conn.cursor()
         
         try:
@@ -233,39 +224,50 @@ class Shop:
             ''', (self.id,))
             total_revenue = cursor.fetchone()[0] or 0
             
-            # Get today's sales
+            # Archived invoices still count towards the lifetime totals
             cursor.execute('''
+                SELECT invoice_count, total_amount 
+                FROM invoice_archive_totals 
+                WHERE shop_id = ?
+            ''', (self.id,))
+            archived = cursor.fetchone()
+            if archived:
+                total_invoices += archived[0]
+                total_revenue += archived[1]
+            
+            # Get today's sales
+            cursor.execute(f'''
                 SELECT COALESCE(SUM(total_amount), 0) 
                 FROM invoices 
                 WHERE shop_id = ? 
-                AND DATE(created_at) = DATE('now')
+                AND created_at >= {sql_current_date()} AND created_at < {sql_current_date(1)}
             ''', (self.id,))
             today_sales = cursor.fetchone()[0] or 0
             
             # Get today's invoices count
-            cursor.execute('''
+            cursor.execute(f'''
                 SELECT COUNT(*) 
                 FROM invoices 
                 WHERE shop_id = ? 
-                AND DATE(created_at) = DATE('now')
+                AND created_at >= {sql_current_date()} AND created_at < {sql_current_date(1)}
             ''', (self.id,))
             today_invoices = cursor.fetchone()[0]
             
             # Get this month's revenue
-            cursor.execute('''
+            cursor.execute(f'''
                 SELECT COALESCE(SUM(total_amount), 0) 
                 FROM invoices 
                 WHERE shop_id = ? 
-                AND created_at >= date('now', 'start of month')
+                AND created_at >= {sql_month_start()}
             ''', (self.id,))
             monthly_revenue = cursor.fetchone()[0] or 0
             
             # Get this month's invoices count
-            cursor.execute('''
+            cursor.execute(f'''
                 SELECT COUNT(*) 
                 FROM invoices 
                 WHERE shop_id = ? 
-                AND created_at >= date('now', 'start of month')
+                AND created_at >= {sql_month_start()}
             ''', (self.id,))
             monthly_invoices = cursor.fetchone()[0]
             
@@ -284,7 +286,7 @@ class Shop:
                 FROM products 
                 WHERE shop_id = ? 
                 AND stock_quantity <= min_stock_level 
-                AND is_active = 1
+                AND is_active = TRUE
             ''', (self.id,))
             low_stock_count = cursor.fetchone()[0]
             
@@ -294,7 +296,7 @@ class Shop:
                 FROM products 
                 WHERE shop_id = ? 
                 AND stock_quantity <= min_stock_level 
-                AND is_active = 1
+                AND is_active = TRUE
                 ORDER BY stock_quantity ASC
                 LIMIT 10
             ''', (self.id,))
@@ -352,7 +354,7 @@ class Shop:
 
     def update(self, shop_data):
         """Update shop information"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
@@ -1,13 +1,18 @@
 import sqlite3
 from datetime import datetime
 from src.database_sqlite import get_db_connection
+from src.models.base import Model
 
 def format_datetime(dt):
     if isinstance(dt, str):
         return dt
     return dt.isoformat() if dt else None
 
-class Supplier:
+class Supplier(Model):
+    _fields = ('id', 'shop_id', 'name', 'contact_person', 'phone', 'email', 'address', 'gst_number',
+               'created_at', 'updated_at')
+    __slots__ = _fields
+
     def __init__(self, id, shop_id, name, contact_person, phone, email, address, gst_number, created_at, updated_at):
         self.id = id
         self.shop_id = shop_id
@@ -57,16 +62,10 @@ class Supplier:
         cursor = conn.cursor()
         
         cursor.execute('SELECT * FROM suppliers WHERE id = ?', (supplier_id,))
-        row = cursor.fetchone()
+        supplier = cls.fetch_one(cursor)
         conn.close()
         
-        if row:
-            return cls(
-                id=row[0], shop_id=row[1], name=row[2], contact_person=row[3],
-                phone=row[4], email=row[5], address=row[6], gst_number=row[7],
-                created_at=row[8], updated_at=row[9]
-            )
-        return None
+        return supplier
 
     @classmethod
     def get_by_shop_id(cls, shop_id, search=None):
@@ -84,18 +83,9 @@ class Supplier:
         query += ' ORDER BY name ASC'
         
         cursor.execute(query, params)
-        rows = cursor.fetchall()
+        suppliers = cls.fetch_all(cursor)
         conn.close()
         
-        suppliers = []
-        for row in rows:
-            supplier = cls(
-                id=row[0], shop_id=row[1], name=row[2], contact_person=row[3],
-                phone=row[4], email=row[5], address=row[6], gst_number=row[7],
-                created_at=row[8], updated_at=row[9]
-            )
-            suppliers.append(supplier)
-        
         return suppliers
 
     def update(self, data):
@@ -1,12 +1,17 @@
 import sqlite3
 import bcrypt
 from datetime import datetime
-from src.database_sqlite import get_db_connection
+from src.database_sqlite import get_catalog_connection
+from src.models.base import Model
 
 # Initialize database connection for SQLAlchemy-like usage
 db = None
 
-class User:
+class User(Model):
+    _fields = ('id', 'username', 'email', 'password_hash', 'role', 'is_active', 'created_at',
+               'updated_at')
+    __slots__ = _fields
+
     def __init__(self, id=None, username=None, email=None, password_hash=None,
                  role='shop_user', is_active=True, created_at=None, updated_at=None):
         self.id = id
@@ -21,7 +26,7 @@ class User:
     @classmethod
     def create(cls, user_data):
         """Create a new user"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
@@ -53,16 +58,12 @@ class User:
     @classmethod
     def get_by_id(cls, user_id):
         """Get user by ID"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
             cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-            row = cursor.fetchone()
-            
-            if row:
-                return cls(*row)
-            return None
+            return cls.fetch_one(cursor)
             
         except sqlite3.Error as e:
             raise Exception(f"Database error: {e}")
@@ -72,16 +73,12 @@ class User:
     @classmethod
     def get_by_username(cls, username):
         """Get user by username"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
             cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
-            row = cursor.fetchone()
-            
-            if row:
-                return cls(*row)
-            return None
+            return cls.fetch_one(cursor)
             
         except sqlite3.Error as e:
             raise Exception(f"Database error: {e}")
@@ -91,16 +88,12 @@ class User:
     @classmethod
     def get_by_email(cls, email):
         """Get user by email"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
             cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
-            row = cursor.fetchone()
-            
-            if row:
-                return cls(*row)
-            return None
+            return cls.fetch_one(cursor)
             
         except sqlite3.Error as e:
             raise Exception(f"Database error: {e}")
@@ -140,7 +133,7 @@ class User:
     @classmethod
     def count_all(cls):
         """Count all users"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
@@ -179,7 +172,7 @@ class User:
 
     def update_password(self, new_password):
         """Update user password"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
@@ -205,7 +198,7 @@ class User:
 
     def update(self, user_data):
         """Update user information"""
-        conn = get_db_connection()
+        conn = get_catalog_connection()
         cursor = conn.cursor()
         
         try:
@@ -3,6 +3,7 @@ from src.routes.auth import require_admin
 from src.models.user import User
 from src.models.shop import Shop
 from src.models.payment import PaymentVerification
+from src.database_statements import statements
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -151,3 +152,11 @@ def reject_payment(verification_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+
+@admin_bp.route('/database-stats', methods=['GET'])
+@require_admin
+def get_database_stats():
+    """Get statement cache counters of this worker process"""
+    return jsonify({
+        'statement_cache': statements.stats()
+    }), 200
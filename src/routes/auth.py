@@ -1,6 +1,7 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, current_app, request, jsonify, session
 from src.models.user import User
 from src.models.shop import Shop
+from src.database_sqlite import set_current_shop
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -155,7 +156,7 @@ def require_auth(f):
         user_id = session.get('user_id')
         if not user_id:
             return jsonify({'error': 'Authentication required'}), 401
-        return f(*args, **kwargs)
+        return current_app.ensure_sync(f)(*args, **kwargs)
     decorated_function.__name__ = f.__name__
     return decorated_function
 
@@ -166,7 +167,7 @@ def require_admin(f):
         user_role = session.get('user_role')
         if not user_id or user_role != 'admin':
             return jsonify({'error': 'Admin access required'}), 403
-        return f(*args, **kwargs)
+        return current_app.ensure_sync(f)(*args, **kwargs)
     decorated_function.__name__ = f.__name__
     return decorated_function
 
@@ -177,7 +178,7 @@ def require_shop_user(f):
         user_role = session.get('user_role')
         if not user_id or user_role != 'shop_user':
             return jsonify({'error': 'Shop user access required'}), 403
-        return f(*args, **kwargs)
+        return current_app.ensure_sync(f)(*args, **kwargs)
     decorated_function.__name__ = f.__name__
     return decorated_function
 
@@ -190,6 +191,8 @@ def get_current_shop_id():
     user_id = session.get('user_id')
     if user_id:
         shop = Shop.get_by_user_id(user_id)
-        return shop.id if shop else None
+        shop_id = shop.id if shop else None
+        set_current_shop(shop_id)
+        return shop_id
     return None
 
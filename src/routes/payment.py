@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from src.routes.auth import require_shop_user, get_current_shop_id
 from src.models.payment import PaymentVerification
+from src.database_async import run_db
 
 payment_bp = Blueprint('payment', __name__)
 
@@ -58,10 +59,10 @@ def get_pricing():
 
 @payment_bp.route('/submit', methods=['POST'])
 @require_shop_user
-def submit_payment():
+async def submit_payment():
     """Submit payment for verification"""
     try:
-        shop_id = get_current_shop_id()
+        shop_id = await run_db(get_current_shop_id)
         if not shop_id:
             return jsonify({'error': 'Shop not found'}), 404
         
@@ -76,7 +77,7 @@ def submit_payment():
         if data['amount'] <= 0:
             return jsonify({'error': 'Payment amount must be positive'}), 400
         
-        verification = PaymentVerification.create(shop_id, data)
+        verification = await run_db(PaymentVerification.create, shop_id, data)
         
         return jsonify({
             'message': 'Payment submitted for verification',
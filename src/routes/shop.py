@@ -1,39 +1,92 @@
-from flask import Blueprint, request, jsonify
+import base64
+import json
+from flask import Blueprint, request, jsonify, make_response
 from src.routes.auth import require_shop_user, get_current_shop_id
 from src.models.shop import Shop
 from src.models.customer import Customer
 from src.models.product import Product
-from src.models.invoice import Invoice
+from src.models.invoice import Invoice, InvalidImportRecord, PaymentConflictError
 from src.models.payment import InvoicePayment
+from src.models.aging import ReceivablesAging
 from src.database_sqlite import get_db_connection
+from src.models.counter import ShopCounter, COUNT_MODES, count_rows
+from src.database_async import run_db
 
 shop_bp = Blueprint('shop', __name__)
 
+def _encode_cursor(values):
+    """Encode a keyset as an opaque page cursor"""
+    data = json.dumps(list(values), default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+def _decode_cursor(token):
+    """Decode a page cursor; an empty cursor starts from the first page"""
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    # A keyset is (sort value, id); anything else would reach the query as
+    # an unbindable parameter
+    if (not isinstance(values, list) or len(values) != 2
+            or isinstance(values[0], bool) or not isinstance(values[0], (str, int, float))
+            or isinstance(values[1], bool) or not isinstance(values[1], int)):
+        raise ValueError('Invalid cursor')
+    return values
+
+def _count_mode():
+    """Get the ?count= total strategy for a list request"""
+    mode = request.args.get('count', 'estimate')
+    if mode not in COUNT_MODES:
+        raise ValueError(f"count must be one of: {', '.join(COUNT_MODES)}")
+    return mode
+
+def _pagination(page, limit, total, has_more):
+    """Pagination block for page/limit lists; total is None with ?count=none"""
+    return {
+        'page': page,
+        'limit': limit,
+        'total': total,
+        'pages': (total + limit - 1) // limit if total is not None else None,
+        'has_more': has_more
+    }
+
+def _keyset_page(rows, limit, key):
+    """Trim a limit + 1 fetch to a page and build the next page's cursor"""
+    page = rows[:limit]
+    if len(rows) <= limit or not page:
+        return page, None
+    return page, _encode_cursor(key(page[-1]))
+
 @shop_bp.route('/dashboard', methods=['GET'])
 @require_shop_user
-def get_shop_dashboard():
+async def get_shop_dashboard():
     """Get shop dashboard statistics"""
     try:
-        shop_id = get_current_shop_id()
+        shop_id = await run_db(get_current_shop_id)
         if not shop_id:
             return jsonify({'error': 'Shop not found'}), 404
         
-        shop = Shop.get_by_id(shop_id)
+        shop = await run_db(Shop.get_by_id, shop_id)
         if not shop:
             return jsonify({'error': 'Shop not found'}), 404
         
-        stats = shop.get_dashboard_stats()
+        stats = await run_db(shop.get_dashboard_stats)
         
-        # Get recent invoices
-        recent_invoices = Invoice.get_by_shop_id(shop_id, limit=5)
+        # Get recent invoices with their customers
+        recent_invoices = await run_db(lambda: [
+            invoice.to_dict(include_customer=True)
+            for invoice in Invoice.prefetch(Invoice.get_by_shop_id(shop_id, limit=5))
+        ])
         
         # Get low stock products
-        low_stock_products = Product.get_low_stock_products(shop_id)
+        low_stock_products = await run_db(Product.get_low_stock_products, shop_id)
         
         return jsonify({
             'shop': shop.to_dict(),
             'stats': stats,
-            'recent_invoices': [invoice.to_dict(include_customer=True) for invoice in recent_invoices],
+            'recent_invoices': recent_invoices,
             'low_stock_products': [product.to_dict() for product in low_stock_products[:5]]
         }), 200
         
@@ -97,30 +150,46 @@ def get_customers():
         limit = int(request.args.get('limit', 20))
         search = request.args.get('search')
         
+        # ?cursor= switches to keyset pagination: constant time at any depth,
+        # no total count. Pass back next_cursor until it is null.
+        if 'cursor' in request.args:
+            try:
+                after = _decode_cursor(request.args['cursor'])
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            customers, next_cursor = _keyset_page(Customer.get_by_shop_id(
+                shop_id, limit=limit + 1, search=search, after=after
+            ), limit, lambda c: (c.name, c.id))
+            
+            return jsonify({
+                'customers': [customer.to_dict() for customer in customers],
+                'pagination': {
+                    'limit': limit,
+                    'next_cursor': next_cursor
+                }
+            }), 200
+        
+        try:
+            count_mode = _count_mode()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         offset = (page - 1) * limit
         
-        customers = Customer.get_by_shop_id(shop_id, limit=limit, offset=offset, search=search)
+        # One extra row tells whether another page follows
+        customers = Customer.get_by_shop_id(shop_id, limit=limit + 1, offset=offset, search=search)
+        has_more = len(customers) > limit
         
         # Get total count for pagination
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-            if search:
-                cursor.execute('''
-                    SELECT COUNT(*) FROM customers 
-                    WHERE shop_id = ? AND (name LIKE ? OR phone LIKE ? OR email LIKE ?)
-                ''', (shop_id, f'%{search}%', f'%{search}%', f'%{search}%'))
-            else:
-                cursor.execute('SELECT COUNT(*) FROM customers WHERE shop_id = ?', (shop_id,))
-            total_count = cursor.fetchone()[0]
+            total_count = count_rows(conn.cursor(), 'customers.count_by_shop', shop_id, filters={
+                'search': [f'%{search}%'] * 3 if search else None
+            }, mode=count_mode, counter=None if search else 'customers')
         
         return jsonify({
-            'customers': [customer.to_dict() for customer in customers],
-            'pagination': {
-                'page': page,
-                'limit': limit,
-                'total': total_count,
-                'pages': (total_count + limit - 1) // limit
-            }
+            'customers': [customer.to_dict() for customer in customers[:limit]],
+            'pagination': _pagination(page, limit, total_count, has_more)
         }), 200
         
     except Exception as e:
@@ -244,6 +313,52 @@ def get_customer_payments(customer_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@shop_bp.route('/customers/<int:customer_id>/payments', methods=['POST'])
+@require_shop_user
+def allocate_customer_payment(customer_id):
+    """Split one payment from a customer over their open invoices"""
+    try:
+        shop_id = get_current_shop_id()
+        if not shop_id:
+            return jsonify({'error': 'Shop not found'}), 404
+        
+        # Verify customer belongs to this shop
+        customer = Customer.get_by_id(customer_id)
+        if not customer or customer.shop_id != shop_id:
+            return jsonify({'error': 'Customer not found'}), 404
+        
+        data = request.get_json() or {}
+        policy = data.get('policy', 'oldest_first')
+        
+        # Validate required fields
+        if not data.get('payment_method') or (policy != 'explicit' and not data.get('amount')):
+            return jsonify({'error': 'Amount and payment method are required'}), 400
+        
+        try:
+            allocations = Invoice.allocate_payment(
+                shop_id, customer_id,
+                amount=data.get('amount'),
+                payment_method=data['payment_method'],
+                policy=policy,
+                allocations=data.get('allocations'),
+                payment_date=data.get('payment_date'),
+                reference_number=data.get('reference_number'),
+                notes=data.get('notes')
+            )
+        except (ValueError, KeyError, TypeError) as e:
+            return jsonify({'error': str(e)}), 400
+        except PaymentConflictError as e:
+            return jsonify({'error': str(e)}), 409
+        
+        return jsonify({
+            'message': 'Payment allocated successfully',
+            'amount': round(sum(allocation['amount'] for allocation in allocations), 2),
+            'allocations': allocations
+        }), 201
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # Product routes
 @shop_bp.route('/products', methods=['GET'])
 @require_shop_user
@@ -259,38 +374,48 @@ def get_products():
         search = request.args.get('search')
         category = request.args.get('category')
         
+        if 'cursor' in request.args:
+            try:
+                after = _decode_cursor(request.args['cursor'])
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            products, next_cursor = _keyset_page(Product.get_by_shop_id(
+                shop_id, limit=limit + 1, search=search, category=category, after=after
+            ), limit, lambda p: (p.name, p.id))
+            
+            return jsonify({
+                'products': [product.to_dict() for product in products],
+                'pagination': {
+                    'limit': limit,
+                    'next_cursor': next_cursor
+                }
+            }), 200
+        
+        try:
+            count_mode = _count_mode()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         offset = (page - 1) * limit
         
         products = Product.get_by_shop_id(
-            shop_id, limit=limit, offset=offset, 
+            shop_id, limit=limit + 1, offset=offset, 
             search=search, category=category
         )
+        has_more = len(products) > limit
         
         # Get total count for pagination
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-            query = 'SELECT COUNT(*) FROM products WHERE shop_id = ? AND is_active = 1'
-            params = [shop_id]
-            
-            if search:
-                query += ' AND (name LIKE ? OR brand LIKE ? OR barcode LIKE ?)'
-                params.extend([f'%{search}%', f'%{search}%', f'%{search}%'])
-            
-            if category:
-                query += ' AND category = ?'
-                params.append(category)
-            
-            cursor.execute(query, params)
-            total_count = cursor.fetchone()[0]
+            total_count = count_rows(conn.cursor(), 'products.count_by_shop', shop_id, filters={
+                'active': (),
+                'search': [f'%{search}%'] * 3 if search else None,
+                'category': [category] if category else None
+            }, mode=count_mode, counter=None if search or category else 'products')
         
         return jsonify({
-            'products': [product.to_dict() for product in products],
-            'pagination': {
-                'page': page,
-                'limit': limit,
-                'total': total_count,
-                'pages': (total_count + limit - 1) // limit
-            }
+            'products': [product.to_dict() for product in products[:limit]],
+            'pagination': _pagination(page, limit, total_count, has_more)
         }), 200
         
     except Exception as e:
@@ -338,7 +463,10 @@ def update_product(product_id):
         
         data = request.get_json()
         
-        product.update(**data)
+        try:
+            product.update(**data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         return jsonify({
             'message': 'Product updated successfully',
             'product': product.to_dict()
@@ -378,42 +506,48 @@ def get_invoices():
         status = request.args.get('status')
         search = request.args.get('search')
         
+        if 'cursor' in request.args:
+            try:
+                after = _decode_cursor(request.args['cursor'])
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            invoices, next_cursor = _keyset_page(Invoice.get_by_shop_id(
+                shop_id, limit=limit + 1, status=status, search=search, after=after
+            ), limit, lambda i: (i.created_at, i.id))
+            
+            return jsonify({
+                'invoices': [invoice.to_dict(include_customer=True)
+                             for invoice in Invoice.prefetch(invoices)],
+                'pagination': {
+                    'limit': limit,
+                    'next_cursor': next_cursor
+                }
+            }), 200
+        
+        try:
+            count_mode = _count_mode()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         offset = (page - 1) * limit
         
         invoices = Invoice.get_by_shop_id(
-            shop_id, limit=limit, offset=offset, 
+            shop_id, limit=limit + 1, offset=offset, 
             status=status, search=search
         )
+        has_more = len(invoices) > limit
+        invoices = Invoice.prefetch(invoices[:limit])
         
         # Get total count for pagination
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-            query = '''
-                SELECT COUNT(*) FROM invoices i
-                LEFT JOIN customers c ON i.customer_id = c.id
-                WHERE i.shop_id = ?
-            '''
-            params = [shop_id]
-            
-            if status:
-                query += ' AND i.status = ?'
-                params.append(status)
-            
-            if search:
-                query += ' AND (i.invoice_number LIKE ? OR c.name LIKE ?)'
-                params.extend([f'%{search}%', f'%{search}%'])
-            
-            cursor.execute(query, params)
-            total_count = cursor.fetchone()[0]
+            total_count = count_rows(conn.cursor(), 'invoices.count_by_shop', shop_id,
+                                     filters=Invoice.search_filters(shop_id, status=status, search=search),
+                                     mode=count_mode, counter=None if status or search else 'invoices')
         
         return jsonify({
             'invoices': [invoice.to_dict(include_customer=True) for invoice in invoices],
-            'pagination': {
-                'page': page,
-                'limit': limit,
-                'total': total_count,
-                'pages': (total_count + limit - 1) // limit
-            }
+            'pagination': _pagination(page, limit, total_count, has_more)
         }), 200
         
     except Exception as e:
@@ -461,6 +595,48 @@ def create_invoice():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _read_ndjson(stream):
+    """Yield one record per non-empty line of an NDJSON body
+
+    A line that is not valid JSON yields an InvalidImportRecord naming the line.
+    """
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield InvalidImportRecord(f"Invalid JSON on line {line_number}: {e}")
+
+@shop_bp.route('/invoices/import', methods=['POST'])
+@require_shop_user
+def import_invoices():
+    """Bulk import invoices from a JSON array or a streamed NDJSON body"""
+    try:
+        shop_id = get_current_shop_id()
+        if not shop_id:
+            return jsonify({'error': 'Shop not found'}), 404
+        
+        adjust_stock = request.args.get('adjust_stock', 'true').lower() != 'false'
+        
+        if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+            records = _read_ndjson(request.stream)
+        else:
+            records = request.get_json(silent=True)
+            if not isinstance(records, list):
+                return jsonify({'error': 'Expected a JSON array of invoices'}), 400
+        
+        report = Invoice.bulk_import(shop_id, records, adjust_stock=adjust_stock)
+        
+        return jsonify({
+            'message': f"Imported {report['imported']} invoices, {report['failed']} failed",
+            **report
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @shop_bp.route('/invoices/<int:invoice_id>', methods=['GET'])
 @require_shop_user
 def get_invoice(invoice_id):
@@ -481,6 +657,37 @@ def get_invoice(invoice_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@shop_bp.route('/invoices/<int:invoice_id>/detail', methods=['GET'])
+@require_shop_user
+def get_invoice_detail(invoice_id):
+    """Get an invoice with its items, customer, payments and returns"""
+    try:
+        shop_id = get_current_shop_id()
+        if not shop_id:
+            return jsonify({'error': 'Shop not found'}), 404
+        
+        # Revalidation costs one small query when the client's copy is current
+        version = Invoice.get_detail_version(invoice_id, shop_id)
+        if version is None:
+            return jsonify({'error': 'Invoice not found'}), 404
+        
+        etag = f'invoice-{invoice_id}-{version}'
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            invoice, returns = Invoice.get_detail(invoice_id, shop_id)
+            result = invoice.to_dict(include_items=True, include_customer=True)
+            result['payments'] = [payment.to_dict() for payment in invoice.get_payments()]
+            result['returns'] = [return_invoice.to_dict(include_items=True) for return_invoice in returns]
+            response = make_response(jsonify({'invoice': result}), 200)
+        
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @shop_bp.route('/invoices/<int:invoice_id>/payments', methods=['POST'])
 @require_shop_user
 def add_payment_to_invoice(invoice_id):
@@ -494,6 +701,9 @@ def add_payment_to_invoice(invoice_id):
         if not invoice or invoice.shop_id != shop_id:
             return jsonify({'error': 'Invoice not found'}), 404
         
+        if invoice.is_archived():
+            return jsonify({'error': 'Archived invoices cannot be changed'}), 409
+        
         data = request.get_json()
         
         # Validate required fields
@@ -503,17 +713,19 @@ def add_payment_to_invoice(invoice_id):
         if data['amount'] <= 0:
             return jsonify({'error': 'Payment amount must be positive'}), 400
         
-        if data['amount'] > invoice.balance_amount:
-            return jsonify({'error': 'Payment amount cannot exceed balance amount'}), 400
-        
-        # Add payment
-        if invoice.add_payment(
-            amount=data['amount'],
-            payment_method=data['payment_method'],
-            payment_date=data.get('payment_date'),
-            reference_number=data.get('reference_number'),
-            notes=data.get('notes')
-        ):
+        # Add payment; the balance is checked atomically against the stored invoice
+        try:
+            added = invoice.add_payment(
+                amount=data['amount'],
+                payment_method=data['payment_method'],
+                payment_date=data.get('payment_date'),
+                reference_number=data.get('reference_number'),
+                notes=data.get('notes')
+            )
+        except PaymentConflictError as e:
+            return jsonify({'error': str(e)}), 409
+        
+        if added:
             return jsonify({
                 'message': 'Payment added successfully',
                 'invoice': invoice.to_dict(include_items=True, include_customer=True)
@@ -549,23 +761,12 @@ def create_return_invoice(invoice_id):
         if not items_data:
             return jsonify({'error': 'No items specified for return'}), 400
         
-        # Validate return items
-        original_items = original_invoice.get_items()
-        original_items_dict = {item['product_id']: item for item in original_items}
-        
-        for return_item in items_data:
-            product_id = return_item.get('product_id')
-            return_quantity = float(return_item.get('quantity', 0))
-            
-            if product_id not in original_items_dict:
-                return jsonify({'error': f'Product {product_id} not found in original invoice'}), 400
-            
-            original_quantity = float(original_items_dict[product_id]['quantity'])
-            if return_quantity > original_quantity:
-                return jsonify({'error': f'Return quantity cannot exceed original quantity for product {product_id}'}), 400
-        
-        # Create return invoice
-        return_invoice = Invoice.create_return_invoice(invoice_id, return_data, items_data)
+        # Create return invoice; quantities are validated against the
+        # original's returned-quantity ledger, including earlier returns
+        try:
+            return_invoice = Invoice.create_return_invoice(invoice_id, return_data, items_data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         return jsonify({
             'message': 'Return invoice created successfully',
@@ -575,6 +776,24 @@ def create_return_invoice(invoice_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@shop_bp.route('/invoices/<int:invoice_id>/returns', methods=['GET'])
+@require_shop_user
+def get_invoice_returns(invoice_id):
+    """Get returned and still-returnable quantities for an invoice"""
+    try:
+        shop_id = get_current_shop_id()
+        if not shop_id:
+            return jsonify({'error': 'Shop not found'}), 404
+        
+        invoice = Invoice.get_by_id(invoice_id)
+        if not invoice or invoice.shop_id != shop_id:
+            return jsonify({'error': 'Invoice not found'}), 404
+        
+        return jsonify({'returns': invoice.get_return_summary()}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @shop_bp.route('/invoices/<int:invoice_id>', methods=['DELETE'])
 @require_shop_user
 def delete_invoice(invoice_id):
@@ -588,6 +807,9 @@ def delete_invoice(invoice_id):
         if not invoice or invoice.shop_id != shop_id:
             return jsonify({'error': 'Invoice not found'}), 404
         
+        if invoice.is_archived():
+            return jsonify({'error': 'Archived invoices cannot be changed'}), 409
+        
         # Check if invoice has payments
         payments = invoice.get_payments()
         if payments:
@@ -598,6 +820,11 @@ def delete_invoice(invoice_id):
             cursor = conn.cursor()
             cursor.execute('DELETE FROM invoice_items WHERE invoice_id = ?', (invoice_id,))
             cursor.execute('DELETE FROM invoices WHERE id = ?', (invoice_id,))
+            ShopCounter.add(cursor, shop_id, 'invoices', -cursor.rowcount)
+            
+            # A deleted return no longer counts against its original's lines
+            if invoice.original_invoice_id:
+                Invoice.rebuild_return_ledger(cursor, [invoice.original_invoice_id])
             conn.commit()
         
         return jsonify({'message': 'Invoice deleted successfully'}), 200
@@ -605,3 +832,34 @@ def delete_invoice(invoice_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Report routes
+@shop_bp.route('/reports/aging', methods=['GET'])
+@require_shop_user
+def get_receivables_aging():
+    """Get receivables aging by customer and shop-wide
+
+    ?customer_id= limits the report to one customer. ?snapshot=latest or
+    ?snapshot=YYYY-MM-DD reads a stored nightly snapshot instead of
+    computing the report from the current invoices.
+    """
+    try:
+        shop_id = get_current_shop_id()
+        if not shop_id:
+            return jsonify({'error': 'Shop not found'}), 404
+        
+        customer_id = request.args.get('customer_id', type=int)
+        snapshot = request.args.get('snapshot')
+        
+        if snapshot:
+            report = ReceivablesAging.get_snapshot(
+                shop_id, None if snapshot == 'latest' else snapshot, customer_id=customer_id
+            )
+            if report is None:
+                return jsonify({'error': 'Aging snapshot not found'}), 404
+        else:
+            report = ReceivablesAging.compute(shop_id, customer_id=customer_id)
+        
+        return jsonify({'aging': report}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
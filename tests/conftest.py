@@ -0,0 +1,56 @@
+import os
+import sys
+import tempfile
+
+# Modules initialize the database on import, so point it at a scratch
+# directory before anything from src is loaded
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(), 'app.db'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import itertools
+import pytest
+
+_shop_numbers = itertools.count(1)
+
+def _shop_client():
+    """Test client logged in as the owner of a new shop"""
+    from src.main import app
+    client = app.test_client()
+    n = next(_shop_numbers)
+    client.post('/api/auth/register-shop', json={
+        'username': f'shop{n}', 'email': f'shop{n}@example.com', 'password': 'secret',
+        'shop_name': f'Shop {n}', 'owner_name': 'Owner', 'phone': f'90000{n:05d}',
+        'address': 'Street', 'city': 'City', 'state': 'State', 'pincode': '400001'
+    })
+    response = client.post('/api/auth/login', json={'username': f'shop{n}', 'password': 'secret'})
+    assert response.status_code == 200
+    return client
+
+@pytest.fixture
+def client():
+    """Test client logged in as the owner of a new shop"""
+    return _shop_client()
+
+@pytest.fixture
+def other_client():
+    """Test client logged in as the owner of a second, unrelated shop"""
+    return _shop_client()
+
+@pytest.fixture
+def product_id(client):
+    """A product of the client's shop with plenty of stock"""
+    response = client.post('/api/shop/products', json={
+        'name': 'Widget', 'category': 'General', 'unit': 'pc', 'price': 10, 'stock_quantity': 1000
+    })
+    return response.get_json()['product']['id']
+
+@pytest.fixture
+def shop_id(client):
+    """Id of the client's shop"""
+    return client.get('/api/shop/profile').get_json()['shop']['id']
+
+@pytest.fixture
+def customer_id(client):
+    """A customer of the client's shop"""
+    response = client.post('/api/shop/customers', json={'name': 'Alice'})
+    return response.get_json()['customer']['id']
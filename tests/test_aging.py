@@ -0,0 +1,84 @@
+from datetime import date, timedelta
+
+from src.models.aging import ReceivablesAging
+from src.models.customer import Customer
+
+AS_OF = date(2024, 6, 30)
+
+def _invoice(client, customer_id, amount, days_overdue=None, invoice_days_ago=0, **fields):
+    """Create an unpaid invoice of amount, due days_overdue before AS_OF"""
+    due_date = (AS_OF - timedelta(days=days_overdue)).isoformat() if days_overdue is not None else None
+    product_id = client.get('/api/shop/products').get_json()['products'][0]['id']
+    response = client.post('/api/shop/invoices', json={
+        'invoice_date': (AS_OF - timedelta(days=invoice_days_ago)).isoformat(), 'due_date': due_date,
+        'customer_id': customer_id,
+        'items': [{'product_id': product_id, 'quantity': 1, 'unit_price': amount}], **fields
+    })
+    assert response.status_code == 201
+    return response.get_json()['invoice']['id']
+
+def _buckets(report):
+    return {name: report[name] for name in ('days_0_30', 'days_31_60', 'days_61_90', 'days_90_plus', 'total')}
+
+def test_bucket_edges(client, shop_id, product_id, customer_id):
+    # Amounts are powers of two so every bucket sum says which invoices it holds
+    for amount, days in [(1, -5), (2, 0), (4, 30), (8, 31), (16, 60), (32, 61), (64, 90), (128, 91)]:
+        _invoice(client, customer_id, amount, days_overdue=days, invoice_days_ago=max(days, 0))
+    
+    report = ReceivablesAging.compute(shop_id, as_of=AS_OF)
+    assert report['as_of'] == '2024-06-30'
+    assert _buckets(report['shop']) == {
+        'days_0_30': 7, 'days_31_60': 24, 'days_61_90': 96, 'days_90_plus': 128, 'total': 255
+    }
+    assert report['shop']['invoice_count'] == 8
+    
+    # A day later every edge invoice moves up a bucket
+    report = ReceivablesAging.compute(shop_id, as_of=AS_OF + timedelta(days=1))
+    assert _buckets(report['shop']) == {
+        'days_0_30': 3, 'days_31_60': 12, 'days_61_90': 48, 'days_90_plus': 192, 'total': 255
+    }
+
+def test_invoice_date_is_used_without_a_due_date(client, shop_id, product_id, customer_id):
+    _invoice(client, customer_id, 10, invoice_days_ago=31)
+    _invoice(client, None, 5, invoice_days_ago=91)
+    report = ReceivablesAging.compute(shop_id, as_of=AS_OF)
+    assert _buckets(report['shop']) == {
+        'days_0_30': 0, 'days_31_60': 10, 'days_61_90': 0, 'days_90_plus': 5, 'total': 15
+    }
+    assert [(customer['customer_id'], customer['total']) for customer in report['customers']] == [
+        (customer_id, 10), (None, 5)
+    ]
+
+def test_paid_invoices_and_returns_are_left_out(client, shop_id, product_id, customer_id):
+    invoice_id = _invoice(client, customer_id, 50, days_overdue=10)
+    _invoice(client, customer_id, 30, days_overdue=10, initial_payment=30)
+    response = client.post(f'/api/shop/invoices/{invoice_id}/returns', json={
+        'return_data': {'return_date': AS_OF.isoformat()},
+        'items': [{'product_id': product_id, 'quantity': 1, 'unit_price': 20}]
+    })
+    assert response.status_code == 201
+    
+    # The return's negative balance does not reduce the receivable, matching
+    # the customer's outstanding balance
+    report = ReceivablesAging.compute(shop_id, customer_id=customer_id, as_of=AS_OF)
+    assert _buckets(report['shop']) == {
+        'days_0_30': 50, 'days_31_60': 0, 'days_61_90': 0, 'days_90_plus': 0, 'total': 50
+    }
+    assert report['shop']['invoice_count'] == 1
+    assert Customer.get_by_id(customer_id).get_outstanding_balance() == 50
+
+def test_as_of_is_todays_local_date(client, shop_id, product_id, customer_id):
+    today = date.today()
+    _invoice(client, customer_id, 10, days_overdue=(AS_OF - today).days + 30)
+    report = client.get('/api/shop/reports/aging').get_json()['aging']
+    assert report['as_of'] == today.isoformat()
+    # Exactly 30 days overdue by the local date, whatever the UTC date is
+    assert report['shop']['days_0_30'] == 10
+
+def test_snapshot_stores_todays_report(client, shop_id, product_id, customer_id):
+    _invoice(client, customer_id, 10, days_overdue=(AS_OF - date.today()).days + 45)
+    assert ReceivablesAging.take_snapshot(shop_id) == 1
+    assert ReceivablesAging.take_snapshot(shop_id) == 1
+    snapshot = client.get('/api/shop/reports/aging', query_string={'snapshot': 'latest'}).get_json()['aging']
+    assert snapshot == ReceivablesAging.compute(shop_id)
+    assert snapshot['shop']['days_31_60'] == 10
@@ -0,0 +1,132 @@
+import os
+
+import pytest
+
+from src.database_sqlite import DATABASE_BACKEND, DATABASE_PATH, get_db_connection, run_write_transaction
+from src.models.archive import InvoiceArchive, archive_all_shops
+
+# Everything paid qualifies against a cutoff in the future
+CUTOFF = '2100-01-01'
+
+def _create_invoice(client, product_id, customer_id, paid=True):
+    return client.post('/api/shop/invoices', json={
+        'invoice_date': '2020-01-01', 'customer_id': customer_id,
+        'items': [{'product_id': product_id, 'quantity': 2, 'unit_price': 10}],
+        'initial_payment': 20 if paid else 0
+    }).get_json()['invoice']
+
+def _create_return(client, invoice_id, product_id):
+    response = client.post(f'/api/shop/invoices/{invoice_id}/returns', json={
+        'return_data': {'return_date': '2020-01-05'},
+        'items': [{'product_id': product_id, 'quantity': 1, 'unit_price': 10}]
+    })
+    assert response.status_code == 201
+    return response.get_json()['return_invoice']
+
+def _pay_off(client, invoice_id):
+    invoice = client.get(f'/api/shop/invoices/{invoice_id}').get_json()['invoice']
+    response = client.post(f'/api/shop/invoices/{invoice_id}/payments',
+                           json={'amount': invoice['balance_amount'], 'payment_method': 'cash'})
+    assert response.status_code == 200
+    assert client.get(f'/api/shop/invoices/{invoice_id}').get_json()['invoice']['status'] == 'paid'
+
+def _count(table, key, invoice_id):
+    with get_db_connection() as conn:
+        return conn.execute(f'SELECT COUNT(*) FROM {table} WHERE {key} = ?', (invoice_id,)).fetchone()[0]
+
+def _listed_ids(client):
+    return [invoice['id'] for invoice in client.get('/api/shop/invoices').get_json()['invoices']]
+
+def test_archived_invoice_stays_readable(client, shop_id, product_id, customer_id):
+    paid = _create_invoice(client, product_id, customer_id)
+    pending = _create_invoice(client, product_id, customer_id, paid=False)
+
+    assert InvoiceArchive.archive_shop(shop_id, before=CUTOFF) == 1
+    assert _count('invoices', 'id', paid['id']) == 0
+    assert _count('archive.invoices', 'id', paid['id']) == 1
+    assert _count('archive.invoice_items', 'invoice_id', paid['id']) == 1
+
+    # Gone from the listing and its count...
+    body = client.get('/api/shop/invoices', query_string={'count': 'exact'}).get_json()
+    assert [invoice['id'] for invoice in body['invoices']] == [pending['id']]
+    assert body['pagination']['total'] == 1
+
+    # ...but still readable by id, in the detail view and the customer history
+    response = client.get(f"/api/shop/invoices/{paid['id']}")
+    assert response.status_code == 200
+    assert response.get_json()['invoice']['invoice_number'] == paid['invoice_number']
+
+    detail = client.get(f"/api/shop/invoices/{paid['id']}/detail").get_json()['invoice']
+    assert len(detail['items']) == 1
+    assert [payment['amount'] for payment in detail['payments']] == [20]
+
+    history = client.get(f'/api/shop/customers/{customer_id}/invoices').get_json()['invoices']
+    assert sorted(invoice['id'] for invoice in history) == sorted([paid['id'], pending['id']])
+
+    assert InvoiceArchive.archive_shop(shop_id, before=CUTOFF) == 0
+
+def test_returns_move_with_their_original(client, shop_id, product_id, customer_id):
+    paid = _create_invoice(client, product_id, customer_id, paid=False)
+    return_invoice = _create_return(client, paid['id'], product_id)
+    _pay_off(client, paid['id'])
+
+    assert InvoiceArchive.archive_shop(shop_id, before=CUTOFF) == 1
+    assert _listed_ids(client) == []
+    assert _count('archive.invoices', 'id', return_invoice['id']) == 1
+
+    detail = client.get(f"/api/shop/invoices/{paid['id']}/detail").get_json()['invoice']
+    assert [invoice['id'] for invoice in detail['returns']] == [return_invoice['id']]
+
+def test_archive_resumes_after_a_crash_between_copy_and_delete(client, shop_id, product_id, customer_id):
+    paid = _create_invoice(client, product_id, customer_id)
+
+    # The copy committed, the delete never ran: the invoice is in both places
+    run_write_transaction(lambda conn: InvoiceArchive._copy_batch(conn.cursor(), shop_id, CUTOFF, 10),
+                          shop_id=shop_id)
+    assert _count('invoices', 'id', paid['id']) == 1
+    assert _count('archive.invoices', 'id', paid['id']) == 1
+    assert client.get(f"/api/shop/invoices/{paid['id']}").status_code == 200
+
+    # The next run replaces the copy instead of duplicating it
+    assert InvoiceArchive.archive_shop(shop_id, before=CUTOFF) == 1
+    assert _count('invoices', 'id', paid['id']) == 0
+    assert _count('archive.invoices', 'id', paid['id']) == 1
+    assert _count('archive.invoice_items', 'invoice_id', paid['id']) == 1
+    assert _count('archive.invoice_payments', 'invoice_id', paid['id']) == 1
+
+def test_invoice_changed_after_its_copy_stays_hot(client, shop_id, product_id, customer_id):
+    paid = _create_invoice(client, product_id, customer_id, paid=False)
+    _create_return(client, paid['id'], product_id)
+    _pay_off(client, paid['id'])
+    originals, invoice_ids = run_write_transaction(
+        lambda conn: InvoiceArchive._copy_batch(conn.cursor(), shop_id, CUTOFF, 10), shop_id=shop_id
+    )
+
+    # A return added between the two transactions was not copied
+    with get_db_connection() as conn:
+        return_id = conn.execute('''
+            INSERT INTO invoices (shop_id, invoice_number, invoice_date, subtotal, total_amount,
+                                  balance_amount, status, original_invoice_id)
+            VALUES (?, ?, '2020-01-06', -10, -10, 0, 'paid', ?)
+        ''', (shop_id, f"LATE-RET-{paid['id']}", paid['id'])).lastrowid
+        conn.commit()
+
+    assert run_write_transaction(
+        lambda conn: InvoiceArchive._delete_batch(conn.cursor(), shop_id, CUTOFF, originals, invoice_ids),
+        shop_id=shop_id
+    ) == 0
+    assert _count('invoices', 'id', paid['id']) == 1
+    assert _count('invoices', 'id', return_id) == 1
+
+    # The next run copies it along
+    assert InvoiceArchive.archive_shop(shop_id, before=CUTOFF) == 1
+    assert _count('invoices', 'id', return_id) == 0
+    assert _count('archive.invoices', 'id', return_id) == 1
+
+@pytest.mark.skipif(DATABASE_BACKEND != 'sqlite', reason='PostgreSQL has no WAL file to truncate')
+def test_nightly_run_truncates_the_wal(client, product_id, customer_id):
+    invoice = _create_invoice(client, product_id, customer_id)
+    assert os.path.getsize(DATABASE_PATH + '-wal') > 0
+    archive_all_shops(before=CUTOFF)
+    assert _count('archive.invoices', 'id', invoice['id']) == 1
+    assert os.path.getsize(DATABASE_PATH + '-wal') == 0
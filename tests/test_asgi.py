@@ -0,0 +1,66 @@
+import asyncio
+import threading
+import time
+
+from src.asgi import ThreadPoolWsgiToAsgi, asgi_app
+
+def _slow_wsgi_app(environ, start_response):
+    time.sleep(0.5)
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [threading.current_thread().name.encode()]
+
+def _echo_wsgi_app(environ, start_response):
+    start_response('201 Created', [('Content-Type', 'text/plain')])
+    yield f"{environ['REQUEST_METHOD']} {environ['QUERY_STRING']} {environ['CONTENT_TYPE']} ".encode()
+    yield environ['HTTP_X_TAG'].encode() + b' '
+    yield environ['wsgi.input'].read()
+
+async def _get(app, path='/', chunks=(b'',), headers=(), method='GET', query_string=b''):
+    messages = []
+    chunks = list(chunks)
+
+    async def receive():
+        body = chunks.pop(0)
+        return {'type': 'http.request', 'body': body, 'more_body': bool(chunks)}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'root_path': '',
+        'query_string': query_string, 'http_version': '1.1', 'headers': list(headers),
+    }
+    await app(scope, receive, send)
+    return messages[0]['status'], b''.join(m.get('body', b'') for m in messages[1:])
+
+def test_concurrent_requests_overlap():
+    app = ThreadPoolWsgiToAsgi(_slow_wsgi_app)
+
+    async def run():
+        return await asyncio.gather(*(_get(app) for _ in range(4)))
+
+    started = time.monotonic()
+    responses = asyncio.run(run())
+    elapsed = time.monotonic() - started
+
+    assert [status for status, _ in responses] == [200] * 4
+    # Serialized requests would take 4 x 0.5 s
+    assert elapsed < 1.5
+    assert len({body for _, body in responses}) == 4
+
+def test_request_and_response_are_passed_through():
+    app = ThreadPoolWsgiToAsgi(_echo_wsgi_app)
+    # A body over the in-memory limit arrives in several messages
+    chunks = [b'a' * 50000, b'b' * 50000, b'c']
+    status, body = asyncio.run(_get(
+        app, '/upload', chunks=chunks, method='POST', query_string=b'x=1&y=2',
+        headers=[(b'content-type', b'application/octet-stream'), (b'x-tag', b'one'), (b'x-tag', b'two')]
+    ))
+    assert status == 201
+    assert body == b'POST x=1&y=2 application/octet-stream one,two ' + b''.join(chunks)
+
+def test_asgi_app_serves_flask():
+    assert isinstance(asgi_app, ThreadPoolWsgiToAsgi)
+    status, body = asyncio.run(_get(asgi_app, '/api/health'))
+    assert status == 200
+    assert b'healthy' in body
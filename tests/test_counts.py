@@ -0,0 +1,78 @@
+from src.models.counter import CountCache
+
+def _totals(client, path, **args):
+    """The list total in each count mode"""
+    return [client.get(path, query_string={'count': mode, **args}).get_json()['pagination']['total']
+            for mode in ('estimate', 'exact', 'none')]
+
+def _create_invoice(client, product_id):
+    return client.post('/api/shop/invoices', json={
+        'invoice_date': '2024-01-01',
+        'items': [{'product_id': product_id, 'quantity': 1, 'unit_price': 10}]
+    }).get_json()['invoice']
+
+def test_customer_totals_follow_create_and_delete(client):
+    ids = [client.post('/api/shop/customers', json={'name': f'Customer {n}'}).get_json()['customer']['id']
+           for n in range(3)]
+    assert _totals(client, '/api/shop/customers') == [3, 3, None]
+
+    assert client.delete(f'/api/shop/customers/{ids[0]}').status_code == 200
+    assert _totals(client, '/api/shop/customers') == [2, 2, None]
+
+def test_product_totals_count_active_products(client, product_id):
+    assert _totals(client, '/api/shop/products') == [1, 1, None]
+
+    client.put(f'/api/shop/products/{product_id}', json={'is_active': False})
+    assert _totals(client, '/api/shop/products') == [0, 0, None]
+
+    # Deactivating twice must not count twice
+    client.put(f'/api/shop/products/{product_id}', json={'is_active': False})
+    assert _totals(client, '/api/shop/products') == [0, 0, None]
+
+    client.put(f'/api/shop/products/{product_id}', json={'is_active': True})
+    assert _totals(client, '/api/shop/products') == [1, 1, None]
+
+def test_invoice_totals_follow_create_and_delete(client, product_id):
+    invoices = [_create_invoice(client, product_id) for _ in range(2)]
+    assert _totals(client, '/api/shop/invoices') == [2, 2, None]
+
+    assert client.delete(f"/api/shop/invoices/{invoices[0]['id']}").status_code == 200
+    assert _totals(client, '/api/shop/invoices') == [1, 1, None]
+
+def test_failed_invoice_leaves_the_counter_alone(client, product_id):
+    _create_invoice(client, product_id)
+    response = client.post('/api/shop/invoices', json={
+        'invoice_date': '2024-01-01',
+        'items': [{'product_id': product_id, 'quantity': 1, 'unit_price': 10},
+                  {'product_id': 999999, 'quantity': 1, 'unit_price': 10}]
+    })
+    assert response.status_code >= 400
+    assert _totals(client, '/api/shop/invoices') == [1, 1, None]
+
+def test_filtered_estimate_is_cached_and_exact_is_not(client):
+    client.post('/api/shop/customers', json={'name': 'Cached Alice'})
+    assert _totals(client, '/api/shop/customers', search='Cached') == [1, 1, None]
+
+    client.post('/api/shop/customers', json={'name': 'Cached Bob'})
+    estimate = client.get('/api/shop/customers', query_string={'search': 'Cached'})
+    assert estimate.get_json()['pagination']['total'] == 1
+    exact = client.get('/api/shop/customers', query_string={'count': 'exact', 'search': 'Cached'})
+    assert exact.get_json()['pagination']['total'] == 2
+
+def test_invalid_count_mode_is_rejected(client):
+    assert client.get('/api/shop/customers', query_string={'count': 'all'}).status_code == 400
+
+def test_count_cache_expires_and_evicts(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('src.models.counter.time.monotonic', lambda: now[0])
+    cache = CountCache(ttl=30, size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+
+    cache.set('c', 3)
+    assert cache.get('a') is None
+    assert (cache.get('b'), cache.get('c')) == (2, 3)
+
+    now[0] += 31
+    assert cache.get('b') is None
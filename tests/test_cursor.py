@@ -0,0 +1,29 @@
+import base64
+import json
+
+import pytest
+
+def _cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+@pytest.mark.parametrize('path', ['/api/shop/customers', '/api/shop/products', '/api/shop/invoices'])
+@pytest.mark.parametrize('cursor', [
+    'W3t9LDFd', 'not base64!', _cursor({'a': 1}), _cursor(['a']), _cursor(['a', 'b']),
+    _cursor([{}, 1]), _cursor([[], 1]), _cursor([None, 1]), _cursor(['a', True]), _cursor(['a', 1.5]),
+])
+def test_invalid_cursor_is_rejected(client, path, cursor):
+    response = client.get(path, query_string={'cursor': cursor})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid cursor'}
+
+def test_cursor_pages_through_customers(client):
+    for n in range(5):
+        client.post('/api/shop/customers', json={'name': f'Customer {n}'})
+    names, cursor = [], ''
+    while cursor is not None:
+        response = client.get('/api/shop/customers', query_string={'cursor': cursor, 'limit': 2})
+        assert response.status_code == 200
+        body = response.get_json()
+        names += [customer['name'] for customer in body['customers']]
+        cursor = body['pagination']['next_cursor']
+    assert names == [f'Customer {n}' for n in range(5)]
@@ -0,0 +1,24 @@
+from src.main import app
+from src.models.customer import Customer
+
+def _detail(client, invoice_id, etag=None):
+    headers = {'If-None-Match': etag} if etag else {}
+    return client.get(f'/api/shop/invoices/{invoice_id}/detail', headers=headers)
+
+def test_detail_etag_changes_with_customer_edit(client, product_id):
+    customer = client.post('/api/shop/customers', json={'name': 'Alice'}).get_json()['customer']
+    invoice = client.post('/api/shop/invoices', json={
+        'invoice_date': '2024-01-01', 'customer_id': customer['id'],
+        'items': [{'product_id': product_id, 'quantity': 1, 'unit_price': 10}]
+    }).get_json()['invoice']
+
+    etag = _detail(client, invoice['id']).headers['ETag']
+    assert _detail(client, invoice['id'], etag).status_code == 304
+
+    # Within the same second as the first read: updated_at alone would not change
+    with app.app_context():
+        Customer.get_by_id(customer['id']).update(name='Bob')
+    response = _detail(client, invoice['id'], etag)
+    assert response.status_code == 200
+    assert response.get_json()['invoice']['customer']['name'] == 'Bob'
+    assert response.headers['ETag'] != etag
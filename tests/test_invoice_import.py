@@ -0,0 +1,28 @@
+import json
+
+def _record(product_id, **fields):
+    return {'invoice_date': '2024-01-01',
+            'items': [{'product_id': product_id, 'quantity': 1, 'unit_price': 10}], **fields}
+
+def test_bad_customer_id_fails_only_its_row(client, product_id):
+    response = client.post('/api/shop/invoices/import', json=[
+        _record(product_id),
+        _record(product_id, customer_id='abc'),
+        _record(product_id, customer_id=999999),
+        _record(product_id, customer_id='walk-in'),
+    ])
+    report = response.get_json()
+    assert response.status_code == 200
+    assert report['imported'] == 2
+    assert [(error['row'], error['error']) for error in report['errors']] == [
+        (1, 'Invalid customer ID'),
+        (2, 'Customer with ID 999999 not found'),
+    ]
+
+def test_ndjson_parse_error_reports_line(client, product_id):
+    body = '\n'.join([json.dumps(_record(product_id)), '', '{"invoice_date": ', json.dumps(_record(product_id))])
+    response = client.post('/api/shop/invoices/import', data=body, content_type='application/x-ndjson')
+    report = response.get_json()
+    assert report['imported'] == 2
+    assert len(report['errors']) == 1
+    assert report['errors'][0]['error'].startswith('Invalid JSON on line 3:')
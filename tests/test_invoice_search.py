@@ -0,0 +1,101 @@
+import pytest
+
+from src.database_sqlite import fts_trigram_supported, get_db_connection
+from src.models.customer import Customer
+from src.models.invoice import Invoice
+
+pytestmark = pytest.mark.skipif(not fts_trigram_supported(),
+                                reason='SQLite build has no FTS5 trigram tokenizer')
+
+@pytest.fixture
+def invoices(client, shop_id, product_id):
+    """Invoice numbers by id: two for Alice, one for Bob Smith and one walk-in"""
+    alice = client.post('/api/shop/customers', json={'name': 'Alice Jones', 'phone': '9876543210'})
+    bob = client.post('/api/shop/customers', json={'name': 'Bob Smith', 'phone': '9123456780'})
+    customers = [alice.get_json()['customer']['id'], alice.get_json()['customer']['id'],
+                 bob.get_json()['customer']['id'], None]
+    notes = ['Delivered to back door', None, 'ALICE asked for a receipt', None]
+    numbers = {}
+    for n, (customer_id, note) in enumerate(zip(customers, notes), start=1):
+        invoice = client.post('/api/shop/invoices', json={
+            'invoice_date': '2024-01-01', 'invoice_number': f'S{shop_id}-INV-{n:04d}',
+            'customer_id': customer_id, 'notes': note,
+            'items': [{'product_id': product_id, 'quantity': 1, 'unit_price': 10}]
+        }).get_json()['invoice']
+        numbers[invoice['id']] = invoice['invoice_number']
+    return numbers
+
+def _search(client, term, monkeypatch, fts):
+    """(ids listed, exact total) for a search with the FTS index on or off"""
+    monkeypatch.setattr('src.models.invoice.DB_FTS_SEARCH', fts)
+    body = client.get('/api/shop/invoices', query_string={'search': term, 'count': 'exact'}).get_json()
+    return sorted(invoice['id'] for invoice in body['invoices']), body['pagination']['total']
+
+def _assert_same_as_like(client, term, monkeypatch):
+    """Search results through the index, checked against the LIKE search"""
+    results = _search(client, term, monkeypatch, fts=True)
+    assert results == _search(client, term, monkeypatch, fts=False)
+    return results[0]
+
+@pytest.mark.parametrize('term', ['INV-000', 'NV-0003', 'ali', 'ALICE', 'Smi', 'h Jo', '5678',
+                                  'back door', 'receipt', 'nobody'])
+def test_index_matches_like_search(client, invoices, monkeypatch, term):
+    _assert_same_as_like(client, term, monkeypatch)
+
+def test_partial_number_and_customer_matches(client, invoices, monkeypatch):
+    by_number = {number[-4:]: invoice_id for invoice_id, number in invoices.items()}
+    assert _assert_same_as_like(client, '-0002', monkeypatch) == [by_number['0002']]
+    # Alice's two invoices by name, and Bob's which mentions her in its notes
+    assert _assert_same_as_like(client, 'lic', monkeypatch) == sorted(
+        by_number[n] for n in ('0001', '0002', '0003'))
+    assert _assert_same_as_like(client, '876543', monkeypatch) == sorted(
+        by_number[n] for n in ('0001', '0002'))
+
+def test_search_does_not_cross_shops(client, other_client, invoices, monkeypatch):
+    other_client.post('/api/shop/customers', json={'name': 'Alice Other'})
+    for fts in (True, False):
+        assert _search(other_client, 'Alice', monkeypatch, fts) == ([], 0)
+
+def test_short_terms_fall_back_to_like(client, shop_id, invoices, monkeypatch):
+    assert Invoice.search_filters(shop_id, search='Al')['fts'] is None
+    assert Invoice.search_filters(shop_id, search='Al')['search'] == ['%Al%'] * 4
+    assert Invoice.search_filters(shop_id, search='Ali')['fts'] is not None
+    # Too short for a trigram, but LIKE still finds them
+    ids, total = _search(client, 'Sm', monkeypatch, fts=True)
+    assert total == 1 and len(ids) == 1
+    ids, total = _search(client, 'ce', monkeypatch, fts=True)
+    assert total == 3
+
+def test_index_follows_invoice_and_customer_updates(client, shop_id, invoices, monkeypatch):
+    first = min(invoices)
+    with get_db_connection() as conn:
+        conn.execute('UPDATE invoices SET notes = ?, invoice_number = ? WHERE id = ?',
+                     ('Left with the neighbour', f'S{shop_id}-REN-0001', first))
+        conn.commit()
+    assert _assert_same_as_like(client, 'neighbour', monkeypatch) == [first]
+    assert _assert_same_as_like(client, 'REN-0', monkeypatch) == [first]
+    assert _assert_same_as_like(client, 'back door', monkeypatch) == []
+
+    customer = Customer.get_by_id(client.get('/api/shop/customers', query_string={'search': 'Alice'})
+                                  .get_json()['customers'][0]['id'])
+    customer.update(name='Alicia Brown', phone='9000000001')
+    assert _assert_same_as_like(client, 'Brown', monkeypatch) == sorted(
+        invoice_id for invoice_id, number in invoices.items() if number[-4:] in ('0001', '0002'))
+    assert _assert_same_as_like(client, 'Jones', monkeypatch) == []
+    assert _assert_same_as_like(client, '0000001', monkeypatch) != []
+
+def test_index_follows_deletes(client, invoices, monkeypatch):
+    walk_in = max(invoices)
+    assert client.delete(f'/api/shop/invoices/{walk_in}').status_code == 200
+    assert _assert_same_as_like(client, 'INV-0004', monkeypatch) == []
+    assert len(_assert_same_as_like(client, 'INV-', monkeypatch)) == 3
+
+    bob = client.get('/api/shop/customers', query_string={'search': 'Bob'}).get_json()['customers'][0]['id']
+    bob_invoice = _search(client, 'Bob', monkeypatch, fts=True)[0]
+    with get_db_connection() as conn:
+        conn.execute('UPDATE invoices SET customer_id = NULL WHERE customer_id = ?', (bob,))
+        conn.commit()
+    Customer.get_by_id(bob).delete()
+    assert _assert_same_as_like(client, 'Bob', monkeypatch) == []
+    # The invoice itself is still searchable by its notes
+    assert _assert_same_as_like(client, 'receipt', monkeypatch) == bob_invoice
@@ -0,0 +1,15 @@
+import pytest
+
+@pytest.mark.parametrize('payment', [
+    {'amount': -5},
+    {'amount': 'ten'},
+    {'amount': 'nan'},
+    {'policy': 'explicit', 'allocations': {'invoice_id': 1, 'amount': 5}},
+    {'policy': 'explicit', 'allocations': [{'amount': 5}]},
+    {'policy': 'explicit', 'allocations': [{'invoice_id': 1, 'amount': 0}]},
+    {'policy': 'explicit', 'allocations': ['x']},
+])
+def test_invalid_payment_is_rejected(client, customer_id, payment):
+    response = client.post(f'/api/shop/customers/{customer_id}/payments',
+                           json={'payment_method': 'cash', **payment})
+    assert response.status_code == 400, response.get_json()
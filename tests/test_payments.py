@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+from src.database_sqlite import get_db_connection
+from src.models.invoice import Invoice, PaymentConflictError
+
+@pytest.fixture
+def invoice_id(client, product_id, customer_id):
+    """An unpaid invoice of 20"""
+    return client.post('/api/shop/invoices', json={
+        'invoice_date': '2024-01-01', 'customer_id': customer_id,
+        'items': [{'product_id': product_id, 'quantity': 2, 'unit_price': 10}]
+    }).get_json()['invoice']['id']
+
+def _state(invoice_id):
+    """(paid, balance, status, payment count) as stored"""
+    with get_db_connection() as conn:
+        paid, balance, status = conn.execute(
+            'SELECT paid_amount, balance_amount, status FROM invoices WHERE id = ?', (invoice_id,)
+        ).fetchone()
+        payments = conn.execute('SELECT COUNT(*) FROM invoice_payments WHERE invoice_id = ?',
+                                (invoice_id,)).fetchone()[0]
+    return paid, balance, status, payments
+
+def test_overpaying_an_invoice_conflicts(client, invoice_id):
+    response = client.post(f'/api/shop/invoices/{invoice_id}/payments',
+                           json={'amount': 25, 'payment_method': 'cash'})
+    assert response.status_code == 409
+    assert _state(invoice_id) == (0, 20, 'pending', 0)
+
+    response = client.post(f'/api/shop/invoices/{invoice_id}/payments',
+                           json={'amount': 20, 'payment_method': 'cash'})
+    assert response.status_code == 200
+    assert _state(invoice_id) == (20, 0, 'paid', 1)
+
+def test_payment_checks_the_stored_balance_not_a_stale_copy(invoice_id):
+    first, second = Invoice.get_by_id(invoice_id), Invoice.get_by_id(invoice_id)
+    first.add_payment(15, 'cash')
+    with pytest.raises(PaymentConflictError):
+        second.add_payment(15, 'cash')
+    assert _state(invoice_id) == (15, 5, 'partial', 1)
+
+@pytest.mark.parametrize('method', ['add_payment', 'allocate_payment'])
+def test_concurrent_payments_cannot_overpay(shop_id, customer_id, invoice_id, method):
+    invoices = [Invoice.get_by_id(invoice_id) for _ in range(4)]
+    barrier = threading.Barrier(len(invoices))
+    outcomes = []
+
+    def pay(invoice):
+        barrier.wait()
+        try:
+            if method == 'add_payment':
+                invoice.add_payment(15, 'cash')
+            else:
+                Invoice.allocate_payment(shop_id, customer_id, 15, 'cash')
+            outcomes.append('paid')
+        except PaymentConflictError:
+            outcomes.append('conflict')
+
+    threads = [threading.Thread(target=pay, args=(invoice,)) for invoice in invoices]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(outcomes) == ['conflict', 'conflict', 'conflict', 'paid']
+    assert _state(invoice_id) == (15, 5, 'partial', 1)
+
+def test_second_allocation_against_the_same_balance_conflicts(client, customer_id, invoice_id):
+    url = f'/api/shop/customers/{customer_id}/payments'
+    payment = {'payment_method': 'cash', 'policy': 'explicit',
+               'allocations': [{'invoice_id': invoice_id, 'amount': 15}]}
+
+    assert client.post(url, json=payment).status_code == 201
+    assert client.post(url, json=payment).status_code == 409
+    assert _state(invoice_id) == (15, 5, 'partial', 1)
+
+    # More than the customer owes in total
+    response = client.post(url, json={'payment_method': 'cash', 'amount': 6})
+    assert response.status_code == 409
+    assert _state(invoice_id) == (15, 5, 'partial', 1)
@@ -0,0 +1,22 @@
+import pytest
+
+def _active_ids(client):
+    products = client.get('/api/shop/products').get_json()['products']
+    return [product['id'] for product in products]
+
+def _counted_products(client):
+    return client.get('/api/shop/products').get_json()['pagination']['total']
+
+@pytest.mark.parametrize('value', [False, 'false', 'False', '0', 0, 'no'])
+def test_string_false_deactivates(client, product_id, value):
+    response = client.put(f'/api/shop/products/{product_id}', json={'is_active': value})
+    assert response.status_code == 200
+    assert product_id not in _active_ids(client)
+    assert _counted_products(client) == 0
+
+@pytest.mark.parametrize('value', ['maybe', 2, None, [], {}])
+def test_non_boolean_is_rejected(client, product_id, value):
+    response = client.put(f'/api/shop/products/{product_id}', json={'is_active': value})
+    assert response.status_code == 400
+    assert product_id in _active_ids(client)
+    assert _counted_products(client) == 1
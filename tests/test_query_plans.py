@@ -0,0 +1,136 @@
+import re
+
+import pytest
+
+from src.database_sqlite import DATABASE_BACKEND, INDEXES, PooledConnection, get_pool, init_db
+from src.database_statements import statements
+from src.models.aging import _AGING_QUERY
+
+pytestmark = pytest.mark.skipif(DATABASE_BACKEND != 'sqlite', reason='EXPLAIN QUERY PLAN is SQLite syntax')
+
+# (name, sql, params, index the plan must use). Registered statements are
+# bound through the registry so the tested text is the one that runs; the
+# rest mirror the SQL of the model methods named in the comments.
+HOT_QUERIES = [
+    # Product.get_by_shop_id / count, with the active-only listing
+    ('products.by_shop', *statements.bind('products.by_shop', [1], {'active': []}, (20, 0)),
+     'idx_products_shop_active_name'),
+    ('products.by_shop after', *statements.bind('products.by_shop', [1], {'active': [], 'after': ['a', 1]}, (20, 0)),
+     'idx_products_shop_active_name'),
+    ('products.count_by_shop', *statements.bind('products.count_by_shop', [1], {'active': []}),
+     'idx_products_shop_active_name'),
+    # Product.search_by_barcode
+    ('products by barcode',
+     'SELECT * FROM products WHERE shop_id = ? AND barcode = ? AND is_active = TRUE', [1, '123'],
+     'idx_products_shop_barcode'),
+    # Customer.get_by_shop_id / count
+    ('customers.by_shop', *statements.bind('customers.by_shop', [1], page=(20, 0)),
+     'idx_customers_shop_name'),
+    ('customers.by_shop after', *statements.bind('customers.by_shop', [1], {'after': ['a', 1]}, (20, 0)),
+     'idx_customers_shop_name'),
+    ('customers.count_by_shop', *statements.bind('customers.count_by_shop', [1]),
+     'idx_customers_shop_name'),
+    # Invoice.get_by_shop_id / count
+    ('invoices.by_shop', *statements.bind('invoices.by_shop', [1], page=(20, 0)),
+     'idx_invoices_shop_created'),
+    ('invoices.by_shop after', *statements.bind('invoices.by_shop', [1], {'after': ['2024-01-01', 1]}, (20, 0)),
+     'idx_invoices_shop_created'),
+    ('invoices.by_shop status', *statements.bind('invoices.by_shop', [1], {'status': ['pending']}, (20, 0)),
+     'idx_invoices_shop_'),
+    # Invoice.get_by_customer_id, Customer.get_invoices
+    ('invoices by customer',
+     'SELECT * FROM invoices WHERE customer_id = ? AND shop_id = ? ORDER BY created_at DESC', [1, 1],
+     'idx_invoices_customer_date'),
+    # Invoice.get_return_invoices
+    ('return invoices',
+     'SELECT * FROM invoices WHERE original_invoice_id = ? ORDER BY created_at DESC', [1],
+     'idx_invoices_original'),
+    # Invoice.get_items
+    ('invoice items', 'SELECT * FROM invoice_items WHERE invoice_id = ? ORDER BY id', [1],
+     'idx_invoice_items_invoice'),
+    # Invoice.get_payments, InvoicePayment.get_by_invoice_id
+    ('invoice payments',
+     'SELECT * FROM invoice_payments WHERE invoice_id = ? ORDER BY payment_date DESC', [1],
+     'idx_invoice_payments_invoice_date'),
+    # ReceivablesAging.compute
+    ('receivables aging', _AGING_QUERY.format(customer_filter=''), ['2024-01-01', 1],
+     'idx_invoices_shop_status_due'),
+    # Shop.get_dashboard_stats
+    ('dashboard customers', 'SELECT COUNT(*) FROM customers WHERE shop_id = ?', [1],
+     'idx_customers_shop_name'),
+    ('dashboard products', 'SELECT COUNT(*) FROM products WHERE shop_id = ?', [1],
+     'idx_products_shop_'),
+    ('dashboard invoices', 'SELECT COUNT(*) FROM invoices WHERE shop_id = ?', [1],
+     'idx_invoices_shop_'),
+    ('dashboard today',
+     "SELECT COALESCE(SUM(total_amount), 0) FROM invoices WHERE shop_id = ? "
+     "AND created_at >= DATE('now') AND created_at < DATE('now', '+1 days')", [1],
+     'idx_invoices_shop_created'),
+    ('dashboard low stock',
+     'SELECT COUNT(*) FROM products WHERE shop_id = ? AND stock_quantity <= min_stock_level AND is_active = TRUE',
+     [1], 'idx_products_shop_active_name'),
+    # Shop.get_by_user_id
+    ('shop by user', 'SELECT * FROM shops WHERE user_id = ?', [1], 'idx_shops_user_id'),
+    # Supplier.get_by_shop_id
+    ('suppliers', 'SELECT * FROM suppliers WHERE shop_id = ? ORDER BY name ASC', [1],
+     'idx_suppliers_shop_name'),
+    # Expense.get_by_shop_id
+    ('expenses',
+     'SELECT e.* FROM expenses e LEFT JOIN suppliers s ON e.supplier_id = s.id '
+     'WHERE e.shop_id = ? ORDER BY e.date DESC', [1],
+     'idx_expenses_shop_date'),
+    # PurchaseOrder.get_by_shop_id
+    ('purchase orders',
+     'SELECT po.* FROM purchase_orders po LEFT JOIN suppliers s ON po.supplier_id = s.id '
+     'WHERE po.shop_id = ? ORDER BY po.order_date DESC', [1],
+     'idx_purchase_orders_shop_date'),
+    ('purchase order items', 'SELECT * FROM purchase_order_items WHERE purchase_order_id = ?', [1],
+     'idx_purchase_order_items_po'),
+    # PaymentVerification.get_by_shop_id / get_all_paginated
+    ('payment verifications by shop',
+     'SELECT * FROM payment_verifications WHERE shop_id = ? ORDER BY created_at DESC', [1],
+     'idx_payment_verifications_shop_created'),
+    ('payment verifications by status',
+     'SELECT * FROM payment_verifications WHERE status = ? ORDER BY created_at DESC LIMIT 10', ['pending'],
+     'idx_payment_verifications_status_created'),
+]
+
+# A plan step that reads a whole table: "SCAN products" (but not a
+# "SCAN ... USING INDEX" walk over an index, or a subquery/CTE scan)
+_FULL_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+@pytest.fixture(scope='module')
+def conn(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('plans') / 'plans.db')
+    init_db(path)
+    pool = get_pool(path)
+    conn = PooledConnection(pool, pool.acquire())
+    # Plans follow the statistics, so give the planner a realistic spread:
+    # 20 shops with 50 customers each, 20 invoices per customer and a
+    # return for every 20th invoice
+    conn.executemany('INSERT INTO customers (shop_id, name) VALUES (?, ?)',
+                     [(1 + n % 20, f'Customer {n}') for n in range(1000)])
+    conn.executemany('''
+        INSERT INTO invoices (shop_id, customer_id, invoice_number, invoice_date, subtotal,
+                              total_amount, balance_amount, status, original_invoice_id)
+        VALUES (?, ?, ?, '2024-01-01', 10, 10, 0, 'paid', ?)
+    ''', [(1 + n % 20, 1 + n % 1000, f'INV-{n}', n - 1 if n % 20 == 1 else None) for n in range(20000)])
+    conn.execute('ANALYZE')
+    conn.commit()
+    yield conn
+    conn.close()
+
+def query_plan(conn, sql, params):
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+
+def test_every_tested_index_exists():
+    names = {name for name, _ in INDEXES}
+    for _, _, _, index in HOT_QUERIES:
+        assert any(name.startswith(index) for name in names), index
+
+@pytest.mark.parametrize('name,sql,params,index', HOT_QUERIES, ids=[query[0] for query in HOT_QUERIES])
+def test_hot_query_uses_index(conn, name, sql, params, index):
+    plan = query_plan(conn, sql, params)
+    full_scans = [step for step in plan if _FULL_SCAN.match(step)]
+    assert not full_scans, f"{name} scans a whole table: {plan}"
+    assert any(f'INDEX {index}' in step for step in plan), f"{name} does not use {index}: {plan}"
@@ -0,0 +1,38 @@
+import sqlite3
+
+import src.database_sqlite as database
+from src.database_sqlite import ReadOnlyPool, get_pool, refresh_replica
+
+def _count_users(conn):
+    return conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+def _add_user(name):
+    with sqlite3.connect(database.DATABASE_PATH) as conn:
+        conn.execute("INSERT INTO users (username, email, password_hash) VALUES (?, ?, 'x')",
+                     (name, f'{name}@example.com'))
+    conn.close()
+
+def test_refresh_swaps_in_a_new_copy(tmp_path, monkeypatch):
+    get_pool()
+    monkeypatch.setattr(database, 'DATABASE_REPLICA_PATH', str(tmp_path / 'replica.db'))
+    refresh_replica()
+    pool = ReadOnlyPool(database.DATABASE_REPLICA_PATH)
+
+    reader = pool.acquire()
+    reader.execute('BEGIN')
+    before = _count_users(reader)
+    _add_user('replica1')
+    refresh_replica()
+
+    # A read in progress keeps its snapshot of the old copy
+    assert _count_users(reader) == before
+    reader.rollback()
+    pool.release(reader)
+
+    # The pooled connection is replaced by one on the new copy
+    conn = pool.acquire()
+    assert conn is not reader
+    assert _count_users(conn) == before + 1
+    pool.release(conn)
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['replica.db']
@@ -0,0 +1,87 @@
+import pytest
+
+from src.database_sqlite import _add_return_ledger, get_db_connection
+
+def _create_invoice(client, items):
+    response = client.post('/api/shop/invoices', json={'invoice_date': '2024-01-01', 'items': items})
+    assert response.status_code == 201
+    return response.get_json()['invoice']
+
+def _return(client, invoice_id, product_id, quantity):
+    return client.post(f'/api/shop/invoices/{invoice_id}/returns', json={
+        'return_data': {'return_date': '2024-01-05'},
+        'items': [{'product_id': product_id, 'quantity': quantity, 'unit_price': 10}]
+    })
+
+def _ledger(client, invoice_id):
+    summary = client.get(f'/api/shop/invoices/{invoice_id}/returns').get_json()['returns']
+    return summary['returned_amount'], [item['returned_quantity'] for item in summary['items']]
+
+@pytest.fixture
+def invoice(client, product_id):
+    """An invoice with two lines of the same product, of 2 and 3"""
+    return _create_invoice(client, [
+        {'product_id': product_id, 'quantity': 2, 'unit_price': 10},
+        {'product_id': product_id, 'quantity': 3, 'unit_price': 10},
+    ])
+
+def test_returns_fill_lines_in_order(client, product_id, invoice):
+    assert _return(client, invoice['id'], product_id, 1).status_code == 201
+    assert _ledger(client, invoice['id']) == (10, [1, 0])
+
+    assert _return(client, invoice['id'], product_id, 3).status_code == 201
+    assert _ledger(client, invoice['id']) == (40, [2, 2])
+
+    detail = client.get(f"/api/shop/invoices/{invoice['id']}").get_json()['invoice']
+    assert detail['returned_amount'] == 40
+
+def test_over_return_is_rejected(client, product_id, invoice):
+    assert _return(client, invoice['id'], product_id, 4).status_code == 201
+
+    response = _return(client, invoice['id'], product_id, 2)
+    assert response.status_code == 400
+    assert 'still returnable' in response.get_json()['error']
+    assert _ledger(client, invoice['id']) == (40, [2, 2])
+
+    assert _return(client, invoice['id'], 999999, 1).status_code == 400
+
+def test_deleting_a_return_rebuilds_the_ledger(client, product_id, invoice):
+    first = _return(client, invoice['id'], product_id, 1).get_json()['return_invoice']
+    _return(client, invoice['id'], product_id, 2)
+    assert _ledger(client, invoice['id']) == (30, [2, 1])
+
+    assert client.delete(f"/api/shop/invoices/{first['id']}").status_code == 200
+    assert _ledger(client, invoice['id']) == (20, [2, 0])
+
+def test_migration_backfills_the_ledger(client, product_id, invoice):
+    _return(client, invoice['id'], product_id, 3)
+    other = _create_invoice(client, [{'product_id': product_id, 'quantity': 1, 'unit_price': 10}])
+    expected = [_ledger(client, invoice['id']), _ledger(client, other['id'])]
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE invoice_items SET returned_quantity = 0')
+        cursor.execute('UPDATE invoices SET returned_amount = 0')
+        _add_return_ledger(cursor)
+        conn.commit()
+
+    assert [_ledger(client, invoice['id']), _ledger(client, other['id'])] == expected
+    assert expected[0] == (30, [2, 1])
+
+def _clear_ledger(invoice_id):
+    with get_db_connection() as conn:
+        conn.execute('UPDATE invoice_items SET returned_quantity = 0 WHERE invoice_id = ?', (invoice_id,))
+        conn.commit()
+
+def test_migration_keeps_excess_returns_on_the_last_line(client, product_id, invoice):
+    # Before the ledger, returns could add up to more than was sold
+    _return(client, invoice['id'], product_id, 4)
+    _clear_ledger(invoice['id'])
+    _return(client, invoice['id'], product_id, 2)
+    _clear_ledger(invoice['id'])
+
+    with get_db_connection() as conn:
+        _add_return_ledger(conn.cursor())
+        conn.commit()
+
+    assert _ledger(client, invoice['id']) == (60, [2, 4])
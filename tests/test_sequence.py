@@ -0,0 +1,12 @@
+import pytest
+
+from src.models.sequence import check_number_format
+
+@pytest.mark.parametrize('number_format', ['INV-{shop_id}-{seq}', 'PO-{date:%Y%m%d}-{shop_id:03d}-{seq:04d}'])
+def test_number_format_with_shop_id_is_accepted(number_format):
+    check_number_format('INVOICE_NUMBER_FORMAT', number_format)
+
+@pytest.mark.parametrize('number_format', ['INV-{seq:05d}', 'INV-{fy}-{seq}', 'INV-{{shop_id}}-{seq}'])
+def test_number_format_without_shop_id_is_rejected(number_format):
+    with pytest.raises(ValueError, match='must include'):
+        check_number_format('INVOICE_NUMBER_FORMAT', number_format)
@@ -0,0 +1,76 @@
+import pytest
+
+def _stock(client):
+    """Stock of every product of the client's shop, by id"""
+    products = client.get('/api/shop/products').get_json()['products']
+    return {product['id']: product['stock_quantity'] for product in products}
+
+@pytest.fixture
+def gadget_id(client):
+    """A second product of the client's shop"""
+    response = client.post('/api/shop/products', json={
+        'name': 'Gadget', 'category': 'General', 'unit': 'pc', 'price': 5, 'stock_quantity': 50
+    })
+    return response.get_json()['product']['id']
+
+@pytest.fixture
+def foreign_product_id(other_client):
+    """A product of another shop"""
+    response = other_client.post('/api/shop/products', json={
+        'name': 'Foreign', 'category': 'General', 'unit': 'pc', 'price': 10, 'stock_quantity': 100
+    })
+    return response.get_json()['product']['id']
+
+def _items(product_id, gadget_id):
+    # The same product twice, so its changes have to be summed
+    return [{'product_id': product_id, 'quantity': 3, 'unit_price': 10},
+            {'product_id': gadget_id, 'quantity': 4, 'unit_price': 5},
+            {'product_id': product_id, 'quantity': 2, 'unit_price': 10}]
+
+def test_multi_item_invoice_takes_out_stock(client, product_id, gadget_id):
+    response = client.post('/api/shop/invoices', json={
+        'invoice_date': '2024-01-01', 'items': _items(product_id, gadget_id)
+    })
+    assert response.status_code == 201
+    assert _stock(client) == {product_id: 995, gadget_id: 46}
+
+def test_import_takes_out_stock(client, product_id, gadget_id):
+    response = client.post('/api/shop/invoices/import', json=[
+        {'invoice_date': '2024-01-01', 'items': _items(product_id, gadget_id)},
+        {'invoice_date': '2024-01-02', 'items': [{'product_id': gadget_id, 'quantity': 1, 'unit_price': 5}]},
+    ])
+    assert response.get_json()['imported'] == 2
+    assert _stock(client) == {product_id: 995, gadget_id: 45}
+
+def test_import_without_stock_adjustment(client, product_id, gadget_id):
+    response = client.post('/api/shop/invoices/import?adjust_stock=false', json=[
+        {'invoice_date': '2024-01-01', 'items': _items(product_id, gadget_id)},
+    ])
+    assert response.get_json()['imported'] == 1
+    assert _stock(client) == {product_id: 1000, gadget_id: 50}
+
+def test_invoice_rejects_another_shops_product(client, other_client, product_id, foreign_product_id):
+    response = client.post('/api/shop/invoices', json={
+        'invoice_date': '2024-01-01',
+        'items': [{'product_id': product_id, 'quantity': 1, 'unit_price': 10},
+                  {'product_id': foreign_product_id, 'quantity': 1, 'unit_price': 10}]
+    })
+    # The route reports model errors as 500; what matters is that nothing is written
+    assert response.status_code >= 400
+    assert f'Product with ID {foreign_product_id} not found' in response.get_json()['error']
+    assert client.get('/api/shop/invoices').get_json()['invoices'] == []
+    assert _stock(client) == {product_id: 1000}
+    assert _stock(other_client) == {foreign_product_id: 100}
+
+def test_import_rejects_another_shops_product(client, other_client, product_id, foreign_product_id):
+    response = client.post('/api/shop/invoices/import', json=[
+        {'invoice_date': '2024-01-01', 'items': [{'product_id': product_id, 'quantity': 1, 'unit_price': 10}]},
+        {'invoice_date': '2024-01-01', 'items': [{'product_id': foreign_product_id, 'quantity': 1, 'unit_price': 10}]},
+    ])
+    report = response.get_json()
+    assert report['imported'] == 1
+    assert [(error['row'], error['error']) for error in report['errors']] == [
+        (1, f'Product with ID {foreign_product_id} not found'),
+    ]
+    assert _stock(client) == {product_id: 999}
+    assert _stock(other_client) == {foreign_product_id: 100}
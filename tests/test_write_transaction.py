@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+import src.database_sqlite as database
+from src.database_sqlite import WriteCoordinator, get_db_connection, get_pool, run_write_transaction
+from src.main import app
+
+@pytest.fixture(params=[False, True], ids=['direct', 'coordinator'])
+def coordinator_mode(request, monkeypatch):
+    """Run the test with and without the single-writer coordinator"""
+    monkeypatch.setattr(database, 'DB_WRITE_COORDINATOR', request.param)
+    return request.param
+
+def _user_exists(username):
+    with get_db_connection() as conn:
+        return conn.execute('SELECT 1 FROM users WHERE username = ?', (username,)).fetchone() is not None
+
+def _insert_user(conn, username):
+    conn.execute("INSERT INTO users (username, email, password_hash) VALUES (?, ?, 'x')",
+                 (username, f'{username}@example.com'))
+
+def test_standalone_write_does_not_take_a_second_connection(coordinator_mode):
+    with app.test_request_context('/', method='POST'):
+        conn = get_db_connection()
+        ran_on = run_write_transaction(lambda work_conn: work_conn, standalone=True)
+        if coordinator_mode:
+            # The writer thread has its own connection, outside the pool
+            assert ran_on is not conn._conn
+        else:
+            assert ran_on is conn._conn
+
+def test_standalone_write_refuses_to_commit_request_writes(coordinator_mode):
+    with app.test_request_context('/', method='POST'):
+        conn = get_db_connection()
+        _insert_user(conn, f'pending-{coordinator_mode}')
+        started = time.monotonic()
+        with pytest.raises(RuntimeError):
+            run_write_transaction(lambda work_conn: None, standalone=True)
+        # Raised up front, not after waiting out busy_timeout
+        assert time.monotonic() - started < 1
+        assert conn.in_transaction
+
+def test_group_commit_rolls_back_only_the_failing_job():
+    coordinator = WriteCoordinator(get_pool(), max_batch=8, max_wait_ms=200)
+    results = {}
+
+    def submit(name):
+        def work(conn):
+            _insert_user(conn, name)
+            if name.endswith('-3'):
+                raise ValueError(name)
+            return name
+        try:
+            results[name] = coordinator.submit(work)
+        except ValueError as e:
+            results[name] = e
+
+    names = [f'group-{n}' for n in range(6)]
+    threads = [threading.Thread(target=submit, args=(name,)) for name in names]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert isinstance(results.pop('group-3'), ValueError)
+    assert results == {name: name for name in names if name != 'group-3'}
+    assert [_user_exists(name) for name in names] == [True, True, True, False, True, True]